@@ -22,13 +22,35 @@ class Settings:
     report_chunk_size: int
     report_streaming_max_groups: int
     report_streaming_max_unique_values_per_dim: int
+    report_top_n_candidate_factor: int
+    report_streaming_spill_cells: int
+    report_streaming_queue_size: int
+    report_filters_streaming_max_values: int
+    report_details_streaming: bool
+    report_details_total_cap: int
+    report_stage_executor: str
+    report_stage_workers: int
+    report_stage_process_max_records: int
+    report_loop_block_warn_ms: int
+    report_record_index: bool
+    report_record_index_max_bytes: int
+    report_view_cache_ttl_seconds: int
+    report_view_cache_max_items: int
+    report_view_cache_max_bytes: int
+    report_view_cache_max_entry_bytes: int
+    report_view_window_max_rows: int
     report_streaming_max_records: int
+    report_count_distinct_mode: str
+    report_hll_precision: int
     report_paging_allowlist: Optional[str]
     report_paging_max_pages: int
     report_upstream_paging: bool
     report_join_lookup_max_keys: int
     report_join_max_records: int
     report_join_source_max_records: int
+    report_join_load_concurrency: int
+    report_join_cache_ttl_seconds: int
+    report_join_cache_max_bytes: int
     report_upstream_pushdown: bool
     report_pushdown_allowlist: Optional[str]
     report_pushdown_max_filters: int
@@ -110,13 +132,35 @@ def get_settings() -> Settings:
         report_streaming_max_unique_values_per_dim=_get_int_allow_zero(
             "REPORT_STREAMING_MAX_UNIQUE_VALUES_PER_DIM", 0
         ),
+        report_top_n_candidate_factor=_get_int("REPORT_TOP_N_CANDIDATE_FACTOR", 4),
+        report_streaming_spill_cells=_get_int_allow_zero("REPORT_STREAMING_SPILL_CELLS", 0),
+        report_streaming_queue_size=_get_int_allow_zero("REPORT_STREAMING_QUEUE_SIZE", 4),
+        report_filters_streaming_max_values=_get_int("REPORT_FILTERS_STREAMING_MAX_VALUES", 10000),
+        report_details_streaming=_get_bool("REPORT_DETAILS_STREAMING", False),
+        report_details_total_cap=_get_int("REPORT_DETAILS_TOTAL_CAP", 10000),
+        report_stage_executor=(os.getenv("REPORT_STAGE_EXECUTOR") or "thread").strip().lower(),
+        report_stage_workers=_get_int_allow_zero("REPORT_STAGE_WORKERS", 0),
+        report_stage_process_max_records=_get_int_allow_zero("REPORT_STAGE_PROCESS_MAX_RECORDS", 50000),
+        report_loop_block_warn_ms=_get_int_allow_zero("REPORT_LOOP_BLOCK_WARN_MS", 200),
+        report_record_index=_get_bool("REPORT_RECORD_INDEX", False),
+        report_record_index_max_bytes=_get_int_allow_zero("REPORT_RECORD_INDEX_MAX_BYTES", 64 * 1024 * 1024),
+        report_view_cache_ttl_seconds=_get_int("REPORT_VIEW_CACHE_TTL", 600),
+        report_view_cache_max_items=_get_int("REPORT_VIEW_CACHE_MAX", 20),
+        report_view_cache_max_bytes=_get_int_allow_zero("REPORT_VIEW_CACHE_MAX_BYTES", 256 * 1024 * 1024),
+        report_view_cache_max_entry_bytes=_get_int_allow_zero("REPORT_VIEW_CACHE_MAX_ENTRY_BYTES", 32 * 1024 * 1024),
+        report_view_window_max_rows=_get_int("REPORT_VIEW_WINDOW_MAX_ROWS", 5000),
         report_streaming_max_records=_get_int_allow_zero("REPORT_STREAMING_MAX_RECORDS", 0),
+        report_count_distinct_mode=(os.getenv("REPORT_COUNT_DISTINCT_MODE") or "exact").strip().lower(),
+        report_hll_precision=_get_int("REPORT_HLL_PRECISION", 14),
         report_paging_allowlist=os.getenv("REPORT_PAGING_ALLOWLIST"),
         report_paging_max_pages=_get_int("REPORT_PAGING_MAX_PAGES", 2000),
         report_upstream_paging=_get_bool("REPORT_UPSTREAM_PAGING", False),
         report_join_lookup_max_keys=_get_int("REPORT_JOIN_LOOKUP_MAX_KEYS", 2_000_000),
         report_join_max_records=_get_int_allow_zero("REPORT_JOIN_MAX_RECORDS", 0),
         report_join_source_max_records=_get_int_allow_zero("REPORT_JOIN_SOURCE_MAX_RECORDS", 0),
+        report_join_load_concurrency=_get_int_allow_zero("REPORT_JOIN_LOAD_CONCURRENCY", 4),
+        report_join_cache_ttl_seconds=_get_int_allow_zero("REPORT_JOIN_CACHE_TTL", 0),
+        report_join_cache_max_bytes=_get_int_allow_zero("REPORT_JOIN_CACHE_MAX_BYTES", 256 * 1024 * 1024),
         report_upstream_pushdown=_get_bool("REPORT_UPSTREAM_PUSHDOWN", False),
         report_pushdown_allowlist=os.getenv("REPORT_PUSHDOWN_ALLOWLIST"),
         report_pushdown_max_filters=_get_int("REPORT_PUSHDOWN_MAX_FILTERS", 50),
@@ -2,11 +2,12 @@ import json
 import logging
 import os
 import time
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import ValidationError
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
@@ -19,11 +20,17 @@ from app.observability.metrics import record_http_request, set_report_jobs_queue
 from app.observability.otel import configure_otel
 from app.observability.request_context import set_request_id
 from app.services.computed_fields import build_computed_fields_engine, extract_computed_fields
-from app.services.data_source_client import async_load_records, get_records_limit
-from app.services.detail_service import build_details
-from app.services.filter_service import apply_filters, collect_filter_options
-from app.services.join_service import apply_joins, resolve_joins
-from app.services.record_cache import build_records_cache_key, get_cached_records, set_cached_records
+from app.services.data_source_client import RecordsLimitExceeded, async_load_records, get_records_limit
+from app.services.detail_service import build_detail_sort, build_details, resolve_detail_total_mode
+from app.services.export_service import EXPORT_MEDIA_TYPES, resolve_export_format
+from app.services.filter_service import apply_filters, collect_filter_option_page, collect_filter_options
+from app.services.join_service import apply_joins, load_records_with_joins, resolve_joins
+from app.services.record_cache import (
+    build_records_cache_key,
+    get_cached_records,
+    get_record_index,
+    set_cached_records,
+)
 from app.services.records_pipeline import build_records_pipeline
 from app.services.report_job_service import (
     QueueFullError,
@@ -32,7 +39,24 @@ from app.services.report_job_service import (
     get_report_job,
     get_report_job_store,
 )
-from app.services.report_view_builder import build_report_view_response
+from app.services.report_view_builder import (
+    build_details_streaming,
+    build_report_view_response,
+    collect_filter_options_streaming,
+    stream_details_export,
+    stream_view_export,
+)
+from app.services.stage_executor import loop_guard, run_stage, shutdown_stage_executors
+from app.services.view_cache import get_view, slice_rows, tree_rows
+from app.services.view_codec import (
+    CELL_LAYOUTS,
+    COMPACT_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    encode_compact_view,
+    encode_msgpack,
+    msgpack_available,
+    resolve_view_format,
+)
 
 
 app = FastAPI(
@@ -145,6 +169,11 @@ app.add_middleware(
 app.include_router(batch_router)
 
 
+@app.on_event("shutdown")
+async def shutdown_stage_pools() -> None:
+    shutdown_stage_executors()
+
+
 @app.get("/health", tags=["system"])
 async def health_check() -> Dict[str, Any]:
     return {"status": "ok"}
@@ -180,9 +209,14 @@ async def build_report_view(payload: ViewRequest, request: Request) -> ViewRespo
     1. Загружает сырые записи из remoteSource.
     2. Строит простое представление (pivot) на их основе.
     3. Возвращает view + простейший chartConfig.
+
+    Формат view согласуется через ?format=compact|msgpack или Accept
+    (application/vnd.report.pivot+json, application/x-msgpack);
+    ?layout=dense|sparse задаёт раскладку ячеек compact-формата.
     """
     settings = get_settings()
     request_id = getattr(request.state, "request_id", None)
+    view_format, cell_layout = _resolve_view_encoding(request)
     force_sync = request.query_params.get("sync") == "1" or request.headers.get("X-Report-Sync") == "1"
 
     if settings.async_reports and not force_sync:
@@ -208,16 +242,142 @@ async def build_report_view(payload: ViewRequest, request: Request) -> ViewRespo
             extra={"templateId": payload.templateId, "requestId": request_id},
         )
         raise HTTPException(status_code=502, detail=f"Failed to build report view: {exc}") from exc
-    return response
+    if view_format == "default":
+        return response
+    with loop_guard("encode_view"):
+        return _encode_view_response(response, view_format, cell_layout)
 
 
-@app.post("/api/report/filters", tags=["report"])
-async def build_report_filters(payload: ViewRequest, request: Request, limit: int = 200) -> Dict[str, Any]:
+def _resolve_view_encoding(request: Request) -> Tuple[str, str]:
+    """Формат (?format= или Accept) и раскладка ячеек (?layout=) ответа с pivot."""
+    try:
+        view_format = resolve_view_format(request.query_params.get("format"), request.headers.get("accept"))
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    cell_layout = request.query_params.get("layout") or "auto"
+    if cell_layout not in CELL_LAYOUTS:
+        raise HTTPException(status_code=422, detail=f"Unsupported cell layout: {cell_layout}")
+    if view_format == "msgpack" and not msgpack_available():
+        raise HTTPException(status_code=406, detail="msgpack is not installed")
+    return view_format, cell_layout
+
+
+def _encoded_response(payload: Dict[str, Any], view_format: str) -> Response:
+    if view_format == "msgpack":
+        return Response(content=encode_msgpack(payload), media_type=MSGPACK_MEDIA_TYPE)
+    return JSONResponse(content=jsonable_encoder(payload), media_type=COMPACT_MEDIA_TYPE)
+
+
+def _encode_view_response(response: ViewResponse, view_format: str, layout: str) -> Response:
+    payload = response.dict()
+    payload["view"] = encode_compact_view(payload["view"], layout)
+    return _encoded_response(payload, view_format)
+
+
+def _encode_view_page(
+    page: Dict[str, Any],
+    entry: Dict[str, Any],
+    view_format: str,
+    layout: str,
+) -> Dict[str, Any] | Response:
     """
-    Endpoint для взаимозависимых фильтров (cascading filters).
-    Возвращает доступные значения для каждого ключа фильтра.
+    Окно строк / дети узла в формате, согласованном как у /api/report/view:
+    compact кодирует строки страницы вместе с колонками сохранённого view.
+    """
+    if view_format == "default":
+        return page
+    columns = (entry.get("view") or {}).get("columns") or []
+    encoded = encode_compact_view({"columns": columns, "rows": page["rows"]}, layout)
+    payload = {key: value for key, value in page.items() if key != "rows"}
+    return _encoded_response({**payload, **encoded}, view_format)
+
+
+@app.get("/api/report/view/{handle}/rows", tags=["report"])
+async def get_report_view_rows(
+    handle: str,
+    request: Request,
+    offset: int = 0,
+    limit: int = 100,
+    sort: str | None = None,
+    direction: str = "asc",
+) -> Dict[str, Any]:
+    """
+    Следующее окно строк pivot, сохранённого при запросе /api/report/view с window.
+    sort — ключ колонки для сортировки окна (asc/desc), пустые значения идут в конце при asc.
+    Формат (?format=, Accept, ?layout=) — как у /api/report/view.
+    """
+    if offset < 0 or limit <= 0:
+        raise HTTPException(status_code=422, detail="offset must be >= 0 and limit must be > 0")
+    view_format, cell_layout = _resolve_view_encoding(request)
+    entry = await get_view(handle)
+    if not entry:
+        raise HTTPException(status_code=404, detail="view not found")
+    settings = get_settings()
+    try:
+        window = slice_rows(
+            entry.get("view") or {},
+            offset,
+            min(limit, settings.report_view_window_max_rows),
+            sort_column=sort,
+            direction=direction,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return _encode_view_page({"handle": handle, **window}, entry, view_format, cell_layout)
+
+
+@app.get("/api/report/view/{handle}/children", tags=["report"])
+async def get_report_view_children(
+    handle: str,
+    key: str,
+    request: Request,
+    offset: int = 0,
+    limit: int = 100,
+) -> Dict[str, Any]:
+    """
+    Дети узла key pivot, построенного в tree-режиме (rowMode="tree").
+    Промежуточные узлы приходят с подытогами и childCount, листья — со строками ячеек.
+    Формат (?format=, Accept, ?layout=) — как у /api/report/view.
+    """
+    if offset < 0 or limit <= 0:
+        raise HTTPException(status_code=422, detail="offset must be >= 0 and limit must be > 0")
+    view_format, cell_layout = _resolve_view_encoding(request)
+    entry = await get_view(handle)
+    if not entry:
+        raise HTTPException(status_code=404, detail="view not found")
+    node = ((entry.get("tree") or {}).get("nodes") or {}).get(key)
+    if node is None:
+        raise HTTPException(status_code=404, detail="node not found")
+    settings = get_settings()
+    limit = min(limit, settings.report_view_window_max_rows)
+    children = node.get("children") or []
+    page = {
+        "handle": handle,
+        "key": key,
+        "offset": offset,
+        "limit": limit,
+        "totalRows": len(children),
+        "rows": tree_rows(entry, children[offset : offset + limit]),
+    }
+    return _encode_view_page(page, entry, view_format, cell_layout)
+
+
+def _check_records_limit(count: int, limit: int | None, stage: str) -> None:
+    # в отличие от _enforce_records_limit превышение даёт /filters и /details уйти в потоковый режим
+    if limit is not None and count > limit:
+        raise RecordsLimitExceeded(count, limit, stage)
+
+
+async def _load_filter_records(
+    payload: ViewRequest,
+    request_id: str | None,
+) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any], bool, List[Any]]:
+    """
+    Записи источника с join и вычисляемыми полями для эндпоинтов фильтров
+    (из кэша записей или с загрузкой). Возвращает ключ кэша, записи, debug join,
+    признак попадания в кэш и предупреждения вычисляемых полей.
+    Превышение REPORT_MAX_RECORDS — RecordsLimitExceeded.
     """
-    request_id = getattr(request.state, "request_id", None)
     max_records = get_records_limit()
     settings = get_settings()
     computed_engine = build_computed_fields_engine(payload.remoteSource)
@@ -265,12 +425,16 @@ async def build_report_filters(payload: ViewRequest, request: Request, limit: in
                     cache_hit = joined_records is not None
             if joined_records is None:
                 load_started = time.monotonic()
-                records = await async_load_records(
-                    payload.remoteSource,
-                    payload_filters=None,
-                    pushdown_enabled=False,
+                records, loaded_sources = await load_records_with_joins(
+                    async_load_records(
+                        payload.remoteSource,
+                        payload_filters=None,
+                        pushdown_enabled=False,
+                    ),
+                    joins,
+                    max_records=max_records,
                 )
-                _enforce_records_limit(len(records), max_records, "load_records")
+                _check_records_limit(len(records), max_records, "load_records")
                 logger.info(
                     "report.filters.load_records",
                     extra={
@@ -286,10 +450,11 @@ async def build_report_filters(payload: ViewRequest, request: Request, limit: in
                     payload.remoteSource,
                     joins_override=joins,
                     max_records=max_records,
+                    loaded_sources=loaded_sources,
                 )
-                _enforce_records_limit(len(joined_records), max_records, "apply_joins")
+                _check_records_limit(len(joined_records), max_records, "apply_joins")
                 if computed_engine:
-                    computed_engine.apply(joined_records)
+                    await run_stage("computed_fields", computed_engine.apply, joined_records)
                     computed_warnings = list(computed_engine.warnings)
                 logger.info(
                     "report.filters.apply_joins",
@@ -304,11 +469,11 @@ async def build_report_filters(payload: ViewRequest, request: Request, limit: in
             if joined_records:
                 await set_cached_records(cache_key, joined_records)
         else:
-            _enforce_records_limit(len(joined_records), max_records, "cache_records")
+            _check_records_limit(len(joined_records), max_records, "cache_records")
             if computed_engine and not use_parity:
-                computed_engine.apply(joined_records)
+                await run_stage("computed_fields", computed_engine.apply, joined_records)
                 computed_warnings = list(computed_engine.warnings)
-    except HTTPException:
+    except (HTTPException, RecordsLimitExceeded):
         raise
     except ValueError as exc:
         logger.warning(
@@ -322,19 +487,53 @@ async def build_report_filters(payload: ViewRequest, request: Request, limit: in
             extra={"templateId": payload.templateId, "requestId": request_id},
         )
         raise HTTPException(status_code=502, detail=f"Failed to build report filters: {exc}") from exc
+    return cache_key, joined_records, join_debug, cache_hit, computed_warnings
+
 
+@app.post("/api/report/filters", tags=["report"])
+async def build_report_filters(payload: ViewRequest, request: Request, limit: int = 200) -> Dict[str, Any]:
+    """
+    Endpoint для взаимозависимых фильтров (cascading filters).
+    Возвращает доступные значения для каждого ключа фильтра.
+    """
+    request_id = getattr(request.state, "request_id", None)
     env_limit = os.getenv("REPORT_FILTERS_MAX_VALUES")
     if env_limit and env_limit.isdigit() and limit == 200:
         limit = int(env_limit)
     if limit <= 0:
         limit = 200
 
+    try:
+        cache_key, joined_records, join_debug, cache_hit, computed_warnings = await _load_filter_records(
+            payload, request_id
+        )
+    except RecordsLimitExceeded as exc:
+        if not get_settings().report_streaming_on_limit:
+            raise HTTPException(status_code=422, detail=str(exc)) from exc
+        logger.info(
+            "report.filters.streaming_fallback",
+            extra={
+                "templateId": payload.templateId,
+                "requestId": request_id,
+                "stage": exc.stage,
+                "count": exc.count,
+                "limit": exc.limit,
+            },
+        )
+        return await _build_report_filters_streaming(payload, request_id, limit)
+
     filters_started = time.monotonic()
-    options, meta, truncated, selected_pruned, debug = collect_filter_options(
+    record_index = get_record_index(cache_key, joined_records)
+    options, meta, truncated, selected_pruned, debug = await run_stage(
+        "collect_filter_options",
+        collect_filter_options,
         joined_records,
         payload.snapshot,
         payload.filters,
         max_unique=limit,
+        index=record_index,
+        pure=record_index is None,
+        input_size=len(joined_records),
     )
     logger.info(
         "report.filters.collect_options",
@@ -355,10 +554,15 @@ async def build_report_filters(payload: ViewRequest, request: Request, limit: in
     if computed_warnings:
         response["computedWarnings"] = computed_warnings
     if os.getenv("REPORT_DEBUG_FILTERS"):
-        filtered_records, _ = apply_filters(
+        filtered_records, _ = await run_stage(
+            "apply_filters",
+            apply_filters,
             joined_records,
             payload.snapshot,
             payload.filters,
+            index=record_index,
+            pure=record_index is None,
+            input_size=len(joined_records),
         )
         debug["recordsBeforeFilter"] = len(joined_records)
         debug["recordsAfterFilter"] = len(filtered_records)
@@ -369,10 +573,165 @@ async def build_report_filters(payload: ViewRequest, request: Request, limit: in
             debug["selectedPruned"] = selected_pruned
         if join_debug:
             debug["joins"] = join_debug
+        if record_index is not None:
+            debug["recordIndex"] = record_index.stats()
         response["debug"] = debug
     return response
 
 
+async def _build_report_filters_streaming(payload: ViewRequest, request_id: str | None, limit: int) -> Dict[str, Any]:
+    """Опции фильтров потоковым проходом по источнику (набор больше REPORT_MAX_RECORDS)."""
+    filters_started = time.monotonic()
+    try:
+        result, summary = await collect_filter_options_streaming(payload, request_id, max_unique=limit)
+    except ValueError as exc:
+        logger.warning(
+            "Failed to build report filters",
+            extra={"templateId": payload.templateId, "requestId": request_id, "error": str(exc)},
+        )
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    except Exception as exc:
+        logger.exception(
+            "Failed to build report filters",
+            extra={"templateId": payload.templateId, "requestId": request_id},
+        )
+        raise HTTPException(status_code=502, detail=f"Failed to build report filters: {exc}") from exc
+    options, meta, truncated, selected_pruned, debug = result
+    logger.info(
+        "report.filters.collect_options",
+        extra={
+            "templateId": payload.templateId,
+            "requestId": request_id,
+            "records": summary["recordsAfterJoin"],
+            "streaming": True,
+            "duration_ms": int((time.monotonic() - filters_started) * 1000),
+        },
+    )
+    response: Dict[str, Any] = {
+        "options": options,
+        "meta": meta,
+        "truncated": truncated,
+        "streaming": True,
+    }
+    if debug.get("approximateKeys"):
+        response["approximate"] = debug["approximateKeys"]
+    if selected_pruned:
+        response["selectedPruned"] = selected_pruned
+    if debug.get("selectedUnlisted"):
+        response["selectedUnlisted"] = debug["selectedUnlisted"]
+    if summary["computedWarnings"]:
+        response["computedWarnings"] = summary["computedWarnings"]
+    if os.getenv("REPORT_DEBUG_FILTERS"):
+        debug["recordsBeforeFilter"] = summary["recordsAfterJoin"]
+        debug["truncated"] = truncated
+        debug["cacheHit"] = False
+        debug["pushdownDisabled"] = True
+        debug["streaming"] = True
+        if selected_pruned:
+            debug["selectedPruned"] = selected_pruned
+        if summary["joins"]["joinsApplied"]:
+            debug["joins"] = summary["joins"]
+        response["debug"] = debug
+    return response
+
+
+@app.post("/api/report/filters/options", tags=["report"])
+async def build_report_filter_options(
+    payload: ViewRequest,
+    request: Request,
+    key: str,
+    q: str | None = None,
+    match: str = "prefix",
+    cursor: int = 0,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """
+    Typeahead-опции одного ключа фильтра: поиск по префиксу/подстроке q и
+    постраничная выдача (cursor → nextCursor) по всем значениям, без отсечения
+    REPORT_FILTERS_MAX_VALUES. Счётчики учитывают остальные фильтры (каскад).
+    """
+    request_id = getattr(request.state, "request_id", None)
+    try:
+        cache_key, joined_records, _, _, _ = await _load_filter_records(payload, request_id)
+    except RecordsLimitExceeded as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    record_index = get_record_index(cache_key, joined_records)
+    try:
+        return await run_stage(
+            "collect_filter_options",
+            collect_filter_option_page,
+            joined_records,
+            payload.snapshot,
+            payload.filters,
+            key,
+            query=q,
+            match=match,
+            cursor=cursor,
+            limit=limit,
+            index=record_index,
+            pure=record_index is None,
+            input_size=len(joined_records),
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+async def _build_report_details_streaming(
+    view_payload: ViewRequest,
+    payload: Dict[str, Any],
+    request_id: str | None,
+    limit: int,
+    offset: int,
+) -> Dict[str, Any]:
+    """Детализация потоковым проходом по источнику, без загрузки и кэширования набора записей."""
+    details_started = time.monotonic()
+    try:
+        response, summary = await build_details_streaming(
+            view_payload,
+            payload,
+            request_id,
+            limit=limit,
+            offset=offset,
+        )
+    except HTTPException:
+        raise
+    except Exception as exc:
+        logger.exception(
+            "Failed to build report details",
+            extra={"templateId": view_payload.templateId, "requestId": request_id},
+        )
+        raise HTTPException(
+            status_code=422 if isinstance(exc, ValueError) else 502,
+            detail=f"Failed to build report details: {exc}",
+        ) from exc
+    logger.info(
+        "report.details.build_details",
+        extra={
+            "templateId": view_payload.templateId,
+            "requestId": request_id,
+            "records": summary["recordsProcessed"],
+            "entries": len(response.get("entries", [])),
+            "streaming": True,
+            "duration_ms": int((time.monotonic() - details_started) * 1000),
+        },
+    )
+    response["streaming"] = True
+    if os.getenv("REPORT_DEBUG_FILTERS"):
+        response["debug"] = {
+            "recordsRead": summary["recordsProcessed"],
+            "recordsReceived": summary["recordsReceived"],
+            "recordsAfterEffectiveFilters": summary["recordsAfterFilter"],
+            "filters": summary["filterDebug"],
+            "cacheHit": False,
+            "streaming": True,
+        }
+        if summary["joins"]["joinsApplied"]:
+            response["debug"]["joins"] = summary["joins"]
+    if summary["computedWarnings"]:
+        response["computedWarnings"] = summary["computedWarnings"]
+    return response
+
+
 @app.post("/api/report/details", tags=["report"])
 async def build_report_details(payload: Dict[str, Any], request: Request) -> Dict[str, Any]:
     if not isinstance(payload, dict):
@@ -402,6 +761,12 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
     except (TypeError, ValueError):
         offset = 0
 
+    try:
+        resolve_detail_total_mode(payload)
+        build_detail_sort(payload, {})
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
     request_id = getattr(request.state, "request_id", None)
     max_records = get_records_limit()
     settings = get_settings()
@@ -421,6 +786,8 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
         join_debug: Dict[str, Any] = {}
         cache_hit = joined_records is not None
         computed_warnings = list(getattr(computed_engine, "warnings", []) or [])
+        if joined_records is None and settings.report_details_streaming:
+            return await _build_report_details_streaming(view_payload, payload, request_id, limit, offset)
         if joined_records is None:
             if use_parity:
                 try:
@@ -451,8 +818,12 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
                     cache_hit = joined_records is not None
             if joined_records is None:
                 load_started = time.monotonic()
-                records = await async_load_records(view_payload.remoteSource, payload_filters=view_payload.filters)
-                _enforce_records_limit(len(records), max_records, "load_records")
+                records, loaded_sources = await load_records_with_joins(
+                    async_load_records(view_payload.remoteSource, payload_filters=view_payload.filters),
+                    joins,
+                    max_records=max_records,
+                )
+                _check_records_limit(len(records), max_records, "load_records")
                 logger.info(
                     "report.details.load_records",
                     extra={
@@ -468,10 +839,11 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
                     view_payload.remoteSource,
                     joins_override=joins,
                     max_records=max_records,
+                    loaded_sources=loaded_sources,
                 )
-                _enforce_records_limit(len(joined_records), max_records, "apply_joins")
+                _check_records_limit(len(joined_records), max_records, "apply_joins")
                 if computed_engine:
-                    computed_engine.apply(joined_records)
+                    await run_stage("computed_fields", computed_engine.apply, joined_records)
                     computed_warnings = list(computed_engine.warnings)
                 logger.info(
                     "report.details.apply_joins",
@@ -486,13 +858,16 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
             if joined_records:
                 await set_cached_records(cache_key, joined_records)
         else:
-            _enforce_records_limit(len(joined_records), max_records, "cache_records")
+            _check_records_limit(len(joined_records), max_records, "cache_records")
             if computed_engine and not use_parity:
-                computed_engine.apply(joined_records)
+                await run_stage("computed_fields", computed_engine.apply, joined_records)
                 computed_warnings = list(computed_engine.warnings)
 
         details_started = time.monotonic()
-        response, debug_payload = build_details(
+        record_index = get_record_index(cache_key, joined_records)
+        response, debug_payload = await run_stage(
+            "build_details",
+            build_details,
             joined_records or [],
             view_payload.snapshot,
             view_payload.filters,
@@ -500,6 +875,9 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
             limit=limit,
             offset=offset,
             debug=bool(os.getenv("REPORT_DEBUG_FILTERS")),
+            index=record_index,
+            pure=record_index is None,
+            input_size=len(joined_records or []),
         )
         logger.info(
             "report.details.build_details",
@@ -511,6 +889,20 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
                 "duration_ms": int((time.monotonic() - details_started) * 1000),
             },
         )
+    except RecordsLimitExceeded as exc:
+        if not settings.report_streaming_on_limit:
+            raise HTTPException(status_code=422, detail=f"Failed to build report details: {exc}") from exc
+        logger.info(
+            "report.details.streaming_fallback",
+            extra={
+                "templateId": view_payload.templateId,
+                "requestId": request_id,
+                "stage": exc.stage,
+                "count": exc.count,
+                "limit": exc.limit,
+            },
+        )
+        return await _build_report_details_streaming(view_payload, payload, request_id, limit, offset)
     except HTTPException:
         raise
     except Exception as exc:
@@ -527,6 +919,8 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
         debug_payload["cacheHit"] = cache_hit
         if join_debug:
             debug_payload["joins"] = join_debug
+        if record_index is not None:
+            debug_payload["recordIndex"] = record_index.stats()
         response["debug"] = debug_payload
     if computed_warnings:
         response["computedWarnings"] = computed_warnings
@@ -534,6 +928,93 @@ async def build_report_details(payload: Dict[str, Any], request: Request) -> Dic
     return response
 
 
+async def _export_response(
+    chunks: AsyncIterator[bytes],
+    export_format: str,
+    filename: str,
+    request_id: str | None,
+) -> StreamingResponse:
+    """
+    Chunked-ответ выгрузки. Первая порция читается до отправки заголовков, поэтому
+    ошибки подготовки и загрузки первого чанка — обычные 422/502; дальше ошибка
+    обрывает поток.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except HTTPException:
+        raise
+    except Exception as exc:
+        await chunks.aclose()
+        logger.exception("Failed to export report", extra={"requestId": request_id})
+        raise HTTPException(
+            status_code=422 if isinstance(exc, ValueError) else 502,
+            detail=f"Failed to export report: {exc}",
+        ) from exc
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+
+@app.post("/api/report/view/export", tags=["report"])
+async def export_report_view(payload: ViewRequest, request: Request, format: str = "csv") -> StreamingResponse:
+    """
+    Выгрузка pivot в CSV или XLSX (?format=csv|xlsx) chunked-ответом: записи
+    агрегируются потоково, строки результата сериализуются по мере финализации.
+    """
+    try:
+        export_format = resolve_export_format(format)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    request_id = getattr(request.state, "request_id", None)
+    return await _export_response(
+        stream_view_export(payload, export_format, request_id),
+        export_format,
+        "report",
+        request_id,
+    )
+
+
+@app.post("/api/report/details/export", tags=["report"])
+async def export_report_details(payload: Dict[str, Any], request: Request, format: str = "csv") -> StreamingResponse:
+    """
+    Выгрузка детализации ячейки (body как у /api/report/details, без limit/offset)
+    в CSV или XLSX: строки пишутся по мере чтения источника.
+    """
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Details payload must be a JSON object")
+    try:
+        view_payload = ViewRequest(**payload)
+    except ValidationError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "Invalid details payload", "errors": exc.errors()},
+        ) from exc
+    try:
+        export_format = resolve_export_format(format)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    request_id = getattr(request.state, "request_id", None)
+    return await _export_response(
+        stream_details_export(view_payload, payload, export_format, request_id),
+        export_format,
+        "details",
+        request_id,
+    )
+
+
 @app.get("/api/report/jobs/{job_id}", tags=["report"])
 async def get_report_job_status(job_id: str) -> Dict[str, Any]:
     job = await get_report_job(job_id)
@@ -13,21 +13,40 @@ class PivotSection(BaseModel):
 class Metric(BaseModel):
     key: Optional[str] = None
     sourceKey: Optional[str] = None
-    op: Optional[Literal["sum", "avg", "count", "value", "count_distinct", "distinct"]] = None
+    op: Optional[
+        Literal[
+            "sum",
+            "avg",
+            "count",
+            "value",
+            "count_distinct",
+            "distinct",
+            "min",
+            "max",
+            "median",
+            "p90",
+            "p95",
+        ]
+    ] = None
     type: Literal["base", "formula"] = "base"
     expression: Optional[str] = None
     field: Optional[str] = None
-    agg: Optional[str] = None  # sum, count, avg, min, max
+    agg: Optional[str] = None  # sum, count, avg, min, max, median, p90, p95
     fieldKey: Optional[str] = None
     aggregator: Optional[str] = None
     label: Optional[str] = None
     format: Optional[str] = None
+    # count_distinct: exact — точный подсчёт, approx — HyperLogLog (precision 4..18)
+    distinctMode: Optional[Literal["exact", "approx", "hll"]] = None
+    distinctPrecision: Optional[int] = None
     # сюда можно потом добавить expr, если используется формула
 
 
 class Options(BaseModel):
     headerOverrides: Dict[str, Any] = {}
     sorts: Dict[str, Any] = {}  # например { fieldKey: { direction: 'asc' } }
+    # top-N по измерению, хвост сворачивается в «Прочее»: { fieldKey: { limit: 10, by: 'metric' | 'count' } }
+    topN: Dict[str, Any] = {}
 
 
 class ConditionalFormattingRule(BaseModel):
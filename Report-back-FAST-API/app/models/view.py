@@ -25,6 +25,10 @@ class ViewRow(BaseModel):
     values: Optional[List[Any]] = None
     cells: List[ViewCell]
 
+    class Config:
+        # tree-режим добавляет depth/childCount/totals
+        extra = "allow"
+
 
 class PivotView(BaseModel):
     """
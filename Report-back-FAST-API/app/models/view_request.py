@@ -1,12 +1,21 @@
-from typing import Any, Dict
+from typing import Any, Dict, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.models.filters import Filters
 from app.models.remote_source import RemoteSource
 from app.models.snapshot import Snapshot
 
 
+class ViewWindow(BaseModel):
+    # окно строк pivot: offset — с какой строки, limit — сколько строк вернуть
+    offset: int = Field(0, ge=0)
+    limit: int = Field(..., ge=1)
+    # необязательная сортировка окна по ключу колонки (columns[].key)
+    sortColumn: Optional[str] = None
+    sortDirection: Literal["asc", "desc"] = "asc"
+
+
 class ViewRequest(BaseModel):
     """
     Запрос на построение представления:
@@ -14,8 +23,12 @@ class ViewRequest(BaseModel):
     - remoteSource — нормализованный источник данных (из API отчётов)
     - snapshot — конфигурация pivot/фильтров/метрик/сортировок
     - filters — глобальные и контейнерные фильтры
+    - window — окно строк; полный pivot сохраняется в кэше под handle (см. meta.window)
+    - rowMode — "tree": только узлы верхнего уровня с подытогами, дети через expand (см. meta.tree)
     """
     templateId: str
     remoteSource: RemoteSource
     snapshot: Snapshot
     filters: Filters
+    window: Optional[ViewWindow] = None
+    rowMode: Literal["flat", "tree"] = "flat"
@@ -0,0 +1,40 @@
+import asyncio
+import time
+from typing import Any
+
+
+class LoopLagProbe:
+    """
+    Замер задержки event loop на время операции: фоновая задача спит interval
+    секунд и фиксирует, насколько позже она проснулась. max_lag_ms показывает,
+    как долго loop был занят синхронной работой.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.max_lag_ms = 0.0
+        self.samples = 0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = (time.perf_counter() - started - self.interval) * 1000
+            self.samples += 1
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+
+    async def __aenter__(self) -> "LoopLagProbe":
+        self._task = asyncio.create_task(self._run())
+        # даём задаче заснуть до начала операции, иначе первый замер начнётся уже после неё
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -40,6 +40,32 @@ REPORT_VIEW_GROUPS_TOTAL = Counter(
     "Total groups emitted for report view",
 )
 
+REPORT_STREAMING_SPILL_RUNS_TOTAL = Counter(
+    "report_streaming_spill_runs_total",
+    "Total sorted runs spilled to disk by streaming pivot aggregation",
+)
+REPORT_STREAMING_SPILL_BYTES_TOTAL = Counter(
+    "report_streaming_spill_bytes_total",
+    "Total bytes spilled to disk by streaming pivot aggregation",
+)
+
+REPORT_STREAMING_LOOP_LAG_SECONDS = Histogram(
+    "report_streaming_loop_lag_seconds",
+    "Max event loop lag observed during a streaming report view",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+REPORT_STAGE_DURATION_SECONDS = Histogram(
+    "report_stage_duration_seconds",
+    "Report request CPU stage duration in seconds",
+    ["stage", "executor"],
+)
+REPORT_LOOP_BLOCKED_TOTAL = Counter(
+    "report_loop_blocked_total",
+    "Total report stages that held the event loop longer than the threshold",
+    ["stage"],
+)
+
 REPORT_PUSHDOWN_REQUESTS_TOTAL = Counter(
     "report_pushdown_requests_total",
     "Total upstream pushdown attempts",
@@ -84,6 +110,25 @@ def record_report_view_metrics(
         REPORT_VIEW_GROUPS_TOTAL.inc(groups_total)
 
 
+def record_streaming_spill(runs: int, bytes_written: int) -> None:
+    if runs > 0:
+        REPORT_STREAMING_SPILL_RUNS_TOTAL.inc(runs)
+    if bytes_written > 0:
+        REPORT_STREAMING_SPILL_BYTES_TOTAL.inc(bytes_written)
+
+
+def record_streaming_loop_lag(lag_seconds: float) -> None:
+    REPORT_STREAMING_LOOP_LAG_SECONDS.observe(max(lag_seconds, 0.0))
+
+
+def record_stage_duration(stage: str, executor: str, duration_seconds: float) -> None:
+    REPORT_STAGE_DURATION_SECONDS.labels(stage=stage, executor=executor).observe(duration_seconds)
+
+
+def record_loop_blocked(stage: str) -> None:
+    REPORT_LOOP_BLOCKED_TOTAL.labels(stage=stage).inc()
+
+
 def record_pushdown_request(enabled: bool, result: str) -> None:
     REPORT_PUSHDOWN_REQUESTS_TOTAL.labels(enabled="1" if enabled else "0", result=result).inc()
 
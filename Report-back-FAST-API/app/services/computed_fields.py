@@ -4,6 +4,7 @@ import json
 import re
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 
@@ -621,6 +622,13 @@ class ComputedFieldsEngine:
     def warnings(self) -> List[Dict[str, Any]]:
         return list(self._warnings)
 
+    def apply_record(self, record: Dict[str, Any]) -> None:
+        if not isinstance(record, dict):
+            return
+        warnings = self._warnings
+        for field in self._fields:
+            record[field.spec.field_key] = field.evaluate(record, warnings)
+
     def apply(self, records: List[Dict[str, Any]]) -> None:
         if not records or not self._fields:
             return
@@ -940,7 +948,13 @@ def _parse_date_input(value: Any) -> datetime | None:
             return datetime.fromtimestamp(float(value) / 1000.0, tz=timezone.utc)
         except (OverflowError, OSError, ValueError):
             return None
-    text = str(value).strip()
+    return _parse_date_text(value if isinstance(value, str) else str(value))
+
+
+@lru_cache(maxsize=16384)
+def _parse_date_text(raw: str) -> datetime | None:
+    # кэш по сырой строке: date()/datediff вызываются на каждой записи
+    text = raw.strip()
     if not text:
         return None
     if len(text) == 10 and text[4] == "-" and text[7] == "-":
@@ -655,11 +655,19 @@ def _resolve_full_url(url: str, base_url: str) -> str:
     return build_full_url(base_url, url)
 
 
+class RecordsLimitExceeded(ValueError):
+    def __init__(self, count: int, limit: int | None, stage: str) -> None:
+        super().__init__(f"Records limit exceeded after {stage}: {count} > {limit}")
+        self.count = count
+        self.limit = limit
+        self.stage = stage
+
+
 def _enforce_records_limit(records: List[Dict[str, Any]], limit: int | None) -> None:
     if limit is None:
         return
     if len(records) > limit:
-        raise ValueError(f"Records limit exceeded: {len(records)} > {limit}")
+        raise RecordsLimitExceeded(len(records), limit, "load_records")
 
 
 def _iter_chunks(records: List[Dict[str, Any]], chunk_size: int) -> Iterable[List[Dict[str, Any]]]:
@@ -876,6 +884,8 @@ async def _async_iter_records_with_client(
     local_found, local_records = _extract_local_records(remote_source)
     if local_found:
         _enforce_records_limit(local_records, get_records_limit())
+        stats["records_received"] = len(local_records)
+        stats["records_complete"] = True
         for chunk in _iter_chunks(local_records, chunk_size):
             yield chunk
         return
@@ -924,7 +934,7 @@ async def _async_iter_records_with_client(
     paging_force = paging_force or _get_upstream_paging_enabled()
     paging_allowed_for_host = paging_force or _is_host_allowed(full_url, paging_allow)
     start = time.monotonic()
-    for payload in request_payloads:
+    for position, payload in enumerate(request_payloads):
         paging_config = _extract_paging_config(payload.body)
         paging_pushdown_allowed = bool(
             pushdown_active and pushdown_cfg and pushdown_cfg.paging and paging_allowed_for_host
@@ -992,6 +1002,7 @@ async def _async_iter_records_with_client(
 
                 _apply_request_metadata(records, request_payload.params)
                 total_records += len(records)
+                stats["records_received"] = total_records
                 for chunk in _iter_chunks(records, chunk_size):
                     yield chunk
 
@@ -1054,6 +1065,10 @@ async def _async_iter_records_with_client(
 
         _apply_request_metadata(records, request_payload.params)
         total_records += len(records)
+        # сколько записей upstream уже получено (включая ещё не отданные чанки) — для оценок по выборке
+        stats["records_received"] = total_records
+        # последний запрос без постраничной загрузки: records_received — весь источник
+        stats["records_complete"] = position == len(request_payloads) - 1
         for chunk in _iter_chunks(records, chunk_size):
             yield chunk
 
@@ -1,7 +1,11 @@
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict
 
 DATE_PART_MARKER = "__date_part__"
+# кэш разбора дат по сырому значению: различных строк дат обычно несколько тысяч,
+# а разбираются они на каждой записи в pivot, фильтрах, join и вычисляемых полях
+DATE_PARSE_CACHE_SIZE = 16384
 MONTH_LABELS = [
     "Январь",
     "Февраль",
@@ -41,9 +45,40 @@ def parse_date_input(value: Any) -> datetime | None:
             return datetime.fromtimestamp(float(value) / 1000.0, tz=timezone.utc)
         except (OverflowError, OSError, ValueError):
             return None
-    text = str(value).strip()
+    return _parse_date_text(value if isinstance(value, str) else str(value))
+
+
+def _parse_fixed_width_date(text: str) -> datetime | None:
+    # быстрый путь для YYYY-MM-DD и DD.MM.YYYY без сборки ISO-строки
+    if text[4] == "-" and text[7] == "-":
+        year, month, day = text[:4], text[5:7], text[8:]
+    elif text[2] == "." and text[5] == ".":
+        day, month, year = text[:2], text[3:5], text[6:]
+    else:
+        return None
+    if not (text.isascii() and year.isdigit() and month.isdigit() and day.isdigit()):
+        return None
+    try:
+        return datetime(int(year), int(month), int(day), tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _parse_date_text(raw: str) -> datetime | None:
+    text = raw.strip()
     if not text:
         return None
+    if len(text) > 10 and text[10] == "T" and text[-1] == "Z":
+        # быстрый путь для ISO с «Z» (типичный ответ upstream): fromisoformat с Python 3.11 разбирает «Z» сам
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    if len(text) == 10:
+        parsed = _parse_fixed_width_date(text)
+        if parsed is not None:
+            return parsed
     if "." in text:
         parts = text.split(".")
         if len(parts) == 3:
@@ -66,7 +101,17 @@ def parse_date_input(value: Any) -> datetime | None:
 
 
 def resolve_date_part_value(value: Any, part: str) -> str | None:
-    parsed = parse_date_input(value)
+    if isinstance(value, str):
+        return _resolve_date_part_text(value, part)
+    return _format_date_part(parse_date_input(value), part)
+
+
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _resolve_date_part_text(value: str, part: str) -> str | None:
+    return _format_date_part(_parse_date_text(value), part)
+
+
+def _format_date_part(parsed: datetime | None, part: str) -> str | None:
     if not parsed:
         return None
     if part == "year":
@@ -1,10 +1,16 @@
-from typing import Any, Dict, List, Tuple
+import base64
+import heapq
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
 from app.models.filters import Filters
 from app.models.snapshot import Snapshot
 from app.services.date_utils import parse_date_input
 from app.services.filter_service import (
     apply_filters,
+    compile_record_filter,
+    filter_record_positions,
+    _compile_value_resolver,
     _is_date_type,
     _normalize_filter_value,
     _resolve_field_label,
@@ -13,6 +19,14 @@ from app.services.filter_service import (
     _to_ms,
     _to_number,
 )
+from app.services.record_index import RecordIndex, bitmap_bytes
+from app.services.streaming_pipeline import StopChunks
+
+DETAIL_TOTAL_MODES = ("exact", "capped", "estimate")
+DETAIL_SORT_DIRECTIONS = ("asc", "desc")
+
+# по стольким первым строкам выводится тип поля сортировки без fieldMeta
+_SORT_TYPE_SAMPLE = 1000
 
 
 def _snapshot_to_dict(snapshot: Snapshot | Dict[str, Any]) -> Dict[str, Any]:
@@ -71,6 +85,64 @@ def _matches_constraints(
     return True
 
 
+def _constraints_bitmap(index: RecordIndex, fields: List[str], values: List[Any]) -> int | None:
+    """_matches_constraints по индексу: пересечение строк с нужными значениями; None — поле вне индекса."""
+    mask = index.all_rows
+    if not fields or not values:
+        return mask
+    for field, expected in zip(fields, values):
+        postings = index.postings(field, _compile_value_resolver(field), _normalize_filter_value)
+        if postings is None:
+            return None
+        mask &= index.union(postings, (_normalize_constraint_value(expected),))
+    return mask
+
+
+def _cell_bitmap(
+    index: RecordIndex,
+    dimension_fields: List[str],
+    fields: List[str],
+    values: List[Any],
+) -> int | None:
+    """
+    Ограничения ячейки по индексу ячеек pivot (RecordIndex.cell_postings): одно
+    обращение по префиксу ключа измерения. None — ограничения не префикс полей
+    измерения или индекс вне бюджета.
+    """
+    pairs = list(zip(fields, values))
+    if not pairs:
+        return index.all_rows
+    if [field for field, _ in pairs] != list(dimension_fields[: len(pairs)]):
+        return None
+    postings = index.cell_postings(
+        tuple(str(field) for field in dimension_fields),
+        [_compile_value_resolver(str(field)) for field in dimension_fields],
+        _normalize_filter_value,
+    )
+    if postings is None:
+        return None
+    return index.union(postings, (tuple(_normalize_constraint_value(value) for _, value in pairs),))
+
+
+def _cell_constraints_bitmap(
+    index: RecordIndex,
+    snapshot_dict: Dict[str, Any],
+    cell_constraints: Dict[str, List[Any]],
+) -> int | None:
+    pivot = snapshot_dict.get("pivot") or {}
+    mask = index.all_rows
+    for axis, prefix in (("rows", "row"), ("columns", "column")):
+        fields = cell_constraints.get(f"{prefix}Fields") or []
+        values = cell_constraints.get(f"{prefix}Values") or []
+        axis_mask = _cell_bitmap(index, pivot.get(axis) or [], fields, values)
+        if axis_mask is None:
+            axis_mask = _constraints_bitmap(index, fields, values)
+        if axis_mask is None:
+            return None
+        mask &= axis_mask
+    return mask
+
+
 def _resolve_cell_constraints(payload: Dict[str, Any]) -> Dict[str, List[Any]]:
     cell = payload.get("cell") if isinstance(payload.get("cell"), dict) else {}
     row_fields = cell.get("rowFields") or []
@@ -313,6 +385,353 @@ def _build_field_meta(
     return result
 
 
+def resolve_detail_total_mode(payload: Dict[str, Any]) -> str:
+    """totalMode детализации: exact (по умолчанию), capped или estimate; иначе ValueError."""
+    value = payload.get("totalMode") or "exact"
+    mode = str(value).strip().lower()
+    if mode not in DETAIL_TOTAL_MODES:
+        raise ValueError(f"Unsupported totalMode: {value}")
+    return mode
+
+
+def resolve_detail_sort(payload: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    sort детализации: список {field, direction}, один такой объект или строка
+    "field" / "-field" (desc). Пустой список — порядок источника; иначе ValueError.
+    """
+    raw = payload.get("sort")
+    if not raw:
+        return []
+    result: List[Tuple[str, str]] = []
+    for item in raw if isinstance(raw, list) else [raw]:
+        if isinstance(item, str):
+            field, direction = (item[1:], "desc") if item.startswith("-") else (item, "asc")
+        elif isinstance(item, dict):
+            field = item.get("field") or item.get("key")
+            direction = str(item.get("direction") or "asc").strip().lower()
+        else:
+            raise ValueError(f"Unsupported sort item: {item!r}")
+        if not field:
+            raise ValueError("Sort field is required")
+        if direction not in DETAIL_SORT_DIRECTIONS:
+            raise ValueError(f"Unsupported sort direction: {direction}")
+        result.append((str(field), direction))
+    return result
+
+
+class _Descending:
+    """Строка с обратным порядком сравнения — для desc по текстовому значению внутри ключа."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+    def __eq__(self, other: Any) -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: Any) -> bool:
+        return other.value < self.value
+
+
+def _sort_component(value: Any, field_type: str) -> Tuple[int, int, Any]:
+    # (пустое, не приводится к типу поля, значение): пустые — в конце, неприводимые — после приводимых
+    if value is None or value == "":
+        return (1, 0, "")
+    if field_type == "number":
+        number = _to_number(value)
+        if number is not None and number == number:
+            return (0, 0, number)
+    elif field_type == "date":
+        ms = _to_ms(value)
+        if ms is not None:
+            return (0, 0, ms)
+    else:
+        return (0, 0, str(value).casefold())
+    return (0, 1, str(value).casefold())
+
+
+def _directed(component: Tuple[int, int, Any], direction: str) -> Tuple[Any, ...]:
+    if direction == "asc":
+        return component
+    # обращается только значение: пустые и неприводимые остаются после приводимых и при desc
+    blank, rank, value = component
+    return (blank, rank, _Descending(value) if isinstance(value, str) else -value)
+
+
+class DetailSort:
+    """
+    Серверная сортировка детализации. Ключ строки — кортеж по полям sort с учётом
+    типа поля (_resolve_meta_type: число, дата через мемоизированный разбор,
+    строка casefold); пустые значения — в конце при любом направлении, при
+    равенстве — порядок строк источника (ordinal). Страница выбирается
+    heap-отбором top-k (offset + limit), без полной сортировки.
+
+    Курсор (search-after) хранит поля, направления, типы и ключ последней строки
+    страницы: следующая страница — строки строго после него, глубокая страница
+    не требует ранжировать всё, что было до неё. Типы из курсора переиспользуются,
+    чтобы порядок не менялся между страницами.
+    """
+
+    def __init__(
+        self,
+        spec: List[Tuple[str, str]],
+        field_meta: Dict[str, Any],
+        cursor: str | None = None,
+    ) -> None:
+        self.spec = spec
+        self.field_meta = field_meta
+        self.types: List[str] | None = None
+        self.after: Tuple[Tuple[Any, ...], int] | None = None
+        self._resolvers = [_compile_value_resolver(field) for field, _ in spec]
+        if cursor:
+            self._decode_cursor(cursor)
+
+    def _decode_cursor(self, cursor: str) -> None:
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            fields = [(str(field), str(direction)) for field, direction, _ in state["sort"]]
+            types = [str(field_type) for _, _, field_type in state["sort"]]
+            components = [tuple(component) for component in state["key"]]
+            ordinal = int(state["row"])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise ValueError("Invalid details cursor") from None
+        if fields != self.spec or len(components) != len(fields):
+            raise ValueError("Details cursor does not match sort")
+        self.types = types
+        self.after = (self._key_from_components(components), ordinal)
+
+    def values(self, record: Dict[str, Any]) -> List[Any]:
+        return [resolve(record) for resolve in self._resolvers]
+
+    def resolve_types(self, samples: List[List[Any]]) -> None:
+        """Типы полей по fieldMeta или по выборке значений (если курсор их ещё не задал)."""
+        if self.types is not None:
+            return
+        self.types = [
+            _resolve_meta_type(self.field_meta, field, [values[position] for values in samples])[0]
+            for position, (field, _) in enumerate(self.spec)
+        ]
+
+    def _components(self, values: List[Any]) -> List[Tuple[int, int, Any]]:
+        return [_sort_component(value, field_type) for value, field_type in zip(values, self.types)]
+
+    def _key_from_components(self, components: List[Tuple[int, int, Any]]) -> Tuple[Any, ...]:
+        return tuple(_directed(component, direction) for component, (_, direction) in zip(components, self.spec))
+
+    def key(self, values: List[Any]) -> Tuple[Any, ...]:
+        return self._key_from_components(self._components(values))
+
+    def candidates(self, records: Iterable[Dict[str, Any]], start: int = 0) -> Iterator[Tuple[Any, ...]]:
+        """(key, ordinal, values, record) для строк после курсора; ordinal — номер строки от start."""
+        for ordinal, record in enumerate(records, start):
+            values = self.values(record)
+            key = self.key(values)
+            if self.after is None or (key, ordinal) > self.after:
+                yield key, ordinal, values, record
+
+    def select(self, candidates: Iterable[Tuple[Any, ...]], needed: int) -> List[Tuple[Any, ...]]:
+        # ordinal уникален, поэтому кортежи сравниваются только по (key, ordinal)
+        return heapq.nsmallest(needed, candidates)
+
+    def encode_cursor(self, values: List[Any], ordinal: int) -> str:
+        state = {
+            "sort": [[field, direction, field_type] for (field, direction), field_type in zip(self.spec, self.types)],
+            "key": [list(component) for component in self._components(values)],
+            "row": ordinal,
+        }
+        return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [
+            {"field": field, "direction": direction, "type": field_type}
+            for (field, direction), field_type in zip(self.spec, self.types or ["string"] * len(self.spec))
+        ]
+
+
+def build_detail_sort(payload: Dict[str, Any], field_meta: Dict[str, Any]) -> DetailSort | None:
+    """DetailSort по sort и cursor запроса; None — sort не задан. Ошибки — ValueError."""
+    spec = resolve_detail_sort(payload)
+    cursor = payload.get("cursor")
+    if not spec:
+        if cursor:
+            raise ValueError("cursor requires sort")
+        return None
+    if cursor is not None and not isinstance(cursor, str):
+        raise ValueError("Invalid details cursor")
+    return DetailSort(spec, field_meta, cursor)
+
+
+def _sorted_page(
+    detail_sort: DetailSort,
+    candidates: Iterable[Tuple[Any, ...]],
+    offset: int,
+    limit: int,
+) -> Tuple[List[Dict[str, Any]], bool, str | None]:
+    """
+    Страница из кандидатов DetailSort.candidates: записи страницы, hasMore
+    и nextCursor (ключ последней строки страницы).
+    """
+    selected = detail_sort.select(candidates, offset + limit + 1)
+    page = selected[offset : offset + limit]
+    has_more = len(selected) > offset + limit
+    next_cursor = None
+    if has_more and page:
+        last = page[-1]
+        next_cursor = detail_sort.encode_cursor(last[2], last[1])
+    return [item[3] for item in page], has_more, next_cursor
+
+
+class DetailsCollector:
+    """
+    Потоковая детализация: строки после join и фильтров проверяются на ограничения
+    ячейки и detailMetricFilter по мере поступления, в памяти остаются только
+    строки страницы [offset, offset + limit). Когда результат набран, update
+    бросает StopChunks: estimate — сразу после страницы (и одной строки для hasMore),
+    total оценивается по доле совпадений среди прочитанных записей; capped — после
+    max(total_cap, offset + limit) совпадений; exact — источник читается до конца.
+    С sort источник всегда читается до конца (total exact): в памяти — кандидаты
+    top-k, периодически урезаемые heap-отбором до offset + limit + 1.
+    """
+
+    def __init__(
+        self,
+        snapshot: Snapshot | Dict[str, Any],
+        payload: Dict[str, Any],
+        limit: int = 200,
+        offset: int = 0,
+        total_mode: str = "exact",
+        total_cap: int = 0,
+    ) -> None:
+        self.snapshot_dict = _snapshot_to_dict(snapshot)
+        cell_constraints = _resolve_cell_constraints(payload)
+        metric = payload.get("metric") if isinstance(payload.get("metric"), dict) else None
+        detail_fields = payload.get("detailFields") if isinstance(payload.get("detailFields"), list) else None
+        self.offset = max(offset, 0)
+        self.limit = limit if limit > 0 else 200
+        self.total_mode = total_mode
+        self.fields = _build_detail_fields(self.snapshot_dict, metric, detail_fields)
+        self._row_constraints = (cell_constraints.get("rowFields") or [], cell_constraints.get("rowValues") or [])
+        self._column_constraints = (
+            cell_constraints.get("columnFields") or [],
+            cell_constraints.get("columnValues") or [],
+        )
+        self._metric_filters = _normalize_detail_metric_filters(payload.get("detailMetricFilter"))
+        self._field_meta = self.snapshot_dict.get("fieldMeta") or {}
+        self.sort = build_detail_sort(payload, self._field_meta)
+        # строки до определения типов полей сортировки и отобранные кандидаты страницы
+        self._pending: List[Dict[str, Any]] = []
+        self._candidates: List[Tuple[Any, ...]] = []
+        page_end = self.offset + self.limit
+        if self.sort is not None:
+            self.stop_after = None
+        elif total_mode == "estimate":
+            self.stop_after: int | None = page_end
+        elif total_mode == "capped":
+            self.stop_after = max(total_cap, page_end)
+        else:
+            self.stop_after = None
+        self.matched = 0
+        self.stopped = False
+        self.entries: List[Dict[str, Any]] = []
+
+    def _matches(self, record: Dict[str, Any]) -> bool:
+        return (
+            _matches_constraints(record, *self._row_constraints)
+            and _matches_constraints(record, *self._column_constraints)
+            and (
+                not self._metric_filters
+                or _record_passes_detail_metric_filters(record, self._metric_filters, self._field_meta)
+            )
+        )
+
+    def field_labels(self) -> List[str]:
+        return [entry["label"] for entry in _build_field_meta(self.fields, [], self.snapshot_dict)]
+
+    def iter_rows(self, records: Iterable[Dict[str, Any]]) -> Iterator[List[Any]]:
+        """Значения полей детализации для всех подходящих строк, без пагинации (экспорт)."""
+        fields = self.fields
+        for record in records:
+            if self._matches(record):
+                self.matched += 1
+                yield [_resolve_record_value(record, field) for field in fields]
+
+    def _update_sorted(self, records: Iterable[Dict[str, Any]]) -> None:
+        matched = [record for record in records if self._matches(record)]
+        start = self.matched
+        self.matched += len(matched)
+        if self.sort.types is not None:
+            self._add_candidates(matched, start)
+            return
+        self._pending.extend(matched)
+        if len(self._pending) >= _SORT_TYPE_SAMPLE:
+            self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        pending, self._pending = self._pending, []
+        self.sort.resolve_types([self.sort.values(record) for record in pending[:_SORT_TYPE_SAMPLE]])
+        self._add_candidates(pending, self.matched - len(pending))
+
+    def _add_candidates(self, records: List[Dict[str, Any]], start: int) -> None:
+        needed = self.offset + self.limit + 1
+        self._candidates.extend(self.sort.candidates(records, start))
+        if len(self._candidates) > max(2 * needed, _SORT_TYPE_SAMPLE):
+            self._candidates = self.sort.select(self._candidates, needed)
+
+    def update(self, records: Iterable[Dict[str, Any]]) -> None:
+        if self.sort is not None:
+            self._update_sorted(records)
+            return
+        page_end = self.offset + self.limit
+        for record in records:
+            if not self._matches(record):
+                continue
+            if self.offset <= self.matched < page_end:
+                self.entries.append({field: _resolve_record_value(record, field) for field in self.fields})
+            self.matched += 1
+            if self.stop_after is not None and self.matched > self.stop_after:
+                self.stopped = True
+                raise StopChunks()
+
+    def result(self, records_read: int, records_received: int, records_total: int | None = None) -> Dict[str, Any]:
+        """
+        Ответ в формате build_details. records_read — записи источника, прошедшие
+        через update, records_received — записи, уже полученные от upstream,
+        records_total — размер источника, если он известен. Без него оценка
+        estimate строится только по полученным записям и возвращается как lowerBound.
+        """
+        total_mode = "exact"
+        total = self.matched
+        has_more = self.matched > self.offset + self.limit
+        next_cursor = None
+        if self.sort is not None:
+            if self.sort.types is None:
+                self._flush_pending()
+            records, has_more, next_cursor = _sorted_page(self.sort, self._candidates, self.offset, self.limit)
+            self.entries = [{field: _resolve_record_value(record, field) for field in self.fields} for record in records]
+        elif self.stopped and self.total_mode == "capped":
+            total_mode = "capped"
+            total = self.stop_after
+        elif self.stopped:
+            total_mode = "estimated" if records_total is not None else "lowerBound"
+            scale = max(records_total or 0, records_received, records_read)
+            if records_read:
+                total = max(total, round(self.matched * scale / records_read))
+        response = {
+            "total": total,
+            "totalMode": total_mode,
+            "hasMore": has_more,
+            "limit": self.limit,
+            "offset": self.offset,
+            "fields": _build_field_meta(self.fields, self.entries, self.snapshot_dict),
+            "entries": self.entries,
+        }
+        if self.sort is not None:
+            response["sort"] = self.sort.describe()
+            response["nextCursor"] = next_cursor
+        return response
+
+
 def build_details(
     records: List[Dict[str, Any]],
     snapshot: Snapshot | Dict[str, Any],
@@ -321,26 +740,51 @@ def build_details(
     limit: int = 200,
     offset: int = 0,
     debug: bool = False,
+    index: RecordIndex | None = None,
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     snapshot_dict = _snapshot_to_dict(snapshot)
     cell_constraints = _resolve_cell_constraints(payload)
     metric = payload.get("metric") if isinstance(payload.get("metric"), dict) else None
     detail_fields = payload.get("detailFields") if isinstance(payload.get("detailFields"), list) else None
     detail_metric_filters = _normalize_detail_metric_filters(payload.get("detailMetricFilter"))
-
-    filtered_records, filter_debug = apply_filters(records, snapshot, filters)
+    detail_sort = build_detail_sort(payload, snapshot_dict.get("fieldMeta") or {})
 
     row_fields = cell_constraints.get("rowFields") or []
     row_values = cell_constraints.get("rowValues") or []
     column_fields = cell_constraints.get("columnFields") or []
     column_values = cell_constraints.get("columnValues") or []
 
-    constrained_records = [
-        record
-        for record in filtered_records
-        if _matches_constraints(record, row_fields, row_values)
-        and _matches_constraints(record, column_fields, column_values)
-    ]
+    constraints_mask = within = None
+    if index is not None:
+        constraints_mask = _cell_constraints_bitmap(index, snapshot_dict, cell_constraints)
+        # без debug фильтры проверяются только по строкам ячейки
+        within = constraints_mask if not debug else None
+        positions, filter_debug = filter_record_positions(
+            records,
+            compile_record_filter(snapshot, filters),
+            index,
+            within=within,
+        )
+        filtered_records = [records[position] for position in positions]
+    else:
+        filtered_records, filter_debug = apply_filters(records, snapshot, filters)
+
+    if within is not None:
+        constrained_records = filtered_records
+    elif constraints_mask is not None:
+        mask_bytes = bitmap_bytes(constraints_mask, index.size)
+        constrained_records = [
+            records[position]
+            for position in positions
+            if mask_bytes[position >> 3] >> (position & 7) & 1
+        ]
+    else:
+        constrained_records = [
+            record
+            for record in filtered_records
+            if _matches_constraints(record, row_fields, row_values)
+            and _matches_constraints(record, column_fields, column_values)
+        ]
     field_meta = snapshot_dict.get("fieldMeta") or {}
     detail_filtered_records = (
         [
@@ -357,7 +801,20 @@ def build_details(
         offset = 0
     if limit <= 0:
         limit = 200
-    paged = detail_filtered_records[offset : offset + limit]
+    has_more = total > offset + limit
+    next_cursor = None
+    if detail_sort is not None:
+        detail_sort.resolve_types(
+            [detail_sort.values(record) for record in detail_filtered_records[:_SORT_TYPE_SAMPLE]]
+        )
+        paged, has_more, next_cursor = _sorted_page(
+            detail_sort,
+            detail_sort.candidates(detail_filtered_records),
+            offset,
+            limit,
+        )
+    else:
+        paged = detail_filtered_records[offset : offset + limit]
 
     fields = _build_detail_fields(snapshot_dict, metric, detail_fields)
     entries = [
@@ -367,11 +824,16 @@ def build_details(
 
     response = {
         "total": total,
+        "totalMode": "exact",
+        "hasMore": has_more,
         "limit": limit,
         "offset": offset,
         "fields": _build_field_meta(fields, entries, snapshot_dict),
         "entries": entries,
     }
+    if detail_sort is not None:
+        response["sort"] = detail_sort.describe()
+        response["nextCursor"] = next_cursor
 
     debug_payload: Dict[str, Any] = {}
     if debug:
@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+import math
+import re
+import zipfile
+from typing import Any, Dict, Iterable, List
+from xml.sax.saxutils import escape
+
+from app.services import pivot_core
+from app.services.filter_service import _resolve_field_label
+
+EXPORT_FORMATS = ("csv", "xlsx")
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# строк в одной порции ответа: после каждой порции готовые байты уходят клиенту
+EXPORT_BATCH_ROWS = 1000
+
+# предел строк листа Excel (включая заголовок)
+XLSX_MAX_ROWS = 1_048_576
+
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# первые символы, с которых Excel и другие табличные редакторы читают ячейку CSV как формулу
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+_XLSX_STATIC_PARTS = (
+    (
+        "[Content_Types].xml",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>",
+    ),
+    (
+        "_rels/.rels",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>",
+    ),
+    (
+        "xl/workbook.xml",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Report" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>",
+    ),
+    (
+        "xl/_rels/workbook.xml.rels",
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>",
+    ),
+)
+
+
+def resolve_export_format(value: str | None) -> str:
+    """Формат экспорта: csv (по умолчанию) или xlsx; иначе ValueError (422)."""
+    export_format = (value or "csv").strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {value}")
+    return export_format
+
+
+def _text_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return str(value)
+
+
+def _csv_text_value(value: Any) -> str:
+    """
+    Значение поля CSV. Текст, который табличный редактор выполнил бы как формулу
+    (CSV injection), получает префикс "'"; числа, в том числе записанные строкой, не меняются.
+    """
+    text = _text_value(value)
+    if not isinstance(value, str) or not text.startswith(_FORMULA_PREFIXES):
+        return text
+    try:
+        float(text)
+    except ValueError:
+        return "'" + text
+    return text
+
+
+class CsvExportWriter:
+    """CSV порциями: UTF-8 с BOM (для Excel), пустые значения — пустые поля, текст-формулы экранированы."""
+
+    def __init__(self) -> None:
+        self.rows_written = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self, labels: List[str]) -> bytes:
+        self._writer.writerow([_csv_text_value(label) for label in labels])
+        return "\ufeff".encode("utf-8") + self._drain()
+
+    def write_rows(self, rows: Iterable[List[Any]]) -> bytes:
+        writerow = self._writer.writerow
+        for row in rows:
+            writerow([_csv_text_value(value) for value in row])
+            self.rows_written += 1
+        return self._drain()
+
+    def close(self) -> bytes:
+        return b""
+
+
+class _ZipSink:
+    """Файл только на запись для zipfile: сжатые байты копятся до следующей порции ответа."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class XlsxExportWriter:
+    """
+    Потоковый XLSX без сторонних пакетов: zip пишется в поток без seek
+    (data descriptor после каждого файла), лист — inline-строками без таблицы
+    shared strings, поэтому строки не копятся в памяти и уходят клиенту
+    по мере сжатия. Текст пишется только inline-строкой (не формулой), поэтому
+    значения вида "=..." Excel не выполняет. Строки сверх предела листа Excel
+    отбрасываются (truncated).
+    """
+
+    def __init__(self) -> None:
+        self.rows_written = 0
+        self.truncated = False
+        self._sheet_rows = 0
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+        for name, content in _XLSX_STATIC_PARTS:
+            self._zip.writestr(name, content)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+
+    @staticmethod
+    def _cell(value: Any) -> str:
+        if isinstance(value, bool):
+            return f'<c t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            return f"<c><v>{value!r}</v></c>"
+        text = _text_value(value)
+        if not text:
+            return "<c/>"
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", text))}</t></is></c>'
+
+    def _write(self, rows: Iterable[List[Any]]) -> int:
+        parts: List[str] = []
+        cell = self._cell
+        for row in rows:
+            if self._sheet_rows >= XLSX_MAX_ROWS:
+                self.truncated = True
+                break
+            parts.append("<row>" + "".join(cell(value) for value in row) + "</row>")
+            self._sheet_rows += 1
+        if parts:
+            self._sheet.write("".join(parts).encode("utf-8"))
+        return len(parts)
+
+    def header(self, labels: List[str]) -> bytes:
+        self._write([labels])
+        return self._sink.drain()
+
+    def write_rows(self, rows: Iterable[List[Any]]) -> bytes:
+        self.rows_written += self._write(rows)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+        return self._sink.drain()
+
+
+def create_export_writer(export_format: str) -> CsvExportWriter | XlsxExportWriter:
+    return XlsxExportWriter() if export_format == "xlsx" else CsvExportWriter()
+
+
+def pivot_export_header(snapshot_dict: Dict[str, Any], columns: List[Dict[str, Any]]) -> List[str]:
+    """Заголовок выгрузки pivot: подписи полей строк, затем подписи колонок view."""
+    pivot = snapshot_dict.get("pivot") or {}
+    row_fields = pivot.get("rows") or []
+    header_overrides = (snapshot_dict.get("options") or {}).get("headerOverrides") or {}
+    field_meta = snapshot_dict.get("fieldMeta") or {}
+    filters_meta = snapshot_dict.get("filtersMeta") or []
+    labels = [_resolve_field_label(field, header_overrides, field_meta, filters_meta) for field in row_fields]
+    return (labels or [""]) + [column.get("label") or column.get("key") for column in columns]
+
+
+def pivot_export_row(row: Dict[str, Any], has_row_fields: bool) -> List[Any]:
+    if has_row_fields:
+        values = [pivot_core.OTHER_LABEL if pivot_core._is_other_value(value) else value for value in row.get("values") or []]
+    else:
+        values = [row.get("label")]
+    return values + [cell.get("value") for cell in row.get("cells") or []]
+
+
+def pivot_export_totals_row(row: Dict[str, Any], row_field_count: int) -> List[Any]:
+    """Строка итогов: подпись в первой колонке полей строк, остальные поля пустые."""
+    return [row.get("label")] + [None] * (max(row_field_count, 1) - 1) + [cell.get("value") for cell in row.get("cells") or []]
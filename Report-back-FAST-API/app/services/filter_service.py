@@ -1,5 +1,10 @@
+import hashlib
+import heapq
 import json
-from typing import Any, Dict, Iterable, List, Tuple
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
 
 from app.models.filters import Filters, FilterValue
 from app.models.snapshot import Snapshot
@@ -9,6 +14,14 @@ from app.services.date_utils import (
     parse_date_part_key,
     resolve_date_part_value,
 )
+from app.services.record_index import (
+    RecordIndex,
+    ValueDictionary,
+    bitmap_bytes,
+    bitmap_from_positions,
+    bitmap_positions,
+)
+from app.services.sketches import FrequentItems
 
 DATE_PART_LABELS = {
     "year": "Год",
@@ -29,6 +42,10 @@ SYSTEM_FILTER_KEYS = {
     "idUpdatedAt",
 }
 
+FILTER_OPTION_MATCH_MODES = ("prefix", "contains")
+# верхняя граница размера страницы typeahead-опций
+FILTER_OPTION_PAGE_MAX = 1000
+
 
 def _snapshot_to_dict(snapshot: Snapshot | Dict[str, Any]) -> Dict[str, Any]:
     if hasattr(snapshot, "model_dump"):
@@ -330,7 +347,7 @@ def _resolve_field_label(
     return str(base_label)
 
 
-def _sort_filter_values(values: List[Any], field_type: str) -> List[Any]:
+def _filter_value_sort_key(field_type: str) -> Callable[[Any], Any]:
     def sort_key(value: Any) -> Any:
         if field_type == "number":
             num = _to_number(value)
@@ -340,39 +357,11 @@ def _sort_filter_values(values: List[Any], field_type: str) -> List[Any]:
             return (0, ms) if ms is not None else (1, str(value))
         return str(value).casefold()
 
-    return sorted(values, key=sort_key)
+    return sort_key
 
 
-def _record_passes_filters(
-    record: Dict[str, Any],
-    filter_keys: Iterable[str],
-    values_map: Dict[str, Dict[str, Any] | None],
-    ranges_map: Dict[str, Dict[str, Any] | None],
-    modes_map: Dict[str, str | None],
-    field_meta: Dict[str, Any],
-    exclude_key: str | None = None,
-) -> bool:
-    for key in filter_keys:
-        if exclude_key and key == exclude_key:
-            continue
-        mode = modes_map.get(key)
-        values = values_map.get(key)
-        ranges = ranges_map.get(key)
-        if mode == "values":
-            ranges = None
-        elif mode == "ranges":
-            values = None
-        if key and DATE_PART_MARKER in key:
-            ranges = None
-
-        if not values and not ranges:
-            continue
-        value = _resolve_record_value(record, key)
-        if values and not _passes_values_filter(value, values):
-            return False
-        if ranges and not _passes_range_filter(value, ranges, field_meta, key):
-            return False
-    return True
+def _sort_filter_values(values: List[Any], field_type: str) -> List[Any]:
+    return sorted(values, key=_filter_value_sort_key(field_type))
 
 
 def _determine_filter_keys(snapshot_dict: Dict[str, Any]) -> List[str]:
@@ -459,57 +448,400 @@ def _resolve_filter_keys(snapshot_dict: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+class FilterOptionsCounter:
+    """
+    Счётчики каскадных опций, накапливаемые по чанкам записей (update). Для записи
+    считается битовая маска ключей, чьи фильтры она не прошла; запись входит в опции
+    ключа k, если маска пуста или равна биту k (то есть «все фильтры, кроме k»).
+    После второго несработавшего ключа проверки записи прекращаются.
+
+    max_values > 0 ограничивает память потокового режима: ключ, у которого различных
+    значений стало больше max_values, переводится на heavy-hitters скетч
+    (FrequentItems на sketch_capacity счётчиков) — в опции попадают самые частые
+    значения с нижней оценкой счётчика (approximate_keys). Выбранные в фильтре
+    значения таких ключей считаются точно, чтобы отличать отсутствующие в данных
+    (selectedPruned) от вытесненных скетчем (selectedUnlisted).
+    """
+
+    def __init__(
+        self,
+        snapshot: Snapshot | Dict[str, Any],
+        filters: Filters | Dict[str, Any] | None,
+        filter_keys: List[str] | None = None,
+        max_values: int = 0,
+        sketch_capacity: int = 0,
+    ) -> None:
+        self.snapshot_dict = _snapshot_to_dict(snapshot)
+        self.filters = filters
+        self.keys_info = _resolve_filter_keys(self.snapshot_dict)
+        self.keys = filter_keys or self.keys_info["used"]
+        self.plan = compile_record_filter(self.snapshot_dict, filters)
+        self.max_values = max_values
+        self.sketch_capacity = sketch_capacity or max_values
+        option_keys = _unique_preserve_order(list(self.keys))
+        group_bits: Dict[str, int] = {}
+        checks = []
+        for key, _, resolve, passes, _ in self.plan._checks:
+            bit = group_bits.setdefault(key, 1 << len(group_bits))
+            checks.append((bit, resolve, passes))
+        self._checks = checks
+        resolvers = {key: _compile_value_resolver(key) for key in option_keys}
+        self.counts_by_key: Dict[str, Dict[str, Dict[str, Any]]] = {key: {} for key in option_keys}
+        # для каждой маски отказов — ключи опций, в которые попадает запись
+        self._targets_all = [(key, resolvers[key], self.counts_by_key[key]) for key in option_keys]
+        self._targets_by_bit = {
+            bit: [(key, resolvers[key], self.counts_by_key[key]) for key in option_keys if group_bits.get(key) == bit]
+            for bit in group_bits.values()
+        }
+        self._sketches: Dict[str, FrequentItems] = {}
+        self._sketch_entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        values_map, _, _ = _merge_filters(self.snapshot_dict, filters)
+        self._selected: Dict[str, set[str]] = {}
+        for key in option_keys:
+            items = (values_map.get(key) or {}).get("items") or []
+            if items:
+                self._selected[key] = {_normalize_filter_value(item) for item in items}
+        # точные счётчики выбранных значений для ключей на скетче
+        self._selected_entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    @property
+    def approximate_keys(self) -> List[str]:
+        return list(self._sketches)
+
+    def update(self, records: Iterable[Dict[str, Any]]) -> None:
+        checks = self._checks
+        targets_all = self._targets_all
+        targets_by_bit = self._targets_by_bit
+        for record in records:
+            failed = 0
+            for bit, resolve, passes in checks:
+                if failed & bit:
+                    continue
+                if not passes(resolve(record)):
+                    failed |= bit
+                    if failed & (failed - 1):
+                        break
+            if failed == 0:
+                targets = targets_all
+            else:
+                targets = targets_by_bit.get(failed)
+                if not targets:
+                    continue
+            for _, resolve, counts in targets:
+                _option_entry(counts, resolve(record))["count"] += 1
+        if self.max_values:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Переносит счётчики чанка в скетч для ключей, превысивших max_values."""
+        for key, counts in self.counts_by_key.items():
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                if len(counts) <= self.max_values:
+                    continue
+                sketch = self._sketches[key] = FrequentItems(self.sketch_capacity)
+                self._sketch_entries[key] = {}
+            entries = self._sketch_entries[key]
+            selected = self._selected.get(key)
+            if selected:
+                exact = self._selected_entries.setdefault(key, {})
+                for normalized in selected:
+                    entry = counts.get(normalized)
+                    if entry:
+                        exact.setdefault(normalized, {**entry, "count": 0})["count"] += entry["count"]
+            for normalized, entry in counts.items():
+                sketch.add(normalized, entry["count"])
+                if normalized not in entries:
+                    entries[normalized] = {name: value for name, value in entry.items() if name != "count"}
+            # словари чанка очищаются на месте: на них ссылаются цели update
+            counts.clear()
+            if len(entries) > 2 * sketch.capacity:
+                self._sketch_entries[key] = {
+                    normalized: entry for normalized, entry in entries.items() if sketch.lower_bound(normalized) > 0
+                }
+
+    def counts(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        result = dict(self.counts_by_key)
+        for key, sketch in self._sketches.items():
+            counts: Dict[str, Dict[str, Any]] = {}
+            for normalized, entry in self._sketch_entries[key].items():
+                count = int(sketch.lower_bound(normalized))
+                if count > 0:
+                    counts[normalized] = {**entry, "count": count}
+            for normalized, entry in self._selected_entries.get(key, {}).items():
+                counts[normalized] = dict(entry)
+            result[key] = counts
+        return result
+
+    def result(
+        self,
+        max_unique: int = 200,
+        counts_by_key: Dict[str, Dict[str, Dict[str, Any]]] | None = None,
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, Any]], Dict[str, bool], Dict[str, List[Any]], Dict[str, Any]]:
+        """Опции в формате collect_filter_options по накопленным (или переданным) счётчикам."""
+        return _filter_options_result(
+            self.snapshot_dict,
+            self.filters,
+            self.keys_info,
+            self.keys,
+            counts_by_key if counts_by_key is not None else self.counts(),
+            max_unique,
+            self.approximate_keys,
+        )
+
+
+def _option_entry(counts: Dict[str, Dict[str, Any]], value: Any) -> Dict[str, Any]:
+    value = _format_filter_option_value(value)
+    normalized = _normalize_filter_value(value)
+    entry = counts.get(normalized)
+    if not entry:
+        entry = {"value": value, "count": 0}
+        if value == "__BLANK__":
+            entry["label"] = "(Blank)"
+        counts[normalized] = entry
+    return entry
+
+
+def _count_values_in_mask(
+    records: List[Dict[str, Any]],
+    index: RecordIndex,
+    key: str,
+    mask: int,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Счётчики значений ключа по строкам маски через индекс. Порядок значений —
+    по первой строке маски, как при последовательном проходе; представитель
+    значения берётся из этой же строки.
+    """
+    resolve = _compile_value_resolver(key)
+    counts: Dict[str, Dict[str, Any]] = {}
+    postings = _index_postings(index, key, resolve)
+    if postings is None:
+        for position in bitmap_positions(mask):
+            _option_entry(counts, resolve(records[position]))["count"] += 1
+        return counts
+    mask_bytes = bitmap_bytes(mask, index.size)
+    found: List[Tuple[int, int]] = []
+    for rows in postings.values():
+        if isinstance(rows, int):
+            bits = rows & mask
+            if not bits:
+                continue
+            found.append(((bits & -bits).bit_length() - 1, bits.bit_count()))
+            continue
+        first = -1
+        count = 0
+        for position in rows:
+            if mask_bytes[position >> 3] >> (position & 7) & 1:
+                if first < 0:
+                    first = position
+                count += 1
+        if count:
+            found.append((first, count))
+    found.sort()
+    for first, count in found:
+        _option_entry(counts, resolve(records[first]))["count"] += count
+    return counts
+
+
+def _count_filter_options_indexed(
+    records: List[Dict[str, Any]],
+    plan: "RecordFilter",
+    keys: List[str],
+    index: RecordIndex,
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Каскадные опции по индексу: битмап прохождения фильтров каждого ключа,
+    маска «все, кроме k» — из префиксных и суффиксных AND, счётчики — по маске.
+    """
+    group_masks: Dict[str, int] = {}
+    for check in plan._checks:
+        key = check[0]
+        group_masks[key] = group_masks.get(key, index.all_rows) & _check_bitmap(records, index, check)
+    group_keys = list(group_masks)
+    prefix = [index.all_rows]
+    for key in group_keys:
+        prefix.append(prefix[-1] & group_masks[key])
+    suffix = [index.all_rows]
+    for key in reversed(group_keys):
+        suffix.append(suffix[-1] & group_masks[key])
+    suffix.reverse()
+    except_masks = {key: prefix[idx] & suffix[idx + 1] for idx, key in enumerate(group_keys)}
+    return {
+        key: _count_values_in_mask(records, index, key, except_masks.get(key, prefix[-1]))
+        for key in _unique_preserve_order(list(keys))
+    }
+
+
+def _cascade_positions(
+    records: List[Dict[str, Any]],
+    plan: "RecordFilter",
+    key: str,
+    index: RecordIndex | None,
+) -> List[int] | None:
+    """Строки, прошедшие все фильтры, кроме фильтров key; None — таких фильтров нет."""
+    checks = [check for check in plan._checks if check[0] != key]
+    if not checks:
+        return None
+    if index is None:
+        return [
+            position
+            for position, record in enumerate(records)
+            if all(passes(resolve(record)) for _, _, resolve, passes, _ in checks)
+        ]
+    mask = index.all_rows
+    for check in checks:
+        mask &= _check_bitmap(records, index, check)
+        if not mask:
+            break
+    return bitmap_positions(mask)
+
+
+def _build_value_dictionary(
+    records: List[Dict[str, Any]],
+    key: str,
+    field_meta: Dict[str, Any],
+) -> ValueDictionary:
+    """Различные значения key в порядке опций (_sort_filter_values) и номер значения каждой строки."""
+    resolve = _compile_value_resolver(key)
+    ids: Dict[str, int] = {}
+    values: List[Any] = []
+    row_ids = array("I")
+    for record in records:
+        value = _format_filter_option_value(resolve(record))
+        normalized = _normalize_filter_value(value)
+        value_id = ids.get(normalized)
+        if value_id is None:
+            value_id = ids[normalized] = len(values)
+            values.append(value)
+        row_ids.append(value_id)
+    field_type, _ = _resolve_meta_type(field_meta, key, values)
+    sort_key = _filter_value_sort_key(field_type)
+    order = sorted(range(len(values)), key=lambda value_id: sort_key(values[value_id]))
+    ranks = [0] * len(values)
+    for rank, value_id in enumerate(order):
+        ranks[value_id] = rank
+    ordinals = array("I", [ranks[value_id] for value_id in row_ids])
+    return ValueDictionary([values[value_id] for value_id in order], ordinals, field_type)
+
+
+def collect_filter_option_page(
+    records: List[Dict[str, Any]],
+    snapshot: Snapshot | Dict[str, Any],
+    filters: Filters | Dict[str, Any] | None,
+    key: str,
+    query: str | None = None,
+    match: str = "prefix",
+    cursor: int = 0,
+    limit: int = 50,
+    index: RecordIndex | None = None,
+) -> Dict[str, Any]:
+    """
+    Страница опций одного ключа для typeahead: значения в порядке collect_filter_options,
+    отобранные по подстроке query (prefix/contains, без учёта регистра), со счётчиками
+    по каскадной маске «все фильтры, кроме key». cursor — позиция в словаре значений,
+    nextCursor — начало следующей страницы (None — страниц больше нет).
+    Словарь значений кэшируется в индексе записи кэша; без индекса строится на запрос.
+    """
+    if not key:
+        raise ValueError("Filter key is required")
+    if match not in FILTER_OPTION_MATCH_MODES:
+        raise ValueError(f"Unsupported match mode: {match}")
+    if cursor < 0 or limit <= 0:
+        raise ValueError("cursor must be >= 0 and limit must be > 0")
+    limit = min(limit, FILTER_OPTION_PAGE_MAX)
+    snapshot_dict = _snapshot_to_dict(snapshot)
+    field_meta = snapshot_dict.get("fieldMeta") or {}
+    header_overrides = (snapshot_dict.get("options") or {}).get("headerOverrides") or {}
+    filters_meta = snapshot_dict.get("filtersMeta") or []
+
+    def build(source: List[Dict[str, Any]]) -> ValueDictionary:
+        return _build_value_dictionary(source, key, field_meta)
+
+    dictionary = None
+    if index is not None:
+        dictionary = index.value_dictionary(key, _resolve_field_type_from_meta(field_meta, key), build)
+    if dictionary is None:
+        dictionary = build(records)
+
+    plan = compile_record_filter(snapshot_dict, filters)
+    counts = dictionary.counts(_cascade_positions(records, plan, key, index))
+    needle = (query or "").casefold()
+    prefix = match == "prefix"
+    start = max(cursor, dictionary.prefix_start(needle)) if prefix else cursor
+
+    options: List[Dict[str, Any]] = []
+    next_cursor = None
+    for ordinal in range(start, len(dictionary)):
+        if needle:
+            text = dictionary.texts[ordinal]
+            if prefix and not text.startswith(needle):
+                if dictionary.text_sorted:
+                    break
+                continue
+            if not prefix and needle not in text:
+                continue
+        count = counts[ordinal]
+        if not count:
+            continue
+        if len(options) >= limit:
+            next_cursor = ordinal
+            break
+        value = dictionary.values[ordinal]
+        option = {"value": value, "count": count}
+        if value == "__BLANK__":
+            option["label"] = "(Blank)"
+        options.append(option)
+
+    label = _resolve_field_label(key, header_overrides, field_meta, filters_meta)
+    return {
+        "key": key,
+        "options": options,
+        "meta": {"type": dictionary.field_type, "label": label or key},
+        "nextCursor": next_cursor,
+        "distinctValues": len(dictionary),
+    }
+
+
 def collect_filter_options(
     records: List[Dict[str, Any]],
     snapshot: Snapshot | Dict[str, Any],
     filters: Filters | Dict[str, Any] | None,
     max_unique: int = 200,
     filter_keys: List[str] | None = None,
+    index: RecordIndex | None = None,
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, Any]], Dict[str, bool], Dict[str, List[Any]], Dict[str, Any]]:
+    counter = FilterOptionsCounter(snapshot, filters, filter_keys)
+    if index is not None:
+        return counter.result(max_unique, _count_filter_options_indexed(records, counter.plan, counter.keys, index))
+    counter.update(records)
+    return counter.result(max_unique)
+
+
+def _filter_options_result(
+    snapshot_dict: Dict[str, Any],
+    filters: Filters | Dict[str, Any] | None,
+    keys_info: Dict[str, Any],
+    keys: List[str],
+    counts_by_key: Dict[str, Dict[str, Dict[str, Any]]],
+    max_unique: int,
+    approximate_keys: List[str],
 ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, Any]], Dict[str, bool], Dict[str, List[Any]], Dict[str, Any]]:
-    snapshot_dict = _snapshot_to_dict(snapshot)
     field_meta = snapshot_dict.get("fieldMeta") or {}
     header_overrides = (snapshot_dict.get("options") or {}).get("headerOverrides") or {}
     filters_meta = snapshot_dict.get("filtersMeta") or []
 
     values_map, ranges_map, modes_map = _merge_filters(snapshot_dict, filters)
-    normalized_values_map = _normalize_values_selection_map(values_map)
-    keys_info = _resolve_filter_keys(snapshot_dict)
-    keys = filter_keys or keys_info["used"]
-
-    all_filter_keys = set(values_map.keys()) | set(ranges_map.keys()) | set(keys)
 
     options_result: Dict[str, List[Dict[str, Any]]] = {}
     meta_result: Dict[str, Dict[str, Any]] = {}
     truncated_result: Dict[str, bool] = {}
     selected_pruned: Dict[str, List[Any]] = {}
+    selected_unlisted: Dict[str, List[Any]] = {}
     meta_type_source: Dict[str, str] = {}
 
     for key in keys:
-        filtered_records = [
-            record
-            for record in records
-            if _record_passes_filters(
-                record,
-                all_filter_keys,
-                normalized_values_map,
-                ranges_map,
-                modes_map,
-                field_meta,
-                exclude_key=key,
-            )
-        ]
-        counts: Dict[str, Dict[str, Any]] = {}
-        for record in filtered_records:
-            value = _resolve_record_value(record, key)
-            value = _format_filter_option_value(value)
-            normalized = _normalize_filter_value(value)
-            entry = counts.get(normalized)
-            if not entry:
-                entry = {"value": value, "count": 0}
-                if value == "__BLANK__":
-                    entry["label"] = "(Blank)"
-                counts[normalized] = entry
-            entry["count"] += 1
+        counts = counts_by_key[key]
         values_for_type = [entry["value"] for entry in counts.values()]
         field_type, type_source = _resolve_meta_type(field_meta, key, values_for_type)
         meta_type_source[key] = type_source
@@ -521,10 +853,16 @@ def collect_filter_options(
             if not entry:
                 continue
             options.append(entry)
-        truncated = False
+        approximate = key in approximate_keys
+        truncated = approximate
         if max_unique and len(options) > max_unique:
             truncated = True
-            options = options[:max_unique]
+            if approximate:
+                # скетч: оставляем самые частые значения по оценке счётчика, порядок значений сохраняется
+                kept = heapq.nlargest(max_unique, range(len(options)), key=lambda idx: options[idx]["count"])
+                options = [options[idx] for idx in sorted(kept)]
+            else:
+                options = options[:max_unique]
         options_result[key] = options
         truncated_result[key] = truncated
 
@@ -532,12 +870,21 @@ def collect_filter_options(
         if selection and selection.get("items"):
             available = {_normalize_filter_value(option["value"]) for option in options}
             pruned = []
+            unlisted = []
             for item in selection.get("items", []):
                 normalized_item = _normalize_filter_value(item)
-                if normalized_item not in available:
-                    pruned.append(item if normalized_item != "__BLANK__" else "__BLANK__")
+                if normalized_item in available:
+                    continue
+                value = item if normalized_item != "__BLANK__" else "__BLANK__"
+                # у ключа на скетче выбранное значение с записями не «отсечено», а не вошло в топ
+                if approximate and normalized_item in counts:
+                    unlisted.append(value)
+                else:
+                    pruned.append(value)
             if pruned:
                 selected_pruned[key] = pruned
+            if unlisted:
+                selected_unlisted[key] = unlisted
 
         label = _resolve_field_label(key, header_overrides, field_meta, filters_meta)
         meta_entry = field_meta.get(key) if isinstance(field_meta, dict) else {}
@@ -566,6 +913,10 @@ def collect_filter_options(
         "optionsCountPerKey": {key: len(options_result.get(key, [])) for key in keys},
         "metaTypeSource": meta_type_source,
     }
+    if approximate_keys:
+        debug["approximateKeys"] = list(approximate_keys)
+    if selected_unlisted:
+        debug["selectedUnlisted"] = selected_unlisted
     return options_result, meta_result, truncated_result, selected_pruned, debug
 
 def _to_number(value: Any) -> float | None:
@@ -672,83 +1023,266 @@ def _normalize_values_selection_map(values_map: Dict[str, Dict[str, Any] | None]
     return normalized
 
 
-def apply_filters(
-    records: List[Dict[str, Any]],
-    snapshot: Snapshot | Dict[str, Any],
-    filters: Filters | Dict[str, Any] | None,
-) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    snapshot_dict = _snapshot_to_dict(snapshot)
-    field_meta = snapshot_dict.get("fieldMeta") or {}
-    values_map, ranges_map, modes_map = _merge_filters(snapshot_dict, filters)
-    normalized_values_map = _normalize_values_selection_map(values_map)
-
-    filter_keys = sorted(set(values_map.keys()) | set(ranges_map.keys()))
-    applied_values = []
-    applied_ranges = []
-    for key in filter_keys:
-        if values_map.get(key) and (values_map.get(key) or {}).get("items"):
-            applied_values.append(key)
-        if ranges_map.get(key):
-            applied_ranges.append(key)
-
-    if not filter_keys or (not applied_values and not applied_ranges):
-        return records, {
-            "counts": {"beforeFilters": len(records), "afterFilters": len(records)},
-            "effectiveFilters": {
-                "values": values_map,
-                "ranges": ranges_map,
-                "modes": modes_map,
-            },
-            "appliedKeys": {"values": [], "ranges": []},
-            "sampleRecordKeys": {"beforeFilters": list(records[0].keys()) if records else []},
-        }
+def _compile_value_resolver(key: str) -> Callable[[Dict[str, Any]], Any]:
+    """_resolve_record_value с разбором ключа (date-part, вложенный путь) один раз на план."""
+    meta = parse_date_part_key(key)
+    parts = key.split(".") if "." in key else None
 
-    filtered: List[Dict[str, Any]] = []
-    dropped_examples: List[Dict[str, Any]] = []
+    def resolve(record: Dict[str, Any]) -> Any:
+        if not record:
+            return None
+        if key in record:
+            return record[key]
+        if meta:
+            return resolve_date_part_value(record.get(meta["field_key"]), meta["part"])
+        if parts:
+            current: Any = record
+            for part in parts:
+                if isinstance(current, dict):
+                    if part not in current:
+                        return None
+                    current = current.get(part)
+                    continue
+                return None
+            return current
+        return None
 
-    for record in records:
-        passed = True
-        fail_reason = None
+    return resolve
+
+
+def _compile_values_check(selection: Dict[str, Any]) -> Callable[[Any], bool]:
+    allowed = frozenset(selection["normalized"])
+    if selection.get("mode") == "exclude":
+        return lambda value: _normalize_filter_value(value) not in allowed
+    return lambda value: _normalize_filter_value(value) in allowed
+
+
+def _range_bounds(range_filter: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    """Границы диапазона, разобранные заранее для обоих путей сравнения: epoch ms и число."""
+    start = range_filter.get("start")
+    end = range_filter.get("end")
+    return {
+        "ms": (_to_ms(start) if start is not None else None, _to_ms(end) if end is not None else None),
+        "num": (_to_number(start) if start is not None else None, _to_number(end) if end is not None else None),
+    }
+
+
+def _range_sort_value(value: Any, meta_is_date: bool) -> Tuple[str, Any] | None:
+    """
+    Путь сравнения и приведённое значение для диапазонного индекса — те же решения,
+    что в _compile_range_check; None — запись не проходит ни один диапазон.
+    """
+    if meta_is_date or (isinstance(value, str) and parse_date_input(value) is not None):
+        val_ms = _to_ms(value)
+        return ("ms", val_ms) if val_ms is not None else None
+    val_num = _to_number(value)
+    if val_num is None:
+        return None
+    if val_num != val_num:
+        # NaN: сравнения всегда ложны, значит запись проходит любые границы
+        return "always", None
+    return "num", val_num
+
+
+def _compile_range_check(range_filter: Dict[str, Any], meta_is_date: bool) -> Callable[[Any], bool]:
+    """_passes_range_filter с границами, разобранными заранее и в epoch ms, и в число."""
+    bounds = _range_bounds(range_filter)
+    start_ms, end_ms = bounds["ms"]
+    start_num, end_num = bounds["num"]
+
+    def check(value: Any) -> bool:
+        if meta_is_date or (isinstance(value, str) and parse_date_input(value) is not None):
+            val_ms = _to_ms(value)
+            if val_ms is None:
+                return False
+            if start_ms is not None and val_ms < start_ms:
+                return False
+            if end_ms is not None and val_ms > end_ms:
+                return False
+            return True
+        val_num = _to_number(value)
+        if val_num is None:
+            return False
+        if start_num is not None and val_num < start_num:
+            return False
+        if end_num is not None and val_num > end_num:
+            return False
+        return True
+
+    return check
+
+
+def _check_priority(kind: str, selection: Dict[str, Any]) -> Tuple[int, int]:
+    # первыми проверяются самые селективные условия: include с малым числом значений,
+    # затем диапазоны с двумя границами, с одной границей и exclude
+    if kind == "values":
+        if selection.get("mode") == "exclude":
+            return 3, -len(selection["normalized"])
+        return 0, len(selection["normalized"])
+    if selection.get("start") is not None and selection.get("end") is not None:
+        return 1, 0
+    return 2, 0
+
+
+class RecordFilter:
+    """
+    Скомпилированный план фильтров: карты values/ranges/modes сливаются один раз,
+    значения include/exclude нормализуются в множества, границы диапазонов
+    разбираются заранее, тип поля (дата по fieldMeta) решается на план.
+    Проверки упорядочены по селективности; check() проверяет одну запись.
+    Планы кэшируются по хэшу фильтров — см. compile_record_filter.
+    """
+
+    def __init__(
+        self,
+        snapshot: Snapshot | Dict[str, Any],
+        filters: Filters | Dict[str, Any] | None,
+        plan_key: str | None = None,
+    ) -> None:
+        snapshot_dict = _snapshot_to_dict(snapshot)
+        self.plan_key = plan_key
+        self.field_meta = snapshot_dict.get("fieldMeta") or {}
+        self.values_map, self.ranges_map, self.modes_map = _merge_filters(snapshot_dict, filters)
+        normalized_values_map = _normalize_values_selection_map(self.values_map)
+
+        filter_keys = sorted(set(self.values_map.keys()) | set(self.ranges_map.keys()))
+        self.applied_values: List[str] = []
+        self.applied_ranges: List[str] = []
+        for key in filter_keys:
+            if self.values_map.get(key) and (self.values_map.get(key) or {}).get("items"):
+                self.applied_values.append(key)
+            if self.ranges_map.get(key):
+                self.applied_ranges.append(key)
+        self.active = bool(filter_keys) and bool(self.applied_values or self.applied_ranges)
+
+        planned: List[Tuple[Tuple[int, int], int, str, str, Callable[[Dict[str, Any]], Any], Callable[[Any], bool]]] = []
         for key in filter_keys:
-            mode = modes_map.get(key)
+            mode = self.modes_map.get(key)
             values = normalized_values_map.get(key)
-            ranges = ranges_map.get(key)
+            ranges = self.ranges_map.get(key)
             if mode == "values":
                 ranges = None
             elif mode == "ranges":
                 values = None
             if key and DATE_PART_MARKER in key:
                 ranges = None
-
+            if values and not values["items"]:
+                values = None
+            if ranges and ranges.get("start") is None and ranges.get("end") is None:
+                ranges = None
             if not values and not ranges:
                 continue
-            value = _resolve_record_value(record, key)
-            if values and not _passes_values_filter(value, values):
-                passed = False
-                fail_reason = {"key": key, "type": "values", "value": value}
-                break
-            if ranges and not _passes_range_filter(value, ranges, field_meta, key):
-                passed = False
-                fail_reason = {"key": key, "type": "ranges", "value": value}
-                break
-        if passed:
-            filtered.append(record)
-        elif fail_reason and len(dropped_examples) < 2:
-            dropped_examples.append(fail_reason)
+            resolve = _compile_value_resolver(key)
+            if values:
+                spec = (frozenset(values["normalized"]), values.get("mode") == "exclude")
+                planned.append(
+                    (
+                        _check_priority("values", values),
+                        len(planned),
+                        (key, "values", resolve, _compile_values_check(values), spec),
+                    )
+                )
+            if ranges:
+                meta_is_date = _is_date_type(self.field_meta, key)
+                planned.append(
+                    (
+                        _check_priority("ranges", ranges),
+                        len(planned),
+                        (key, "ranges", resolve, _compile_range_check(ranges, meta_is_date), (ranges, meta_is_date)),
+                    )
+                )
+        planned.sort(key=lambda entry: (entry[0], entry[1]))
+        # (key, kind, resolve, passes, spec); spec — сырые параметры проверки для индекса
+        self._checks: List[Tuple[str, str, Callable[[Dict[str, Any]], Any], Callable[[Any], bool], Any]] = [
+            entry for _, _, entry in planned
+        ]
+
+    def check(self, record: Dict[str, Any]) -> Dict[str, Any] | None:
+        """None — запись проходит, иначе причина отбраковки {key, type, value}."""
+        for key, kind, resolve, passes, _ in self._checks:
+            value = resolve(record)
+            if not passes(value):
+                return {"key": key, "type": kind, "value": value}
+        return None
+
+    def effective_filters(self) -> Dict[str, Any]:
+        return {
+            "values": self.values_map,
+            "ranges": self.ranges_map,
+            "modes": self.modes_map,
+        }
+
+
+_PLAN_CACHE_MAX_ITEMS = 256
+_PLAN_CACHE: "OrderedDict[str, RecordFilter]" = OrderedDict()
+_PLAN_CACHE_LOCK = threading.Lock()
+
+
+def _filters_to_dict(filters: Filters | Dict[str, Any] | None) -> Any:
+    if hasattr(filters, "model_dump"):
+        return filters.model_dump()
+    if hasattr(filters, "dict"):
+        return filters.dict()
+    return filters
+
 
+def build_filter_plan_key(
+    snapshot: Snapshot | Dict[str, Any],
+    filters: Filters | Dict[str, Any] | None,
+) -> str:
+    """Канонический хэш всего, от чего зависит план: фильтры snapshot, fieldMeta и фильтры запроса."""
+    snapshot_dict = _snapshot_to_dict(snapshot)
+    payload = {
+        "filterValues": snapshot_dict.get("filterValues") or {},
+        "filterRanges": snapshot_dict.get("filterRanges") or {},
+        "filterModes": snapshot_dict.get("filterModes") or {},
+        "fieldMeta": snapshot_dict.get("fieldMeta") or {},
+        "filters": _filters_to_dict(filters),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def compile_record_filter(
+    snapshot: Snapshot | Dict[str, Any],
+    filters: Filters | Dict[str, Any] | None,
+) -> RecordFilter:
+    """
+    План фильтров из LRU-кэша процесса (ключ — build_filter_plan_key): один план
+    на запрос, общий для всех чанков потокового режима и повторных запросов
+    с теми же фильтрами. План неизменяем и безопасен для рабочих потоков.
+    """
+    snapshot_dict = _snapshot_to_dict(snapshot)
+    plan_key = build_filter_plan_key(snapshot_dict, filters)
+    with _PLAN_CACHE_LOCK:
+        plan = _PLAN_CACHE.get(plan_key)
+        if plan is not None:
+            _PLAN_CACHE.move_to_end(plan_key)
+            return plan
+    plan = RecordFilter(snapshot_dict, filters, plan_key=plan_key)
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE[plan_key] = plan
+        _PLAN_CACHE.move_to_end(plan_key)
+        while len(_PLAN_CACHE) > _PLAN_CACHE_MAX_ITEMS:
+            _PLAN_CACHE.popitem(last=False)
+    return plan
+
+
+def _filters_debug(
+    records: List[Dict[str, Any]],
+    filtered: List[Dict[str, Any]],
+    record_filter: RecordFilter,
+    dropped_examples: List[Dict[str, Any]],
+) -> Dict[str, Any]:
     debug = {
         "counts": {
             "beforeFilters": len(records),
             "afterFilters": len(filtered),
         },
-        "effectiveFilters": {
-            "values": values_map,
-            "ranges": ranges_map,
-            "modes": modes_map,
-        },
+        "effectiveFilters": record_filter.effective_filters(),
         "appliedKeys": {
-            "values": applied_values,
-            "ranges": applied_ranges,
+            "values": list(record_filter.applied_values),
+            "ranges": list(record_filter.applied_ranges),
         },
         "sampleRecordKeys": {
             "beforeFilters": list(records[0].keys()) if records else [],
@@ -757,4 +1291,131 @@ def apply_filters(
     }
     if dropped_examples:
         debug["reasonsDropped"] = dropped_examples
-    return filtered, debug
+    return debug
+
+
+def _inactive_filters_debug(records: List[Dict[str, Any]], record_filter: RecordFilter) -> Dict[str, Any]:
+    return {
+        "counts": {"beforeFilters": len(records), "afterFilters": len(records)},
+        "effectiveFilters": record_filter.effective_filters(),
+        "appliedKeys": {"values": [], "ranges": []},
+        "sampleRecordKeys": {"beforeFilters": list(records[0].keys()) if records else []},
+    }
+
+
+def _index_postings(index: RecordIndex, key: str, resolve: Callable[[Dict[str, Any]], Any] | None = None):
+    return index.postings(key, resolve or _compile_value_resolver(key), _normalize_filter_value)
+
+
+def _indexed_check_bitmap(index: RecordIndex, check: Tuple[Any, ...]) -> int | None:
+    """
+    Битмап строк, прошедших проверку плана: values — объединение строк значений,
+    ranges — два бинарных поиска по SortedRange. None — проверку нужно выполнить сканом.
+    """
+    key, kind, resolve, _, spec = check
+    if kind == "ranges":
+        range_filter, meta_is_date = spec
+        sorted_range = index.sorted_range(key, meta_is_date, resolve, _range_sort_value)
+        if sorted_range is None:
+            return None
+        bounds = {
+            path: tuple(None if bound != bound else bound for bound in pair)
+            for path, pair in _range_bounds(range_filter).items()
+        }
+        return index.range_bitmap(sorted_range, bounds)
+    postings = _index_postings(index, key, resolve)
+    if postings is None:
+        return None
+    allowed, exclude = spec
+    bitmap = index.union(postings, allowed)
+    return index.all_rows & ~bitmap if exclude else bitmap
+
+
+def _check_bitmap(records: List[Dict[str, Any]], index: RecordIndex, check: Tuple[Any, ...]) -> int:
+    bitmap = _indexed_check_bitmap(index, check)
+    if bitmap is not None:
+        return bitmap
+    _, _, resolve, passes, _ = check
+    return bitmap_from_positions(
+        (position for position, record in enumerate(records) if passes(resolve(record))),
+        index.size,
+    )
+
+
+def filter_record_positions(
+    records: List[Dict[str, Any]],
+    record_filter: RecordFilter,
+    index: RecordIndex,
+    within: int | None = None,
+) -> Tuple[List[int], Dict[str, Any]]:
+    """
+    apply_filters по индексу закэшированного набора: values-фильтры — операции
+    над битмапами, остальные проверки — только по оставшимся строкам.
+    Возвращает номера прошедших строк в исходном порядке и тот же debug.
+    within — битмап строк, которыми заранее ограничен результат (ячейка детализации):
+    сканирующие проверки идут только по ним, счётчики debug — тоже.
+    """
+    if not record_filter.active:
+        if within is not None:
+            positions = bitmap_positions(within)
+            return positions, _inactive_filters_debug([records[position] for position in positions], record_filter)
+        return list(range(len(records))), _inactive_filters_debug(records, record_filter)
+    mask = index.all_rows if within is None else within
+    scan = []
+    for check in record_filter._checks:
+        bitmap = _indexed_check_bitmap(index, check)
+        if bitmap is None:
+            scan.append(check)
+        else:
+            mask &= bitmap
+    positions = bitmap_positions(mask)
+    if scan:
+        positions = [
+            position
+            for position in positions
+            if all(passes(resolve(records[position])) for _, _, resolve, passes, _ in scan)
+        ]
+
+    # примеры отброшенных записей — первые две позиции, не попавшие в результат
+    dropped_examples: List[Dict[str, Any]] = []
+    expected = 0
+    for position in positions + [len(records)] if within is None else ():
+        while expected < position and len(dropped_examples) < 2:
+            dropped_examples.append(record_filter.check(records[expected]))
+            expected += 1
+        if len(dropped_examples) >= 2:
+            break
+        expected = position + 1
+    filtered = [records[position] for position in positions]
+    return positions, _filters_debug(records, filtered, record_filter, dropped_examples)
+
+
+def apply_filters(
+    records: List[Dict[str, Any]],
+    snapshot: Snapshot | Dict[str, Any],
+    filters: Filters | Dict[str, Any] | None,
+    record_filter: RecordFilter | None = None,
+    index: RecordIndex | None = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    if record_filter is None:
+        record_filter = compile_record_filter(snapshot, filters)
+
+    if not record_filter.active:
+        return records, _inactive_filters_debug(records, record_filter)
+
+    if index is not None:
+        positions, debug = filter_record_positions(records, record_filter, index)
+        return [records[position] for position in positions], debug
+
+    filtered: List[Dict[str, Any]] = []
+    dropped_examples: List[Dict[str, Any]] = []
+    check = record_filter.check
+
+    for record in records:
+        fail_reason = check(record)
+        if fail_reason is None:
+            filtered.append(record)
+        elif len(dropped_examples) < 2:
+            dropped_examples.append(fail_reason)
+
+    return filtered, _filters_debug(records, filtered, record_filter, dropped_examples)
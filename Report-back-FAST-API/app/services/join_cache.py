@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from app.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+# строк в выборке для оценки размера записи кэша
+_SAMPLE_ROWS = 64
+# ключ lookup вместе со списком совпадений и слотом словаря
+_LOOKUP_KEY_OVERHEAD = 128
+
+# ключ → (время записи, оценка байт, значение); порядок — от давно использованных к недавним
+_STORE: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+_STORE_BYTES = 0
+
+
+def _safe_json_payload(value: Any) -> Any:
+    if isinstance(value, (dict, list, str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def build_join_cache_key(kind: str, target_source_id: Any, config: Any, spec: Dict[str, Any]) -> str:
+    """
+    Ключ кэша источника join: вид значения (rows / lookup), targetSourceId,
+    конфигурация источника (запрос и вычисляемые поля приходят из неё) и spec —
+    фильтры, агрегат и проекция join, от которых зависит значение.
+    """
+    payload = {
+        "kind": kind,
+        "targetSourceId": str(target_source_id),
+        "url": _safe_json_payload(getattr(config, "url", None)),
+        "method": _safe_json_payload(getattr(config, "method", None)),
+        "body": _safe_json_payload(getattr(config, "body", None)),
+        "rawBody": _safe_json_payload(getattr(config, "raw_body", None)),
+        "headers": _safe_json_payload(getattr(config, "headers", None)),
+        "spec": _safe_json_payload(spec),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _row_nbytes(row: Dict[str, Any]) -> int:
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+
+def _sample_nbytes(rows: List[Dict[str, Any]], total: int) -> int:
+    if not rows or not total:
+        return 0
+    step = max(1, len(rows) // _SAMPLE_ROWS)
+    sample = rows[::step][:_SAMPLE_ROWS]
+    return int(sum(_row_nbytes(row) for row in sample) / len(sample) * total)
+
+
+def estimate_rows_nbytes(rows: List[Dict[str, Any]]) -> int:
+    """Оценка памяти строк по равномерной выборке: dict и значения полей."""
+    return sys.getsizeof(rows) + _sample_nbytes(rows, len(rows))
+
+
+def estimate_lookup_nbytes(lookup: Dict[Any, List[Dict[str, Any]]]) -> int:
+    total_rows = 0
+    sample: List[Dict[str, Any]] = []
+    for matches in lookup.values():
+        total_rows += len(matches)
+        if len(sample) < _SAMPLE_ROWS:
+            sample.extend(matches[: _SAMPLE_ROWS - len(sample)])
+    return sys.getsizeof(lookup) + len(lookup) * _LOOKUP_KEY_OVERHEAD + _sample_nbytes(sample, total_rows)
+
+
+def _drop_entry(key: str) -> None:
+    global _STORE_BYTES
+    entry = _STORE.pop(key, None)
+    if entry is not None:
+        _STORE_BYTES -= entry[1]
+
+
+def get_cached_join(key: str) -> Any | None:
+    """Значение из кэша источников join (REPORT_JOIN_CACHE_TTL > 0) или None."""
+    ttl_seconds = get_settings().report_join_cache_ttl_seconds
+    if not ttl_seconds:
+        return None
+    entry = _STORE.get(key)
+    if entry is None:
+        logger.info("Join cache miss", extra={"key": key[:12]})
+        return None
+    created_at, _, value = entry
+    if time.time() - created_at > ttl_seconds:
+        _drop_entry(key)
+        logger.info("Join cache miss", extra={"key": key[:12]})
+        return None
+    _STORE.move_to_end(key)
+    logger.info("Join cache hit", extra={"key": key[:12]})
+    return value
+
+
+def set_cached_join(key: str, value: Any, nbytes: int) -> None:
+    """
+    Сохраняет значение с оценкой размера nbytes. При превышении
+    REPORT_JOIN_CACHE_MAX_BYTES вытесняются давно не использованные записи;
+    значение больше всего бюджета не кэшируется.
+    """
+    global _STORE_BYTES
+    settings = get_settings()
+    if not settings.report_join_cache_ttl_seconds:
+        return
+    max_bytes = settings.report_join_cache_max_bytes
+    _drop_entry(key)
+    if max_bytes and nbytes > max_bytes:
+        logger.info("Join cache skip", extra={"key": key[:12], "bytes": nbytes, "maxBytes": max_bytes})
+        return
+    while _STORE and max_bytes and _STORE_BYTES + nbytes > max_bytes:
+        _drop_entry(next(iter(_STORE)))
+    _STORE[key] = (time.time(), nbytes, value)
+    _STORE_BYTES += nbytes
+
+
+def clear_join_cache() -> None:
+    global _STORE_BYTES
+    _STORE.clear()
+    _STORE_BYTES = 0
+
+
+def join_cache_stats() -> Dict[str, Any]:
+    return {"entries": len(_STORE), "bytes": _STORE_BYTES}
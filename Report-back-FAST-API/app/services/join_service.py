@@ -1,6 +1,8 @@
+import asyncio
+import functools
 import json
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
 from app.config import get_settings
 from app.models.remote_source import RemoteSource
@@ -8,10 +10,20 @@ from app.services import pivot_core
 from app.services.computed_fields import build_computed_fields_engine
 from app.services.date_utils import parse_date_input, parse_date_part_key, resolve_date_part_value
 from app.services.data_source_client import async_iter_records, async_load_records
+from app.services.join_cache import (
+    build_join_cache_key,
+    estimate_lookup_nbytes,
+    estimate_rows_nbytes,
+    get_cached_join,
+    set_cached_join,
+)
 from app.services.source_registry import get_source_config
+from app.services.stage_executor import run_stage
 
 _MISSING = object()
 
+T = TypeVar("T")
+
 
 def _normalize_join_fields(value: Any) -> Optional[List[str]]:
     if isinstance(value, list):
@@ -544,6 +556,7 @@ def _apply_join_with_lookup(
     base_rows: List[Dict[str, Any]],
     lookup: Dict[Any, List[Dict[str, Any]]],
     join: Dict[str, Any],
+    copy_unmatched: bool = True,
 ) -> Tuple[List[Dict[str, Any]], int]:
     primary_key = join.get("primaryKey") or join.get("primary_key")
     foreign_key = join.get("foreignKey") or join.get("foreign_key")
@@ -561,7 +574,7 @@ def _apply_join_with_lookup(
         if not matches:
             if join_type == "inner":
                 continue
-            merged.append({**row})
+            merged.append({**row} if copy_unmatched else row)
             continue
         matched_rows += len(matches)
         for match in matches:
@@ -691,15 +704,232 @@ async def resolve_joins(remote_source: RemoteSource) -> List[Dict[str, Any]]:
     return await _resolve_joins(remote_source)
 
 
+def _filter_join_source(
+    join_rows: List[Dict[str, Any]],
+    join: Dict[str, Any],
+    target_source_id: Any,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Фильтры и агрегат одного join — строки источника в том виде, в каком они сливаются с базой."""
+    warnings: List[Dict[str, Any]] = []
+    join_rows = _apply_join_filters(join_rows, join.get("filters"))
+    aggregate_spec = _prepare_join_aggregate(join)
+    if aggregate_spec:
+        source_presence = _collect_aggregate_source_presence(join_rows, aggregate_spec["metrics"])
+        for metric in aggregate_spec["metrics"]:
+            if source_presence.get(metric["key"]):
+                continue
+            warnings.append(
+                {
+                    "joinId": join.get("id"),
+                    "targetSourceId": target_source_id,
+                    "fieldKey": metric["source_key"],
+                    "message": (
+                        "Join aggregate source field not found in join records: "
+                        f"{metric['source_key']}"
+                    ),
+                    "stage": "join-aggregate",
+                }
+            )
+        buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
+        _update_aggregate_buckets(
+            buckets,
+            aggregate_spec["group_by"],
+            aggregate_spec["metrics"],
+            join_rows,
+        )
+        join_rows = _finalize_aggregate_buckets(
+            buckets,
+            aggregate_spec["group_by"],
+            aggregate_spec["metrics"],
+        )
+    return join_rows, warnings
+
+
+def _merge_join_source(
+    rows: List[Dict[str, Any]],
+    join_rows: List[Dict[str, Any]],
+    join: Dict[str, Any],
+    target_source_id: Any,
+    debug: Dict[str, Any],
+    max_records: Optional[int],
+    join_max_records: Optional[int],
+) -> List[Dict[str, Any]]:
+    """Слияние одного join — CPU-часть apply_joins, выполняется через run_stage."""
+    base_before = len(rows)
+    rows, matched_rows = _apply_join(rows, join_rows, join)
+    if max_records and len(rows) > max_records:
+        raise ValueError(f"Records limit exceeded: {len(rows)} > {max_records}")
+    if join_max_records and len(rows) > join_max_records:
+        raise ValueError(f"Join records limit exceeded: {len(rows)} > {join_max_records}")
+    debug["joinsApplied"].append(
+        {
+            "joinId": join.get("id"),
+            "targetSourceId": target_source_id,
+            "baseBefore": base_before,
+            "baseAfter": len(rows),
+            "matchedRows": matched_rows,
+        }
+    )
+    return rows
+
+
+@dataclass(frozen=True)
+class LoadedJoinSource:
+    """Строки источника join после фильтров и агрегата и предупреждения вычисляемых полей."""
+
+    rows: List[Dict[str, Any]]
+    warnings: List[Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class _JoinRowsEntry:
+    rows: List[Dict[str, Any]]
+    warnings: List[Dict[str, Any]]
+    source_rows: int
+
+
+@dataclass(frozen=True)
+class _JoinLookupEntry:
+    lookup: Dict[Any, List[Dict[str, Any]]]
+    source_rows: int
+
+
+async def _run_join_loads(loads: List[Callable[[], Awaitable[T]]]) -> List[T]:
+    """
+    Загрузки источников join выполняются одновременно, не больше
+    REPORT_JOIN_LOAD_CONCURRENCY сразу; результаты — в порядке объявления join.
+    Первая ошибка отменяет остальные загрузки.
+    """
+    limit = get_settings().report_join_load_concurrency
+    if len(loads) <= 1 or limit == 1:
+        return [await load() for load in loads]
+    semaphore = asyncio.Semaphore(limit or len(loads))
+
+    async def run(load: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await load()
+
+    tasks = [asyncio.ensure_future(run(load)) for load in loads]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _join_cache_spec(join: Dict[str, Any], projection: bool = False) -> Dict[str, Any]:
+    """Всё из описания join, от чего зависят кэшированные строки (и lookup при projection)."""
+    spec: Dict[str, Any] = {
+        "filters": join.get("filters"),
+        "aggregate": _extract_join_aggregate(join),
+    }
+    if projection:
+        spec["foreignKey"] = join.get("foreignKey") or join.get("foreign_key")
+        spec["fields"] = join.get("fields")
+        spec["resultPrefix"] = str(join.get("resultPrefix") or "").strip()
+    return spec
+
+
+def _check_join_source_limits(
+    source_rows: int,
+    max_records: Optional[int],
+    join_source_max_records: Optional[int],
+) -> None:
+    if join_source_max_records and source_rows > join_source_max_records:
+        raise ValueError(f"Join source records limit exceeded: {source_rows} > {join_source_max_records}")
+    if max_records and source_rows > max_records:
+        raise ValueError(f"Records limit exceeded: {source_rows} > {max_records}")
+
+
+def _with_join_identity(warnings: List[Dict[str, Any]], join: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # записи кэша общие для запросов: joinId берётся из join текущего запроса
+    return [
+        {**warning, "joinId": join.get("id"), "targetSourceId": join.get("targetSourceId")}
+        for warning in warnings
+    ]
+
+
+async def _load_join_source(
+    join: Dict[str, Any],
+    max_records: Optional[int],
+    join_source_max_records: Optional[int],
+) -> LoadedJoinSource:
+    """Конфигурация, записи, вычисляемые поля, фильтры и агрегат одного источника join."""
+    target_source_id = join.get("targetSourceId")
+    if not target_source_id:
+        return LoadedJoinSource(rows=[], warnings=[])
+    config = await get_source_config(target_source_id)
+    if not config:
+        return LoadedJoinSource(rows=[], warnings=[])
+    cache_key = build_join_cache_key("rows", target_source_id, config, _join_cache_spec(join))
+    entry = get_cached_join(cache_key)
+    if entry is not None:
+        _check_join_source_limits(entry.source_rows, max_records, join_source_max_records)
+        return LoadedJoinSource(rows=entry.rows, warnings=_with_join_identity(entry.warnings, join))
+
+    join_source = _build_join_source(target_source_id, config)
+    join_computed_engine = build_computed_fields_engine(join_source)
+    join_rows = await async_load_records(join_source)
+    source_rows = len(join_rows)
+    _check_join_source_limits(source_rows, max_records, join_source_max_records)
+    warnings: List[Dict[str, Any]] = []
+    if join_computed_engine:
+        await run_stage("computed_fields", join_computed_engine.apply, join_rows)
+        warnings = list(getattr(join_computed_engine, "warnings", []) or [])
+    join_rows, aggregate_warnings = await run_stage(
+        "apply_joins",
+        _filter_join_source,
+        join_rows,
+        join,
+        target_source_id,
+    )
+    warnings.extend(aggregate_warnings)
+    entry = _JoinRowsEntry(rows=join_rows, warnings=warnings, source_rows=source_rows)
+    set_cached_join(cache_key, entry, estimate_rows_nbytes(join_rows))
+    return LoadedJoinSource(rows=join_rows, warnings=_with_join_identity(warnings, join))
+
+
+async def load_join_sources(
+    joins: List[Dict[str, Any]],
+    max_records: Optional[int] = None,
+) -> List[LoadedJoinSource]:
+    join_source_max_records = get_settings().report_join_source_max_records or None
+    return await _run_join_loads(
+        [functools.partial(_load_join_source, join, max_records, join_source_max_records) for join in joins]
+    )
+
+
+async def load_records_with_joins(
+    base_load: Awaitable[T],
+    joins: List[Dict[str, Any]],
+    max_records: Optional[int] = None,
+) -> Tuple[T, List[LoadedJoinSource]]:
+    """
+    Базовые записи и источники join загружаются одновременно: источники join
+    не зависят от строк базового источника. Результат передаётся в
+    apply_joins(loaded_sources=...); ошибка любой загрузки отменяет остальные.
+    """
+    if not joins:
+        return await base_load, []
+    base_task = asyncio.ensure_future(base_load)
+    joins_task = asyncio.ensure_future(load_join_sources(joins, max_records))
+    try:
+        records, loaded_sources = await asyncio.gather(base_task, joins_task)
+    finally:
+        base_task.cancel()
+        joins_task.cancel()
+    return records, loaded_sources
+
+
 async def apply_joins(
     base_rows: List[Dict[str, Any]],
     remote_source: RemoteSource,
     joins_override: Optional[List[Dict[str, Any]]] = None,
     max_records: Optional[int] = None,
+    loaded_sources: Optional[List[LoadedJoinSource]] = None,
 ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     settings = get_settings()
     join_max_records = settings.report_join_max_records or None
-    join_source_max_records = settings.report_join_source_max_records or None
     joins = joins_override if joins_override is not None else await _resolve_joins(remote_source)
     debug: Dict[str, Any] = {
         "joinsApplied": [],
@@ -712,82 +942,22 @@ async def apply_joins(
     if not joins:
         return base_rows, debug
 
+    if loaded_sources is None:
+        loaded_sources = await load_join_sources(joins, max_records)
     rows = base_rows
-    for join in joins:
-        target_source_id = join.get("targetSourceId")
-        join_rows: List[Dict[str, Any]] = []
-        join_computed_engine = None
-        if target_source_id:
-            config = await get_source_config(target_source_id)
-            if config:
-                join_source = _build_join_source(target_source_id, config)
-                join_computed_engine = build_computed_fields_engine(join_source)
-                join_rows = await async_load_records(join_source)
-                if join_source_max_records and len(join_rows) > join_source_max_records:
-                    raise ValueError(
-                        f"Join source records limit exceeded: {len(join_rows)} > {join_source_max_records}"
-                    )
-                if max_records and len(join_rows) > max_records:
-                    raise ValueError(f"Records limit exceeded: {len(join_rows)} > {max_records}")
-                if join_computed_engine:
-                    join_computed_engine.apply(join_rows)
-                    warnings = list(getattr(join_computed_engine, "warnings", []) or [])
-                    if warnings:
-                        debug["computedWarnings"].extend(
-                            {
-                                **warning,
-                                "joinId": join.get("id"),
-                                "targetSourceId": target_source_id,
-                            }
-                            for warning in warnings
-                        )
-
-        join_rows = _apply_join_filters(join_rows, join.get("filters"))
-        aggregate_spec = _prepare_join_aggregate(join)
-        if aggregate_spec:
-            source_presence = _collect_aggregate_source_presence(join_rows, aggregate_spec["metrics"])
-            for metric in aggregate_spec["metrics"]:
-                if source_presence.get(metric["key"]):
-                    continue
-                debug["computedWarnings"].append(
-                    {
-                        "joinId": join.get("id"),
-                        "targetSourceId": target_source_id,
-                        "fieldKey": metric["source_key"],
-                        "message": (
-                            "Join aggregate source field not found in join records: "
-                            f"{metric['source_key']}"
-                        ),
-                        "stage": "join-aggregate",
-                    }
-                )
-            buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
-            _update_aggregate_buckets(
-                buckets,
-                aggregate_spec["group_by"],
-                aggregate_spec["metrics"],
-                join_rows,
-            )
-            join_rows = _finalize_aggregate_buckets(
-                buckets,
-                aggregate_spec["group_by"],
-                aggregate_spec["metrics"],
-            )
-
-        base_before = len(rows)
-        rows, matched_rows = _apply_join(rows, join_rows, join)
-        if max_records and len(rows) > max_records:
-            raise ValueError(f"Records limit exceeded: {len(rows)} > {max_records}")
-        if join_max_records and len(rows) > join_max_records:
-            raise ValueError(f"Join records limit exceeded: {len(rows)} > {join_max_records}")
-        debug["joinsApplied"].append(
-            {
-                "joinId": join.get("id"),
-                "targetSourceId": target_source_id,
-                "baseBefore": base_before,
-                "baseAfter": len(rows),
-                "matchedRows": matched_rows,
-            }
+    # загрузки шли параллельно, слияние — строго в порядке объявления join
+    for join, loaded in zip(joins, loaded_sources):
+        debug["computedWarnings"].extend(loaded.warnings)
+        rows = await run_stage(
+            "apply_joins",
+            _merge_join_source,
+            rows,
+            loaded.rows,
+            join,
+            join.get("targetSourceId"),
+            debug,
+            max_records,
+            join_max_records,
         )
 
     debug["sampleKeys"]["afterJoin"] = list(rows[0].keys()) if rows else []
@@ -799,51 +969,123 @@ async def prepare_joins(
     joins_override: Optional[List[Dict[str, Any]]] = None,
     max_records: Optional[int] = None,
 ) -> List[PreparedJoin]:
-    settings = get_settings()
-    join_source_max_records = settings.report_join_source_max_records or None
     joins = joins_override if joins_override is not None else await _resolve_joins(remote_source)
-    prepared: List[PreparedJoin] = []
-    for join in joins:
-        target_source_id = join.get("targetSourceId")
-        join_rows: List[Dict[str, Any]] = []
-        join_computed_engine = None
-        if target_source_id:
-            config = await get_source_config(target_source_id)
-            if config:
-                join_source = _build_join_source(target_source_id, config)
-                join_computed_engine = build_computed_fields_engine(join_source)
-                join_rows = await async_load_records(join_source)
-                if join_source_max_records and len(join_rows) > join_source_max_records:
-                    raise ValueError(
-                        f"Join source records limit exceeded: {len(join_rows)} > {join_source_max_records}"
-                    )
-                if max_records and len(join_rows) > max_records:
-                    raise ValueError(f"Records limit exceeded: {len(join_rows)} > {max_records}")
-                if join_computed_engine:
-                    join_computed_engine.apply(join_rows)
-        join_rows = _apply_join_filters(join_rows, join.get("filters"))
-        aggregate_spec = _prepare_join_aggregate(join)
+    loaded_sources = await load_join_sources(joins, max_records)
+    return [
+        PreparedJoin(
+            join=join,
+            rows=loaded.rows,
+            target_source_id=join.get("targetSourceId"),
+        )
+        for join, loaded in zip(joins, loaded_sources)
+    ]
+
+
+async def _stream_join_lookup(
+    join: Dict[str, Any],
+    config: Any,
+    chunk_size: int,
+    *,
+    max_records: Optional[int],
+    join_source_max_records: Optional[int],
+    lookup_max_keys: Optional[int],
+    paging_allowlist: Optional[str],
+    paging_max_pages: Optional[int],
+    paging_force: bool,
+) -> _JoinLookupEntry:
+    target_source_id = join.get("targetSourceId")
+    lookup: Dict[Any, List[Dict[str, Any]]] = {}
+    join_filters = join.get("filters")
+    aggregate_spec = _prepare_join_aggregate(join)
+    aggregate_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
+    join_source = _build_join_source(target_source_id, config)
+    join_computed_engine = build_computed_fields_engine(join_source)
+    total_rows = 0
+    async for chunk in async_iter_records(
+        join_source,
+        chunk_size,
+        paging_allowlist=paging_allowlist,
+        paging_max_pages=paging_max_pages,
+        paging_force=paging_force,
+    ):
+        if not chunk:
+            continue
+        total_rows += len(chunk)
+        _check_join_source_limits(total_rows, max_records, join_source_max_records)
+        if join_computed_engine:
+            join_computed_engine.apply(chunk)
+        chunk = _apply_join_filters(chunk, join_filters)
+        if not chunk:
+            continue
         if aggregate_spec:
-            buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
             _update_aggregate_buckets(
-                buckets,
-                aggregate_spec["group_by"],
-                aggregate_spec["metrics"],
-                join_rows,
-            )
-            join_rows = _finalize_aggregate_buckets(
-                buckets,
+                aggregate_buckets,
                 aggregate_spec["group_by"],
                 aggregate_spec["metrics"],
+                chunk,
             )
-        prepared.append(
-            PreparedJoin(
-                join=join,
-                rows=join_rows,
-                target_source_id=target_source_id,
-            )
+        else:
+            _update_join_lookup(lookup, join, chunk, lookup_max_keys)
+    if aggregate_spec:
+        aggregated_rows = _finalize_aggregate_buckets(
+            aggregate_buckets,
+            aggregate_spec["group_by"],
+            aggregate_spec["metrics"],
         )
-    return prepared
+        _update_join_lookup(lookup, join, aggregated_rows, lookup_max_keys)
+    return _JoinLookupEntry(lookup=lookup, source_rows=total_rows)
+
+
+async def _prepare_join_lookup(
+    join: Dict[str, Any],
+    chunk_size: int,
+    *,
+    max_records: Optional[int],
+    join_source_max_records: Optional[int],
+    lookup_max_keys: Optional[int],
+    paging_allowlist: Optional[str],
+    paging_max_pages: Optional[int],
+    paging_force: bool,
+) -> PreparedJoinLookup:
+    """
+    Lookup одного join из кэша источников join: готовый lookup, иначе — из
+    закэшированных материализованным режимом строк, иначе — потоковая загрузка.
+    """
+    target_source_id = join.get("targetSourceId")
+    config = await get_source_config(target_source_id) if target_source_id else None
+    if not config:
+        return PreparedJoinLookup(join=join, lookup={}, target_source_id=target_source_id)
+    cache_key = build_join_cache_key("lookup", target_source_id, config, _join_cache_spec(join, projection=True))
+    entry = get_cached_join(cache_key)
+    if entry is None:
+        rows_entry = get_cached_join(build_join_cache_key("rows", target_source_id, config, _join_cache_spec(join)))
+        if rows_entry is not None:
+            _check_join_source_limits(rows_entry.source_rows, max_records, join_source_max_records)
+            lookup: Dict[Any, List[Dict[str, Any]]] = {}
+            _update_join_lookup(lookup, join, rows_entry.rows, lookup_max_keys)
+            entry = _JoinLookupEntry(lookup=lookup, source_rows=rows_entry.source_rows)
+        else:
+            entry = await _stream_join_lookup(
+                join,
+                config,
+                chunk_size,
+                max_records=max_records,
+                join_source_max_records=join_source_max_records,
+                lookup_max_keys=lookup_max_keys,
+                paging_allowlist=paging_allowlist,
+                paging_max_pages=paging_max_pages,
+                paging_force=paging_force,
+            )
+        set_cached_join(cache_key, entry, estimate_lookup_nbytes(entry.lookup))
+    else:
+        _check_join_source_limits(entry.source_rows, max_records, join_source_max_records)
+        if lookup_max_keys and len(entry.lookup) > lookup_max_keys:
+            raise ValueError(f"Join lookup max keys exceeded: {len(entry.lookup)} > {lookup_max_keys}")
+    return PreparedJoinLookup(
+        join=join,
+        lookup=entry.lookup,
+        target_source_id=target_source_id,
+    )
 
 
 async def prepare_joins_streaming(
@@ -858,66 +1100,23 @@ async def prepare_joins_streaming(
     paging_force: bool = False,
 ) -> List[PreparedJoinLookup]:
     settings = get_settings()
-    join_source_max_records = settings.report_join_source_max_records or None
     joins = joins_override if joins_override is not None else await _resolve_joins(remote_source)
-    prepared: List[PreparedJoinLookup] = []
-    for join in joins:
-        target_source_id = join.get("targetSourceId")
-        lookup: Dict[Any, List[Dict[str, Any]]] = {}
-        join_filters = join.get("filters")
-        aggregate_spec = _prepare_join_aggregate(join)
-        aggregate_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
-        if target_source_id:
-            config = await get_source_config(target_source_id)
-            if config:
-                join_source = _build_join_source(target_source_id, config)
-                join_computed_engine = build_computed_fields_engine(join_source)
-                total_rows = 0
-                async for chunk in async_iter_records(
-                    join_source,
-                    chunk_size,
-                    paging_allowlist=paging_allowlist,
-                    paging_max_pages=paging_max_pages,
-                    paging_force=paging_force,
-                ):
-                    if not chunk:
-                        continue
-                    total_rows += len(chunk)
-                    if join_source_max_records and total_rows > join_source_max_records:
-                        raise ValueError(
-                            f"Join source records limit exceeded: {total_rows} > {join_source_max_records}"
-                        )
-                    if max_records and total_rows > max_records:
-                        raise ValueError(f"Records limit exceeded: {total_rows} > {max_records}")
-                    if join_computed_engine:
-                        join_computed_engine.apply(chunk)
-                    chunk = _apply_join_filters(chunk, join_filters)
-                    if not chunk:
-                        continue
-                    if aggregate_spec:
-                        _update_aggregate_buckets(
-                            aggregate_buckets,
-                            aggregate_spec["group_by"],
-                            aggregate_spec["metrics"],
-                            chunk,
-                        )
-                    else:
-                        _update_join_lookup(lookup, join, chunk, lookup_max_keys)
-                if aggregate_spec:
-                    aggregated_rows = _finalize_aggregate_buckets(
-                        aggregate_buckets,
-                        aggregate_spec["group_by"],
-                        aggregate_spec["metrics"],
-                    )
-                    _update_join_lookup(lookup, join, aggregated_rows, lookup_max_keys)
-        prepared.append(
-            PreparedJoinLookup(
-                join=join,
-                lookup=lookup,
-                target_source_id=target_source_id,
+    return await _run_join_loads(
+        [
+            functools.partial(
+                _prepare_join_lookup,
+                join,
+                chunk_size,
+                max_records=max_records,
+                join_source_max_records=settings.report_join_source_max_records or None,
+                lookup_max_keys=lookup_max_keys,
+                paging_allowlist=paging_allowlist,
+                paging_max_pages=paging_max_pages,
+                paging_force=paging_force,
             )
-        )
-    return prepared
+            for join in joins
+        ]
+    )
 
 
 def apply_prepared_joins(
@@ -990,3 +1189,23 @@ def apply_prepared_join_lookups(
 
     debug["sampleKeys"]["afterJoin"] = list(rows[0].keys()) if rows else []
     return rows, debug
+
+
+def probe_prepared_joins(
+    row: Dict[str, Any],
+    prepared_joins: List[PreparedJoinLookup],
+    stats: List[Dict[str, int]],
+) -> List[Dict[str, Any]]:
+    """
+    Join одной записи по подготовленным lookup (для fused-конвейера потокового режима).
+    Строки без совпадений не копируются; stats[i] накапливает baseBefore/baseAfter/matchedRows.
+    """
+    rows = [row]
+    for prepared, entry in zip(prepared_joins, stats):
+        entry["baseBefore"] += len(rows)
+        rows, matched_rows = _apply_join_with_lookup(rows, prepared.lookup, prepared.join, copy_unmatched=False)
+        entry["baseAfter"] += len(rows)
+        entry["matchedRows"] += matched_rows
+        if not rows:
+            break
+    return rows
@@ -1,20 +1,47 @@
 import ast
-import functools
 import json
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
+from app.config import get_settings
 from app.services.date_utils import parse_date_input, parse_date_part_key, resolve_date_part_value
+from app.services.sketches import HLL_DEFAULT_PRECISION, HyperLogLog, TDigest, hash64, normalize_hll_precision
+
+_QUANTILE_AGGREGATORS = {"median": 0.5, "p90": 0.9, "p95": 0.95}
+_AGGREGATOR_ALIASES = {"distinct": "count_distinct", "p50": "median"}
+
+
+class _OtherValue(str):
+    """Значение «Прочее» в values групп: в JSON это "__OTHER__", но оно отличимо от реального значения записи."""
+
+
+# значение измерения, в которое сворачивается хвост top-N
+OTHER_VALUE = _OtherValue("__OTHER__")
+OTHER_LABEL = "Прочее"
+
+
+def _is_other_value(value: Any) -> bool:
+    return isinstance(value, _OtherValue)
+
+
+def _escape_other_key(text: str) -> str:
+    # реальные значения вида "__OTHER__", "\__OTHER__", … получают ещё один "\":
+    # ключ "__OTHER__" остаётся только у «Прочее», разные значения не склеиваются
+    if text.endswith(OTHER_VALUE) and not text[: -len(OTHER_VALUE)].strip("\\"):
+        return "\\" + text
+    return text
 
 
 def _normalize_value_for_key(value: Any) -> str:
     if value is None:
         return ""
+    if _is_other_value(value):
+        return str(value)
     if isinstance(value, (dict, list)):
         try:
             return json.dumps(value, ensure_ascii=False, sort_keys=True)
         except (TypeError, ValueError):
             return ""
-    return str(value)
+    return _escape_other_key(str(value))
 
 
 def _normalize_value_for_distinct(value: Any) -> str | None:
@@ -34,13 +61,13 @@ def _normalize_aggregator(value: Any) -> str | None:
     if value is None:
         return None
     text = str(value).lower()
-    if text == "distinct":
-        return "count_distinct"
-    return text
+    return _AGGREGATOR_ALIASES.get(text, text)
 
 def _format_label_value(value: Any) -> str:
     if value is None or value == "":
         return "—"
+    if _is_other_value(value):
+        return OTHER_LABEL
     return str(value)
 
 
@@ -92,15 +119,22 @@ def _resolve_record_value(record: Dict[str, Any], key: str | None) -> Any:
     return _resolve_record_value_base(record, key)
 
 
-def _create_bucket(aggregator: str | None = None) -> Dict[str, Any]:
+def _create_bucket(aggregator: str | None = None, distinct_precision: int | None = None) -> Dict[str, Any]:
     bucket = {
         "count": 0,
         "numeric_count": 0,
         "sum": 0.0,
         "last": None,
     }
-    if _normalize_aggregator(aggregator) == "count_distinct":
-        bucket["distinct_values"] = set()
+    agg = _normalize_aggregator(aggregator)
+    if agg == "count_distinct":
+        # точный режим хранит 64-битные хеши значений, приближённый — HLL-скетч
+        bucket["distinct_values"] = HyperLogLog(distinct_precision) if distinct_precision else set()
+    elif agg in ("min", "max"):
+        bucket["min"] = None
+        bucket["max"] = None
+    elif agg in _QUANTILE_AGGREGATORS:
+        bucket["digest"] = TDigest()
     return bucket
 
 
@@ -111,7 +145,7 @@ def _update_bucket(bucket: Dict[str, Any], value: Any) -> None:
     if distinct_values is not None:
         normalized = _normalize_value_for_distinct(value)
         if normalized is not None:
-            distinct_values.add(normalized)
+            distinct_values.add(hash64(normalized))
     try:
         num = float(value)
     except (TypeError, ValueError):
@@ -120,6 +154,78 @@ def _update_bucket(bucket: Dict[str, Any], value: Any) -> None:
         return
     bucket["numeric_count"] += 1
     bucket["sum"] += num
+    if "min" in bucket:
+        if bucket["min"] is None or num < bucket["min"]:
+            bucket["min"] = num
+        if bucket["max"] is None or num > bucket["max"]:
+            bucket["max"] = num
+    digest = bucket.get("digest")
+    if digest is not None:
+        digest.add(num)
+
+
+def _merge_bucket(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    if not source or not source.get("count"):
+        return
+    target["count"] += source["count"]
+    target["numeric_count"] += source["numeric_count"]
+    target["sum"] += source["sum"]
+    target["last"] = source["last"]
+    distinct_values = source.get("distinct_values")
+    if distinct_values is not None:
+        target_values = target.get("distinct_values")
+        if target_values is None:
+            target_values = HyperLogLog(distinct_values.precision) if isinstance(distinct_values, HyperLogLog) else set()
+            target["distinct_values"] = target_values
+        target_values.update(distinct_values)
+    if source.get("min") is not None:
+        if target.get("min") is None or source["min"] < target["min"]:
+            target["min"] = source["min"]
+        if target.get("max") is None or source["max"] > target["max"]:
+            target["max"] = source["max"]
+    digest = source.get("digest")
+    if digest is not None:
+        target.setdefault("digest", TDigest(digest.compression)).update(digest)
+
+
+def _bucket_to_state(bucket: Dict[str, Any]) -> Dict[str, Any]:
+    state: Dict[str, Any] = {
+        "c": bucket["count"],
+        "n": bucket["numeric_count"],
+        "s": bucket["sum"],
+        "l": bucket["last"],
+    }
+    distinct_values = bucket.get("distinct_values")
+    if isinstance(distinct_values, HyperLogLog):
+        state["h"] = distinct_values.to_state()
+    elif distinct_values is not None:
+        state["d"] = sorted(distinct_values)
+    if "min" in bucket:
+        state["mn"] = bucket["min"]
+        state["mx"] = bucket["max"]
+    digest = bucket.get("digest")
+    if digest is not None:
+        state["q"] = digest.to_state()
+    return state
+
+
+def _bucket_from_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    bucket = {
+        "count": int(state.get("c") or 0),
+        "numeric_count": int(state.get("n") or 0),
+        "sum": float(state.get("s") or 0.0),
+        "last": state.get("l"),
+    }
+    if "h" in state:
+        bucket["distinct_values"] = HyperLogLog.from_state(state["h"])
+    elif "d" in state:
+        bucket["distinct_values"] = {int(value) for value in state.get("d") or []}
+    if "mn" in state:
+        bucket["min"] = state.get("mn")
+        bucket["max"] = state.get("mx")
+    if "q" in state:
+        bucket["digest"] = TDigest.from_state(state["q"])
+    return bucket
 
 
 def _finalize_bucket(bucket: Dict[str, Any] | None, aggregator: str | None) -> Any:
@@ -132,9 +238,18 @@ def _finalize_bucket(bucket: Dict[str, Any] | None, aggregator: str | None) -> A
         return bucket["count"]
     if agg == "count_distinct":
         distinct_values = bucket.get("distinct_values")
+        if isinstance(distinct_values, HyperLogLog):
+            return distinct_values.count()
         return len(distinct_values or set())
     if agg == "sum":
         return bucket["sum"] if bucket["numeric_count"] else None
+    if agg == "min":
+        return bucket.get("min")
+    if agg == "max":
+        return bucket.get("max")
+    if agg in _QUANTILE_AGGREGATORS:
+        digest = bucket.get("digest")
+        return digest.quantile(_QUANTILE_AGGREGATORS[agg]) if digest is not None else None
     if agg == "avg":
         if not bucket["numeric_count"]:
             return None
@@ -242,42 +357,51 @@ def _normalize_sort_config(dimensions: List[str], state: Any) -> Dict[str, Dict[
     return config
 
 
-def _compare_strings(left: Any, right: Any, direction: str) -> int:
-    a = "" if left is None else str(left)
-    b = "" if right is None else str(right)
-    a = a.casefold()
-    b = b.casefold()
-    if a == b:
-        return 0
+def _normalize_top_n_config(dimensions: List[str], state: Any) -> Dict[str, Dict[str, Any]]:
+    if not isinstance(state, dict):
+        return {}
+    result: Dict[str, Dict[str, Any]] = {}
+    for key in dimensions:
+        entry = state.get(key)
+        if isinstance(entry, int) and not isinstance(entry, bool):
+            entry = {"limit": entry}
+        if not isinstance(entry, dict):
+            continue
+        try:
+            limit = int(entry.get("limit") or 0)
+        except (TypeError, ValueError):
+            continue
+        if limit <= 0:
+            continue
+        by = "count" if str(entry.get("by") or "").lower() == "count" else "metric"
+        result[key] = {"limit": limit, "by": by}
+    return result
+
+
+def _to_sort_number(value: Any) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _number_sort_key(value: Any, direction: str) -> Tuple[bool, float]:
+    # пустые значения в конце при asc и в начале при desc (desc — зеркало asc)
+    number = _to_sort_number(value)
     if direction == "desc":
-        return -1 if a > b else 1
-    return -1 if a < b else 1
+        return (number is not None, -number if number is not None else 0.0)
+    return (number is None, number if number is not None else 0.0)
 
 
-def _compare_numbers(left: Any, right: Any, direction: str) -> int:
-    def to_number(value: Any) -> float | None:
-        if value is None:
-            return None
-        if isinstance(value, bool):
-            return float(value)
-        if isinstance(value, (int, float)):
-            return float(value)
-        try:
-            return float(value)
-        except (TypeError, ValueError):
-            return None
+def _casefold_sort_value(value: Any) -> str:
+    return "" if value is None else str(value).casefold()
 
-    a = to_number(left)
-    b = to_number(right)
-    if a is None and b is None:
-        return 0
-    if a is None:
-        return 1 if direction == "asc" else -1
-    if b is None:
-        return -1 if direction == "asc" else 1
-    if a == b:
-        return 0
-    return -1 if (a < b) ^ (direction == "desc") else 1
+
+def _string_sort_ranks(values: Iterable[Any]) -> Dict[str, int]:
+    """Ранги casefold-строк: desc-сортировка строк сводится к отрицанию числа в общем ключе."""
+    return {text: rank for rank, text in enumerate(sorted({_casefold_sort_value(value) for value in values}))}
 
 
 def _finalize_prefix_totals(
@@ -349,27 +473,29 @@ def _sort_dimension_order(
         return
     index_map = {key: idx for idx, key in enumerate(dimensions)}
 
-    def compare(left: Tuple[Any, ...], right: Tuple[Any, ...]) -> int:
-        for field_key in ordered_keys:
-            sort_entry = config.get(field_key, {})
-            idx = index_map[field_key]
-            if sort_entry.get("metric") and metric_key:
-                left_prefix = left[: idx + 1]
-                right_prefix = right[: idx + 1]
-                left_metric = prefix_totals.get(left_prefix, {}).get(metric_key)
-                right_metric = prefix_totals.get(right_prefix, {}).get(metric_key)
-                metric_cmp = _compare_numbers(left_metric, right_metric, sort_entry["metric"])
-                if metric_cmp != 0:
-                    return metric_cmp
-            if sort_entry.get("value"):
-                left_value = left[idx] if idx < len(left) else None
-                right_value = right[idx] if idx < len(right) else None
-                value_cmp = _compare_strings(left_value, right_value, sort_entry["value"])
-                if value_cmp != 0:
-                    return value_cmp
-        return 0
-
-    order.sort(key=functools.cmp_to_key(compare))
+    # ключ сортировки считается один раз на элемент, сравнение — нативное по кортежам
+    criteria: List[Tuple[str, int, str, Dict[str, int]]] = []
+    for field_key in ordered_keys:
+        sort_entry = config.get(field_key, {})
+        idx = index_map[field_key]
+        if sort_entry.get("metric") and metric_key:
+            criteria.append(("metric", idx, sort_entry["metric"], {}))
+        if sort_entry.get("value"):
+            ranks = _string_sort_ranks(key[idx] if idx < len(key) else None for key in order)
+            criteria.append(("value", idx, sort_entry["value"], ranks))
+
+    def sort_key(key: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        parts: List[Any] = []
+        for kind, idx, direction, ranks in criteria:
+            if kind == "metric":
+                metric_value = prefix_totals.get(key[: idx + 1], {}).get(metric_key)
+                parts.append(_number_sort_key(metric_value, direction))
+            else:
+                rank = ranks[_casefold_sort_value(key[idx] if idx < len(key) else None)]
+                parts.append(-rank if direction == "desc" else rank)
+        return tuple(parts)
+
+    order.sort(key=sort_key)
 
 
 def _sort_row_tree_by_config(
@@ -380,23 +506,22 @@ def _sort_row_tree_by_config(
     if not nodes or not sort_config:
         return
     field_key = nodes[0].get("field_key")
-    config = sort_config.get(field_key) if field_key else None
-
-    def compare(left: Dict[str, Any], right: Dict[str, Any]) -> int:
-        if config:
-            if config.get("metric") and metric_key:
-                left_metric = left.get("totals", {}).get(metric_key)
-                right_metric = right.get("totals", {}).get(metric_key)
-                metric_cmp = _compare_numbers(left_metric, right_metric, config["metric"])
-                if metric_cmp != 0:
-                    return metric_cmp
-            if config.get("value"):
-                value_cmp = _compare_strings(left.get("label"), right.get("label"), config["value"])
-                if value_cmp != 0:
-                    return value_cmp
-        return left.get("order", 0) - right.get("order", 0)
-
-    nodes.sort(key=functools.cmp_to_key(compare))
+    config = (sort_config.get(field_key) if field_key else None) or {}
+    metric_direction = config.get("metric") if metric_key else None
+    value_direction = config.get("value")
+    ranks = _string_sort_ranks(node.get("label") for node in nodes) if value_direction else {}
+
+    def sort_key(node: Dict[str, Any]) -> Tuple[Any, ...]:
+        parts: List[Any] = []
+        if metric_direction:
+            parts.append(_number_sort_key(node.get("totals", {}).get(metric_key), metric_direction))
+        if value_direction:
+            rank = ranks[_casefold_sort_value(node.get("label"))]
+            parts.append(-rank if value_direction == "desc" else rank)
+        parts.append(node.get("order", 0))
+        return tuple(parts)
+
+    nodes.sort(key=sort_key)
     for node in nodes:
         children = node.get("children") or []
         if children:
@@ -461,7 +586,33 @@ def _collect_column_rules(column: Dict[str, Any], rules: List[Dict[str, Any]]) -
     return matched
 
 
-def _extract_metric(metric: Dict[str, Any]) -> Dict[str, Any]:
+def _resolve_distinct_defaults() -> Tuple[str, int]:
+    settings = get_settings()
+    return settings.report_count_distinct_mode, settings.report_hll_precision
+
+
+def _resolve_distinct_precision(
+    metric: Dict[str, Any],
+    op: str | None,
+    defaults: Tuple[str, int],
+) -> int | None:
+    if op != "count_distinct":
+        return None
+    default_mode, default_precision = defaults
+    mode = str(metric.get("distinctMode") or default_mode or "exact").strip().lower()
+    if mode not in {"approx", "hll"}:
+        return None
+    return normalize_hll_precision(metric.get("distinctPrecision"), normalize_hll_precision(default_precision))
+
+
+def _collect_approximate_metrics(metrics: List[Dict[str, Any]]) -> List[str]:
+    return [metric["key"] for metric in metrics if metric.get("distinct_precision")]
+
+
+def _extract_metric(
+    metric: Dict[str, Any],
+    distinct_defaults: Tuple[str, int] = ("exact", HLL_DEFAULT_PRECISION),
+) -> Dict[str, Any]:
     metric_type = metric.get("type") or "base"
     metric_key = metric.get("key") or metric.get("id")
     source_key = (
@@ -484,10 +635,11 @@ def _extract_metric(metric: Dict[str, Any]) -> Dict[str, Any]:
         "type": metric_type,
         "expression": metric.get("expression") or "",
         "label": label,
+        "distinct_precision": _resolve_distinct_precision(metric, op, distinct_defaults),
     }
 
 
-def build_pivot_view(records: list[dict], snapshot: dict) -> dict:
+def build_pivot_view(records: list[dict], snapshot: dict, include_row_tree: bool = False) -> dict:
     """
     Minimal pivot implementation with optional formulas.
 
@@ -510,247 +662,12 @@ def build_pivot_view(records: list[dict], snapshot: dict) -> dict:
             ],
         }
     """
-    pivot = snapshot.get("pivot") or {}
-    row_fields = pivot.get("rows") or []
-    column_fields = pivot.get("columns") or []
-    metrics_input = snapshot.get("metrics") or []
-
-    metrics = [_extract_metric(metric) for metric in metrics_input]
-    base_metrics = [metric for metric in metrics if metric["type"] != "formula"]
-    rules = _normalize_rules(snapshot.get("conditionalFormatting") or [])
-    options = snapshot.get("options") or {}
-    sorts = options.get("sorts") or {}
-    row_sort_config = _normalize_sort_config(row_fields, sorts.get("rows") or {})
-    column_sort_config = _normalize_sort_config(column_fields, sorts.get("columns") or {})
-    primary_metric_key = metrics[0]["key"] if metrics else None
-
-    row_order: List[Tuple[Any, ...]] = []
-    row_index: Dict[Tuple[Any, ...], Dict[str, str]] = {}
-    column_order: List[Tuple[Any, ...]] = []
-    column_index: Dict[Tuple[Any, ...], Dict[str, str]] = {}
-
-    cell_buckets: Dict[Tuple[Any, ...], Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]]] = {}
-    total_buckets: Dict[str, Dict[str, Any]] = {}
-    row_nodes: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
-    row_roots: List[Dict[str, Any]] = []
-    row_prefix_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
-    column_prefix_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
-
-    if not column_fields and not column_order:
-        column_order.append(tuple())
-        column_index[tuple()] = {
-            "key": _build_dimension_key(tuple(), []),
-            "label": _build_dimension_label(tuple(), False),
-            "values": [],
-        }
-
-    if not row_fields and not row_order:
-        row_order.append(tuple())
-        row_index[tuple()] = {
-            "key": _build_dimension_key(tuple(), []),
-            "label": _build_dimension_label(tuple(), False),
-            "values": [],
-        }
-
-    for record in records or []:
-        row_values = [_resolve_record_value(record, field) for field in row_fields]
-        row_key = tuple(_normalize_value_for_key(value) for value in row_values)
-        if row_key not in row_index:
-            row_order.append(row_key)
-            row_index[row_key] = {
-                "key": _build_dimension_key(row_values, row_fields),
-                "label": _build_dimension_label(tuple(row_values), bool(row_fields)),
-                "values": list(row_values),
-            }
-
-        column_values = [_resolve_record_value(record, field) for field in column_fields]
-        column_key = tuple(_normalize_value_for_key(value) for value in column_values)
-        if column_key not in column_index:
-            column_order.append(column_key)
-            column_index[column_key] = {
-                "key": _build_dimension_key(column_values, column_fields),
-                "label": _build_dimension_label(tuple(column_values), bool(column_fields)),
-                "values": list(column_values),
-            }
-
-        if row_key not in cell_buckets:
-            cell_buckets[row_key] = {}
-        if column_key not in cell_buckets[row_key]:
-            cell_buckets[row_key][column_key] = {}
-
-        if row_fields:
-            for depth, field_key in enumerate(row_fields):
-                prefix = row_key[: depth + 1]
-                _ensure_row_node(
-                    row_nodes,
-                    row_roots,
-                    prefix,
-                    field_key,
-                    row_values[depth] if depth < len(row_values) else None,
-                    depth,
-                )
-                if prefix not in row_prefix_buckets:
-                    row_prefix_buckets[prefix] = {}
-                for metric in base_metrics:
-                    bucket = row_prefix_buckets[prefix].get(metric["key"])
-                    if bucket is None:
-                        bucket = _create_bucket(metric["op"])
-                        row_prefix_buckets[prefix][metric["key"]] = bucket
-                    _update_bucket(bucket, _resolve_record_value(record, metric["source_key"]))
-
-        if column_fields:
-            for depth, _field_key in enumerate(column_fields):
-                prefix = column_key[: depth + 1]
-                if prefix not in column_prefix_buckets:
-                    column_prefix_buckets[prefix] = {}
-                for metric in base_metrics:
-                    bucket = column_prefix_buckets[prefix].get(metric["key"])
-                    if bucket is None:
-                        bucket = _create_bucket(metric["op"])
-                        column_prefix_buckets[prefix][metric["key"]] = bucket
-                    _update_bucket(bucket, _resolve_record_value(record, metric["source_key"]))
-
-        for metric in base_metrics:
-            metric_key = metric["key"]
-            bucket = cell_buckets[row_key][column_key].get(metric_key)
-            if bucket is None:
-                bucket = _create_bucket(metric["op"])
-                cell_buckets[row_key][column_key][metric_key] = bucket
-            _update_bucket(bucket, _resolve_record_value(record, metric["source_key"]))
-
-            total_bucket = total_buckets.get(metric_key)
-            if total_bucket is None:
-                total_bucket = _create_bucket(metric["op"])
-                total_buckets[metric_key] = total_bucket
-            _update_bucket(total_bucket, _resolve_record_value(record, metric["source_key"]))
-
-    if row_fields:
-        row_prefix_totals = _finalize_prefix_totals(row_prefix_buckets, metrics)
-        for prefix, node in row_nodes.items():
-            node["totals"] = row_prefix_totals.get(prefix, {})
-    else:
-        row_prefix_totals = {}
-
-    column_prefix_totals = _finalize_prefix_totals(column_prefix_buckets, metrics)
-
-    if column_order and column_sort_config:
-        _sort_dimension_order(
-            column_order,
-            column_fields,
-            column_sort_config,
-            column_prefix_totals,
-            primary_metric_key,
-        )
-
-    if row_roots and row_sort_config:
-        _sort_row_tree_by_config(row_roots, row_sort_config, primary_metric_key)
-
-    if row_fields and row_roots:
-        row_order = _flatten_row_tree(row_roots)
-
-    columns_result: List[Dict[str, Any]] = []
-    column_entries: List[Dict[str, Any]] = []
-
-    for column_key in column_order:
-        column_meta = column_index[column_key]
-        base_key = column_meta["key"]
-        base_label = column_meta["label"]
-        for metric in metrics:
-            column_key_value = f"{base_key}::{metric['key']}"
-            label = metric["label"]
-            if base_label != "Все записи":
-                label = f"{base_label} - {label}"
-            entry = {
-                "key": column_key_value,
-                "label": label,
-                "base_key": base_key,
-                "column_key": column_key,
-                "metric_key": metric["key"],
-                "metric_type": metric["type"],
-                "op": metric["op"],
-                "expression": metric["expression"],
-            }
-            column_rules = _collect_column_rules(entry, rules)
-            column_payload = {
-                "key": entry["key"],
-                "label": entry["label"],
-                "values": column_meta.get("values", []),
-            }
-            if column_rules:
-                column_payload["formatting"] = column_rules
-            columns_result.append(column_payload)
-            column_entries.append(entry)
-
-    rows_result_map: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
-    for row_key, row_meta in row_index.items():
-        column_contexts: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
-        for column_key in column_order:
-            ctx: Dict[str, Any] = {}
-            for metric in base_metrics:
-                bucket = (
-                    cell_buckets.get(row_key, {})
-                    .get(column_key, {})
-                    .get(metric["key"])
-                )
-                ctx[metric["key"]] = _finalize_bucket(bucket, metric["op"])
-            column_contexts[column_key] = ctx
-
-        cells: List[Dict[str, Any]] = []
-        for column in column_entries:
-            column_key = column["column_key"]
-            metric_key = column["metric_key"]
-            if column["metric_type"] == "formula":
-                ctx = column_contexts[column_key]
-                try:
-                    value = _safe_eval(column["expression"], ctx)
-                except Exception:
-                    value = None
-                ctx[metric_key] = value
-            else:
-                value = column_contexts[column_key].get(metric_key)
-
-            cells.append(
-                {
-                    "key": f"{row_meta['key']}||{column['base_key']}||{metric_key}",
-                    "value": value,
-                }
-            )
-
-        rows_result_map[row_key] = {
-            "key": row_meta["key"],
-            "label": row_meta["label"],
-            "values": row_meta.get("values", []),
-            "cells": cells,
-        }
-
-    if not row_order and row_index:
-        row_order = list(row_index.keys())
-
-    rows_result = [
-        rows_result_map[row_key]
-        for row_key in row_order
-        if row_key in rows_result_map
-    ]
-
-    totals: Dict[str, Any] | None = None
-    if metrics:
-        totals = {}
-        for metric in base_metrics:
-            totals[metric["key"]] = _finalize_bucket(
-                total_buckets.get(metric["key"]),
-                metric["op"],
-            )
-        for metric in metrics:
-            if metric["type"] != "formula":
-                continue
-            try:
-                value = _safe_eval(metric["expression"], totals)
-            except Exception:
-                value = None
-            totals[metric["key"]] = value
-
-    return {
-        "columns": columns_result,
-        "rows": rows_result,
-        "totals": totals,
-    }
+    # lazy import: pivot_streaming зависит от helpers этого модуля
+    from app.services.pivot_streaming import StreamingPivotAggregator
+
+    aggregator = StreamingPivotAggregator(snapshot)
+    aggregator.update(records)
+    result = aggregator.finalize()
+    if include_row_tree:
+        result["rowTree"] = aggregator.row_tree()
+    return result
@@ -0,0 +1,167 @@
+import heapq
+import json
+import os
+import pickle
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from uuid import uuid4
+
+from app.services import pivot_core
+from app.services.sketches import hash64
+
+CellEntry = Tuple[Tuple[Any, ...], Tuple[Any, ...], Dict[str, Dict[str, Any]]]
+CellBuckets = Dict[Tuple[Any, ...], Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]]]
+
+
+def cell_hash(row_key: Tuple[Any, ...], column_key: Tuple[Any, ...]) -> int:
+    """Стабильный 64-битный хеш ключа ячейки (для оценки числа различных ячеек при spill)."""
+    return hash64(json.dumps([row_key, column_key], ensure_ascii=False, separators=(",", ":")))
+
+
+def write_run(directory: str, cells: CellBuckets) -> Tuple[str, int, int]:
+    """
+    Пишет ячейки агрегата на диск одним отсортированным run-файлом (JSON lines,
+    порядок по (row_key, column_key)). Возвращает путь, число ячеек и размер файла.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"pivot-{uuid4().hex}.run")
+    count = 0
+    with open(path, "w", encoding="utf-8") as handle:
+        for row_key in sorted(cells):
+            columns = cells[row_key]
+            for column_key in sorted(columns):
+                buckets = {key: pivot_core._bucket_to_state(bucket) for key, bucket in columns[column_key].items()}
+                handle.write(
+                    json.dumps(
+                        [list(row_key), list(column_key), buckets],
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                        default=str,
+                    )
+                )
+                handle.write("\n")
+                count += 1
+    return path, count, os.path.getsize(path)
+
+
+def _iter_run(path: str) -> Iterator[CellEntry]:
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            row_key, column_key, buckets = json.loads(line)
+            yield (
+                tuple(row_key),
+                tuple(column_key),
+                {key: pivot_core._bucket_from_state(state) for key, state in buckets.items()},
+            )
+
+
+def _iter_memory(cells: CellBuckets) -> Iterator[CellEntry]:
+    for row_key in sorted(cells):
+        columns = cells[row_key]
+        for column_key in sorted(columns):
+            yield row_key, column_key, columns[column_key]
+
+
+def iter_merged_rows(paths: List[str], cells: CellBuckets) -> Iterator[Tuple[Tuple[Any, ...], Dict[Tuple[Any, ...], Any]]]:
+    """
+    Внешнее k-way слияние run-файлов и ячеек в памяти. Одинаковые ячейки
+    сливаются через _merge_bucket; результат группируется по row_key.
+    Ячейки в памяти идут последним источником, поэтому при слиянии они
+    вливаются в свежие корзины из файлов и сами не изменяются.
+    """
+    sources: List[Iterable[CellEntry]] = [_iter_run(path) for path in paths]
+    sources.append(_iter_memory(cells))
+    merged = heapq.merge(*sources, key=lambda entry: (entry[0], entry[1]))
+
+    current_row: Tuple[Any, ...] | None = None
+    current_columns: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
+    for row_key, column_key, buckets in merged:
+        if row_key != current_row:
+            if current_row is not None:
+                yield current_row, current_columns
+            current_row = row_key
+            current_columns = {}
+        existing = current_columns.get(column_key)
+        if existing is None:
+            current_columns[column_key] = buckets
+            continue
+        for metric_key, bucket in buckets.items():
+            target = existing.get(metric_key)
+            if target is None:
+                existing[metric_key] = bucket
+            else:
+                pivot_core._merge_bucket(target, bucket)
+    if current_row is not None:
+        yield current_row, current_columns
+
+
+def write_row_results(
+    directory: str,
+    rows: Iterable[Tuple[Tuple[Any, ...], Dict[str, Any]]],
+) -> Tuple[str, Dict[Tuple[Any, ...], Tuple[int, int]]]:
+    """
+    Пишет готовые строки pivot (в порядке слияния run-файлов) в один файл и
+    возвращает путь и смещения строк по row_key: строки затем читаются в порядке
+    pivot, а в памяти остаются только смещения. Строки хранятся в pickle, чтобы
+    значения ячеек вернулись без изменения типов.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"pivot-rows-{uuid4().hex}.run")
+    offsets: Dict[Tuple[Any, ...], Tuple[int, int]] = {}
+    try:
+        with open(path, "wb") as handle:
+            for row_key, row in rows:
+                data = pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL)
+                offsets[row_key] = (handle.tell(), len(data))
+                handle.write(data)
+    except BaseException:
+        remove_runs([path])
+        raise
+    return path, offsets
+
+
+def iter_row_results(
+    path: str,
+    offsets: Dict[Tuple[Any, ...], Tuple[int, int]],
+    order: Iterable[Tuple[Any, ...]],
+) -> Iterator[Tuple[Tuple[Any, ...], Dict[str, Any] | None]]:
+    """Строки из write_row_results в порядке order; None — строки нет в файле."""
+    with open(path, "rb") as handle:
+        for row_key in order:
+            position = offsets.get(row_key)
+            if position is None:
+                yield row_key, None
+                continue
+            handle.seek(position[0])
+            yield row_key, pickle.loads(handle.read(position[1]))
+
+
+def remove_runs(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+
+def cleanup_stale_runs(directory: str, ttl_seconds: int) -> int:
+    """Удаляет run-файлы, оставшиеся от упавших запросов."""
+    if ttl_seconds <= 0:
+        return 0
+    try:
+        entries = os.listdir(directory)
+    except OSError:
+        return 0
+    now = time.time()
+    removed = 0
+    for name in entries:
+        if not name.endswith(".run"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.stat(path).st_mtime > ttl_seconds:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
@@ -1,6 +1,20 @@
-from typing import Any, Dict, List, Tuple
+import json
+import struct
+import tempfile
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
-from app.services import pivot_core
+from app.services import pivot_core, pivot_spill
+from app.services.sketches import FrequentItems, HyperLogLog, hash64
+
+STATE_SCHEMA_VERSION = 3
+_SUPPORTED_STATE_VERSIONS = {1, 2, STATE_SCHEMA_VERSION}
+_STATE_MAGIC = b"RPAG"
+_STATE_HEADER = struct.Struct(">4sH")
+
+# строка итогов экспорта
+TOTALS_ROW_KEY = "__TOTAL__"
+TOTALS_ROW_LABEL = "Итого"
 
 
 def _snapshot_to_dict(snapshot: Any) -> Dict[str, Any]:
@@ -18,21 +32,61 @@ class StreamingPivotAggregator:
         *,
         max_groups: int | None = None,
         max_unique_values_per_dim: int | None = None,
+        top_n_candidate_factor: int | None = None,
+        spill_max_cells: int | None = None,
+        spill_dir: str | None = None,
     ) -> None:
         snapshot_dict = _snapshot_to_dict(snapshot)
+        self._snapshot = snapshot_dict
+        self._top_n_candidate_factor = top_n_candidate_factor
         pivot = snapshot_dict.get("pivot") or {}
         self._row_fields = pivot.get("rows") or []
         self._column_fields = pivot.get("columns") or []
         metrics_input = snapshot_dict.get("metrics") or []
 
-        self._metrics = [pivot_core._extract_metric(metric) for metric in metrics_input]
+        distinct_defaults = pivot_core._resolve_distinct_defaults()
+        self._metrics = [pivot_core._extract_metric(metric, distinct_defaults) for metric in metrics_input]
         self._base_metrics = [metric for metric in self._metrics if metric["type"] != "formula"]
+        self._base_metrics_by_key = {metric["key"]: metric for metric in self._base_metrics}
         self._rules = pivot_core._normalize_rules(snapshot_dict.get("conditionalFormatting") or [])
         options = snapshot_dict.get("options") or {}
         sorts = options.get("sorts") or {}
         self._row_sort_config = pivot_core._normalize_sort_config(self._row_fields, sorts.get("rows") or {})
         self._column_sort_config = pivot_core._normalize_sort_config(self._column_fields, sorts.get("columns") or {})
         self._primary_metric_key = self._metrics[0]["key"] if self._metrics else None
+        self._top_n = {
+            **pivot_core._normalize_top_n_config(self._row_fields, options.get("topN") or {}),
+            **pivot_core._normalize_top_n_config(self._column_fields, options.get("topN") or {}),
+        }
+        # вес кандидата в streaming: сумма значений основной метрики или число записей.
+        # Для avg, min/max, перцентилей, count_distinct и формул это приближение —
+        # итоговый top-N выбирается по финализированному значению метрики
+        primary_metric = self._metrics[0] if self._metrics else None
+        self._top_n_metric = (
+            primary_metric
+            if primary_metric and primary_metric["type"] != "formula" and primary_metric["op"] not in ("count", "count_distinct")
+            else None
+        )
+        # кандидаты top-N: значения со своими группами и их точный вес с момента допуска
+        self._top_n_admitted: Dict[str, Dict[str, float]] = {key: {} for key in self._top_n}
+        # вытесненные кандидаты: их группы уже в «Прочее», повторно они не допускаются
+        self._top_n_evicted: Dict[str, set[str]] = {key: set() for key in self._top_n}
+        # значения, записи которых ушли в «Прочее» при исчерпании бюджета групп (итоги приближённые)
+        self._top_n_approximate: Dict[str, set[str]] = {}
+        self._top_n_frozen = False
+        # все измерения под top-N: после заморозки число групп ограничено кандидатами
+        self._top_n_bounded = bool(self._top_n) and all(
+            field_key in self._top_n for field_key in self._row_fields + self._column_fields
+        )
+        self._top_n_budgets: Dict[str, int | None] = {}
+        self._top_n_sketches: Dict[str, FrequentItems] = {}
+        self._top_n_floor: Dict[str, float] = {}
+        for field_key, entry in self._top_n.items():
+            budget = entry["limit"] * top_n_candidate_factor if top_n_candidate_factor else None
+            self._top_n_budgets[field_key] = budget
+            if budget:
+                self._top_n_sketches[field_key] = FrequentItems(budget * 2)
+                self._top_n_floor[field_key] = float("-inf")
 
         self._row_order: List[Tuple[Any, ...]] = []
         self._row_index: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
@@ -45,14 +99,31 @@ class StreamingPivotAggregator:
         self._row_roots: List[Dict[str, Any]] = []
         self._row_prefix_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
         self._column_prefix_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
+        # итоги колонок и колонки результата последнего _finalize_columns (для totals_row)
+        self._column_totals: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        self._column_entries: List[Dict[str, Any]] = []
 
         self._max_groups = max_groups if max_groups and max_groups > 0 else None
         self._max_unique_values_per_dim = (
             max_unique_values_per_dim if max_unique_values_per_dim and max_unique_values_per_dim > 0 else None
         )
         self._group_count = 0
+        # spill-to-disk: при превышении бюджета ячеек в памяти они сбрасываются
+        # в отсортированный run-файл; top-N сам ограничивает память, поэтому с ним spill не нужен
+        self._spill_max_cells = spill_max_cells if spill_max_cells and spill_max_cells > 0 and not self._top_n else None
+        self._spill_dir = spill_dir or tempfile.gettempdir()
+        self._spill_paths: List[str] = []
+        self._memory_cells = 0
+        # при spill ячейка из прошлого run не новая группа: число различных ячеек
+        # для max_groups оценивается HLL по стабильному хешу ключа и проверяется
+        # точно при слиянии run-файлов
+        self._spill_group_sketch = HyperLogLog() if self._spill_max_cells and self._max_groups else None
+        # итоги листьев дерева строк при spill не копятся отдельно — они
+        # собираются из слитых ячеек строки при финализации
+        self._leaf_from_cells = bool(self._spill_max_cells and self._row_fields)
+        self.spill_stats = {"runs": 0, "cells": 0, "bytes": 0}
         self._unique_values: Dict[str, set[str]] = {
-            key: set() for key in (self._row_fields + self._column_fields)
+            key: set() for key in (self._row_fields + self._column_fields) if key not in self._top_n
         }
 
         if not self._column_fields and not self._column_order:
@@ -74,6 +145,8 @@ class StreamingPivotAggregator:
         if not self._max_unique_values_per_dim:
             return
         for field_key, value in zip(fields, values):
+            if field_key in self._top_n:
+                continue
             normalized = pivot_core._normalize_value_for_key(value)
             seen = self._unique_values.setdefault(field_key, set())
             if normalized in seen:
@@ -85,20 +158,278 @@ class StreamingPivotAggregator:
                 )
             seen.add(normalized)
 
-    def _increment_group_count(self) -> None:
+    def _increment_group_count(self, row_key: Tuple[Any, ...], column_key: Tuple[Any, ...]) -> None:
+        if self._spill_max_cells:
+            self._memory_cells += 1
+            if self._spill_group_sketch is not None:
+                self._spill_group_sketch.add(pivot_spill.cell_hash(row_key, column_key))
+            if self._spill_paths:
+                # ячейка может повторять сброшенную: проверка — при spill и слиянии run-файлов
+                return
         if not self._max_groups:
             return
-        if self._group_count + 1 > self._max_groups:
+        if self._group_count + 1 > self._max_groups and not (self._top_n_frozen and self._top_n_bounded):
             raise ValueError(
                 f"Streaming groups limit exceeded: {self._group_count + 1} > {self._max_groups}"
             )
         self._group_count += 1
 
-    def update(self, records: List[Dict[str, Any]]) -> None:
-        for record in records or []:
+    def _top_n_weight(self, record: Dict[str, Any], by: str) -> float:
+        if by == "count" or self._top_n_metric is None:
+            return 1.0
+        value = pivot_core._resolve_record_value(record, self._top_n_metric["source_key"])
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def _admit_top_n_value(self, field_key: str, normalized: str, weight: float) -> bool:
+        admitted = self._top_n_admitted[field_key]
+        sketch = self._top_n_sketches.get(field_key)
+        seen_before = 0.0
+        if sketch is not None:
+            seen_before = sketch.upper_bound(normalized)
+            sketch.add(normalized, weight)
+        if normalized in admitted:
+            admitted[normalized] += weight
+            return True
+        if normalized in self._top_n_evicted[field_key]:
+            return False
+        budget = self._top_n_budgets.get(field_key)
+        if budget is None or len(admitted) < budget:
+            admitted[normalized] = weight
+            return True
+        if sketch is None:
+            return False
+        # вытесняем самого слабого кандидата, только если новое значение
+        # гарантированно тяжелее (нижняя оценка скетча выше его точного веса)
+        estimate = sketch.lower_bound(normalized)
+        if estimate <= self._top_n_floor[field_key]:
+            return False
+        weakest = min(admitted, key=admitted.__getitem__)
+        self._top_n_floor[field_key] = admitted[weakest]
+        if estimate <= admitted[weakest]:
+            return False
+        del admitted[weakest]
+        self._top_n_evicted[field_key].add(weakest)
+        self._fold_top_n_values(field_key, {weakest})
+        admitted[normalized] = weight
+        if seen_before:
+            # прежние записи значения могли уйти в «Прочее» до допуска
+            self._top_n_approximate.setdefault(field_key, set()).add(normalized)
+        return True
+
+    def _route_top_n_values(
+        self,
+        record: Dict[str, Any],
+        fields: List[str],
+        values: List[Any],
+        force_other: bool = False,
+    ) -> None:
+        for idx, field_key in enumerate(fields):
+            entry = self._top_n.get(field_key)
+            if entry is None or pivot_core._is_other_value(values[idx]):
+                continue
+            if force_other:
+                normalized = pivot_core._normalize_value_for_key(values[idx])
+                if normalized in self._top_n_admitted[field_key]:
+                    self._top_n_approximate.setdefault(field_key, set()).add(normalized)
+                values[idx] = pivot_core.OTHER_VALUE
+                continue
+            normalized = pivot_core._normalize_value_for_key(values[idx])
+            if not self._admit_top_n_value(field_key, normalized, self._top_n_weight(record, entry["by"])):
+                values[idx] = pivot_core.OTHER_VALUE
+
+    def _freeze_top_n(self) -> None:
+        """Фиксирует число кандидатов на текущем: дальше допуск возможен только с вытеснением."""
+        self._top_n_frozen = True
+        for field_key, admitted in self._top_n_admitted.items():
+            self._top_n_budgets[field_key] = len(admitted)
+
+    def _groups_exhausted(self, row_key: Tuple[Any, ...], column_key: Tuple[Any, ...]) -> bool:
+        if not self._max_groups or self._group_count < self._max_groups:
+            return False
+        return column_key not in self._cell_buckets.get(row_key, {})
+
+    def _other_meta(self, meta: Dict[str, Any], idx: int, fields: List[str]) -> Dict[str, Any]:
+        values = list(meta.get("values", []))
+        values[idx] = pivot_core.OTHER_VALUE
+        return {
+            "key": pivot_core._build_dimension_key(tuple(values), fields),
+            "label": pivot_core._build_dimension_label(tuple(values), True),
+            "values": values,
+        }
+
+    def _fold_dimension(
+        self,
+        order: List[Tuple[Any, ...]],
+        index: Dict[Tuple[Any, ...], Dict[str, Any]],
+        fields: List[str],
+        prefix_buckets: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]],
+        idx: int,
+        values: set[str],
+    ) -> Tuple[Dict[Tuple[Any, ...], Tuple[Any, ...]], List[Tuple[Any, ...]], Dict[Tuple[Any, ...], Dict[str, Any]]]:
+        def remap_key(key: Tuple[Any, ...]) -> Tuple[Any, ...]:
+            return key[:idx] + (pivot_core.OTHER_VALUE,) + key[idx + 1 :]
+
+        remap = {key: remap_key(key) for key in order if len(key) > idx and key[idx] in values}
+        if not remap:
+            return remap, order, index
+
+        new_order: List[Tuple[Any, ...]] = []
+        new_index: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for key in order:
+            target = remap.get(key, key)
+            if target in new_index:
+                continue
+            new_order.append(target)
+            new_index[target] = index[target] if target in index else self._other_meta(index[key], idx, fields)
+
+        for prefix in [prefix for prefix in prefix_buckets if len(prefix) > idx and prefix[idx] in values]:
+            buckets = prefix_buckets.pop(prefix)
+            target = remap_key(prefix)
+            if target in prefix_buckets:
+                self._merge_metric_buckets(prefix_buckets[target], buckets)
+            else:
+                prefix_buckets[target] = buckets
+        return remap, new_order, new_index
+
+    def _merge_cell(
+        self,
+        target_row: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]],
+        column_key: Tuple[Any, ...],
+        metric_buckets: Dict[str, Dict[str, Any]],
+    ) -> None:
+        existing = target_row.get(column_key)
+        if existing is None:
+            target_row[column_key] = metric_buckets
+            return
+        self._merge_metric_buckets(existing, metric_buckets)
+        if self._max_groups:
+            self._group_count -= 1
+
+    def _rebuild_row_tree(self) -> None:
+        self._row_nodes = {}
+        self._row_roots = []
+        for row_key in self._row_order:
+            values = self._row_index[row_key].get("values", [])
+            for depth, field_key in enumerate(self._row_fields):
+                pivot_core._ensure_row_node(
+                    self._row_nodes,
+                    self._row_roots,
+                    row_key[: depth + 1],
+                    field_key,
+                    values[depth] if depth < len(values) else None,
+                    depth,
+                )
+
+    def _fold_top_n_values(self, field_key: str, values: set[str]) -> None:
+        """Сворачивает группы с указанными значениями измерения в «Прочее» (итоги остаются точными)."""
+        if not values:
+            return
+        if field_key in self._row_fields:
+            remap, self._row_order, self._row_index = self._fold_dimension(
+                self._row_order,
+                self._row_index,
+                self._row_fields,
+                self._row_prefix_buckets,
+                self._row_fields.index(field_key),
+                values,
+            )
+            for row_key, target in remap.items():
+                columns = self._cell_buckets.pop(row_key, None) or {}
+                target_row = self._cell_buckets.setdefault(target, {})
+                for column_key, metric_buckets in columns.items():
+                    self._merge_cell(target_row, column_key, metric_buckets)
+            if remap:
+                self._rebuild_row_tree()
+            return
+        remap, self._column_order, self._column_index = self._fold_dimension(
+            self._column_order,
+            self._column_index,
+            self._column_fields,
+            self._column_prefix_buckets,
+            self._column_fields.index(field_key),
+            values,
+        )
+        if not remap:
+            return
+        for columns in self._cell_buckets.values():
+            for column_key in [column_key for column_key in columns if column_key in remap]:
+                self._merge_cell(columns, remap[column_key], columns.pop(column_key))
+
+    def _top_n_metric_totals(self, field_key: str) -> Dict[str, Any]:
+        """
+        Итог основной метрики по каждому значению измерения: промежуточные итоги
+        префиксов уровня поля, слитые по значению и финализированные по op метрики
+        (avg, min/max, перцентили, count_distinct и формулы — как в самом view).
+        """
+        if field_key in self._row_fields:
+            idx = self._row_fields.index(field_key)
+            prefix_buckets = self._row_prefix_buckets
+        else:
+            idx = self._column_fields.index(field_key)
+            prefix_buckets = self._column_prefix_buckets
+        by_value: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]] = {}
+        for prefix, metric_buckets in prefix_buckets.items():
+            if len(prefix) != idx + 1:
+                continue
+            if idx == 0:
+                by_value[prefix] = metric_buckets
+            else:
+                self._merge_metric_buckets(by_value.setdefault((prefix[idx],), {}), metric_buckets)
+        totals = pivot_core._finalize_prefix_totals(by_value, self._metrics)
+        return {key[0]: context.get(self._primary_metric_key) for key, context in totals.items()}
+
+    def _trim_top_n(self, field_key: str, keep: int, weights: Dict[str, Any] | None = None) -> None:
+        """Оставляет keep кандидатов с наибольшим весом (по умолчанию — накопленным при допуске)."""
+        admitted = self._top_n_admitted[field_key]
+        if len(admitted) <= keep:
+            return
+        weights = admitted if weights is None else weights
+
+        def rank(value: str) -> Tuple[bool, float]:
+            number = pivot_core._to_sort_number(weights.get(value))
+            return (number is None, -number if number is not None else 0.0)
+
+        ranked = sorted(admitted, key=rank)
+        tail = set(ranked[keep:])
+        for value in tail:
+            del admitted[value]
+        self._top_n_evicted[field_key].update(tail)
+        self._fold_top_n_values(field_key, tail)
+
+    def update(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Добавляет записи; records может быть генератором (fused-конвейер потокового режима)."""
+        base_metrics = self._base_metrics
+        spill_max_cells = self._spill_max_cells
+        row_prefix_depth = len(self._row_fields) - 1 if self._leaf_from_cells else len(self._row_fields)
+        for record in records or ():
+            # значения метрик читаются из записи один раз на все уровни агрегации
+            metric_values = [
+                pivot_core._resolve_record_value(record, metric["source_key"]) for metric in base_metrics
+            ]
             row_values = [pivot_core._resolve_record_value(record, field) for field in self._row_fields]
-            self._track_unique_values(self._row_fields, row_values)
+            column_values = [pivot_core._resolve_record_value(record, field) for field in self._column_fields]
+            if self._top_n:
+                self._route_top_n_values(record, self._row_fields, row_values)
+                self._route_top_n_values(record, self._column_fields, column_values)
             row_key = tuple(pivot_core._normalize_value_for_key(value) for value in row_values)
+            column_key = tuple(pivot_core._normalize_value_for_key(value) for value in column_values)
+            if self._top_n and self._groups_exhausted(row_key, column_key):
+                # бюджет групп исчерпан: число кандидатов фиксируется — новое значение
+                # допускается только вместо вытесненного более лёгкого кандидата.
+                # Если все измерения под top-N, группы ограничены кандидатами и
+                # новая ячейка допустима; иначе запись уходит в «Прочее» по top-N
+                # измерениям, а затронутые значения помечаются приближёнными
+                self._freeze_top_n()
+                if not self._top_n_bounded:
+                    self._route_top_n_values(record, self._row_fields, row_values, force_other=True)
+                    self._route_top_n_values(record, self._column_fields, column_values, force_other=True)
+                    row_key = tuple(pivot_core._normalize_value_for_key(value) for value in row_values)
+                    column_key = tuple(pivot_core._normalize_value_for_key(value) for value in column_values)
+
+            self._track_unique_values(self._row_fields, row_values)
             if row_key not in self._row_index:
                 self._row_order.append(row_key)
                 self._row_index[row_key] = {
@@ -107,9 +438,7 @@ class StreamingPivotAggregator:
                     "values": list(row_values),
                 }
 
-            column_values = [pivot_core._resolve_record_value(record, field) for field in self._column_fields]
             self._track_unique_values(self._column_fields, column_values)
-            column_key = tuple(pivot_core._normalize_value_for_key(value) for value in column_values)
             if column_key not in self._column_index:
                 self._column_order.append(column_key)
                 self._column_index[column_key] = {
@@ -121,7 +450,7 @@ class StreamingPivotAggregator:
             if row_key not in self._cell_buckets:
                 self._cell_buckets[row_key] = {}
             if column_key not in self._cell_buckets[row_key]:
-                self._increment_group_count()
+                self._increment_group_count(row_key, column_key)
                 self._cell_buckets[row_key][column_key] = {}
 
             if self._row_fields:
@@ -135,56 +464,393 @@ class StreamingPivotAggregator:
                         row_values[depth] if depth < len(row_values) else None,
                         depth,
                     )
+                    if depth >= row_prefix_depth:
+                        continue
                     if prefix not in self._row_prefix_buckets:
                         self._row_prefix_buckets[prefix] = {}
-                    for metric in self._base_metrics:
+                    for metric, metric_value in zip(base_metrics, metric_values):
                         bucket = self._row_prefix_buckets[prefix].get(metric["key"])
                         if bucket is None:
-                            bucket = pivot_core._create_bucket(metric["op"])
+                            bucket = pivot_core._create_bucket(metric["op"], metric["distinct_precision"])
                             self._row_prefix_buckets[prefix][metric["key"]] = bucket
-                        pivot_core._update_bucket(
-                            bucket, pivot_core._resolve_record_value(record, metric["source_key"])
-                        )
+                        pivot_core._update_bucket(bucket, metric_value)
 
             if self._column_fields:
                 for depth, _field_key in enumerate(self._column_fields):
                     prefix = column_key[: depth + 1]
                     if prefix not in self._column_prefix_buckets:
                         self._column_prefix_buckets[prefix] = {}
-                    for metric in self._base_metrics:
+                    for metric, metric_value in zip(base_metrics, metric_values):
                         bucket = self._column_prefix_buckets[prefix].get(metric["key"])
                         if bucket is None:
-                            bucket = pivot_core._create_bucket(metric["op"])
+                            bucket = pivot_core._create_bucket(metric["op"], metric["distinct_precision"])
                             self._column_prefix_buckets[prefix][metric["key"]] = bucket
-                        pivot_core._update_bucket(
-                            bucket, pivot_core._resolve_record_value(record, metric["source_key"])
-                        )
+                        pivot_core._update_bucket(bucket, metric_value)
 
-            for metric in self._base_metrics:
+            cell = self._cell_buckets[row_key][column_key]
+            for metric, metric_value in zip(base_metrics, metric_values):
                 metric_key = metric["key"]
-                bucket = self._cell_buckets[row_key][column_key].get(metric_key)
+                bucket = cell.get(metric_key)
                 if bucket is None:
-                    bucket = pivot_core._create_bucket(metric["op"])
-                    self._cell_buckets[row_key][column_key][metric_key] = bucket
-                pivot_core._update_bucket(
-                    bucket, pivot_core._resolve_record_value(record, metric["source_key"])
-                )
+                    bucket = pivot_core._create_bucket(metric["op"], metric["distinct_precision"])
+                    cell[metric_key] = bucket
+                pivot_core._update_bucket(bucket, metric_value)
 
                 total_bucket = self._total_buckets.get(metric_key)
                 if total_bucket is None:
-                    total_bucket = pivot_core._create_bucket(metric["op"])
+                    total_bucket = pivot_core._create_bucket(metric["op"], metric["distinct_precision"])
                     self._total_buckets[metric_key] = total_bucket
-                pivot_core._update_bucket(
-                    total_bucket, pivot_core._resolve_record_value(record, metric["source_key"])
+                pivot_core._update_bucket(total_bucket, metric_value)
+            if spill_max_cells and self._memory_cells >= spill_max_cells:
+                self._maybe_spill()
+
+    def _maybe_spill(self) -> None:
+        if not self._spill_max_cells or self._memory_cells < self._spill_max_cells:
+            return
+        path, cells, size = pivot_spill.write_run(self._spill_dir, self._cell_buckets)
+        self._spill_paths.append(path)
+        self._cell_buckets = {}
+        self._memory_cells = 0
+        self.spill_stats["runs"] += 1
+        self.spill_stats["cells"] += cells
+        self.spill_stats["bytes"] += size
+        if self._spill_group_sketch is not None:
+            estimate = self._spill_group_sketch.count()
+            if estimate > self._max_groups:
+                raise ValueError(f"Streaming groups limit exceeded: {estimate} > {self._max_groups}")
+
+    def _iter_cell_rows(self) -> Iterator[Tuple[Tuple[Any, ...], Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]]]]:
+        if not self._spill_paths:
+            return iter(self._cell_buckets.items())
+        return self._iter_spilled_rows()
+
+    def _iter_spilled_rows(self) -> Iterator[Tuple[Tuple[Any, ...], Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]]]]:
+        """Слияние run-файлов с точной проверкой max_groups (при spill число групп до этого оценочное)."""
+        cells = 0
+        for row_key, columns in pivot_spill.iter_merged_rows(self._spill_paths, self._cell_buckets):
+            cells += len(columns)
+            if self._max_groups and cells > self._max_groups:
+                raise ValueError(f"Streaming groups limit exceeded: {cells} > {self._max_groups}")
+            yield row_key, columns
+
+    def _leaf_buckets(self, row_cells: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Корзины листа дерева строк: слияние ячеек строки по всем колонкам."""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for metric_buckets in row_cells.values():
+            self._merge_metric_buckets(merged, metric_buckets)
+        return merged
+
+    def _leaf_totals(self, row_cells: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        return pivot_core._finalize_prefix_totals({(): self._leaf_buckets(row_cells)}, self._metrics)[()]
+
+    def cleanup(self) -> None:
+        """Удаляет run-файлы spill (вызывается после finalize или при ошибке)."""
+        pivot_spill.remove_runs(self._spill_paths)
+        self._spill_paths = []
+
+    def _new_bucket(self, metric_key: str) -> Dict[str, Any]:
+        metric = self._base_metrics_by_key.get(metric_key)
+        if not metric:
+            return pivot_core._create_bucket()
+        return pivot_core._create_bucket(metric["op"], metric["distinct_precision"])
+
+    def _state_config(self) -> Dict[str, Any]:
+        return {
+            "rows": list(self._row_fields),
+            "columns": list(self._column_fields),
+            "metrics": [
+                [metric["key"], metric["op"], metric["distinct_precision"]] for metric in self._base_metrics
+            ],
+            **({"topN": self._top_n} if self._top_n else {}),
+        }
+
+    def _merge_metric_buckets(
+        self,
+        target: Dict[str, Dict[str, Any]],
+        source: Dict[str, Dict[str, Any]],
+    ) -> None:
+        for metric_key, bucket in source.items():
+            target_bucket = target.get(metric_key)
+            if target_bucket is None:
+                target_bucket = self._new_bucket(metric_key)
+                target[metric_key] = target_bucket
+            pivot_core._merge_bucket(target_bucket, bucket)
+
+    def _merge_unique_values(self, unique_values: Dict[str, Any]) -> None:
+        for field_key, values in unique_values.items():
+            seen = self._unique_values.setdefault(field_key, set())
+            seen.update(values)
+            if self._max_unique_values_per_dim and len(seen) > self._max_unique_values_per_dim:
+                raise ValueError(
+                    f"Streaming unique values limit exceeded for {field_key}: "
+                    f"{len(seen)} > {self._max_unique_values_per_dim}"
                 )
 
-    def finalize(self) -> Dict[str, Any]:
-        if self._row_fields:
-            row_prefix_totals = pivot_core._finalize_prefix_totals(self._row_prefix_buckets, self._metrics)
-            for prefix, node in self._row_nodes.items():
-                node["totals"] = row_prefix_totals.get(prefix, {})
-        else:
-            row_prefix_totals = {}
+    def merge(self, other: "StreamingPivotAggregator") -> None:
+        """
+        Вливает частичный агрегат other в текущий (например, посчитанный другим воркером
+        или по другому набору чанков). Порядок первого появления: сначала свои ключи,
+        затем новые ключи other.
+        """
+        if self._state_config() != other._state_config():
+            raise ValueError("Cannot merge streaming aggregators with different pivot configuration")
+
+        for row_key, row_meta in other._row_index.items():
+            if row_key not in self._row_index:
+                self._row_order.append(row_key)
+                self._row_index[row_key] = dict(row_meta)
+        for column_key, column_meta in other._column_index.items():
+            if column_key not in self._column_index:
+                self._column_order.append(column_key)
+                self._column_index[column_key] = dict(column_meta)
+
+        for prefix, node in sorted(other._row_nodes.items(), key=lambda item: item[1]["order"]):
+            pivot_core._ensure_row_node(
+                self._row_nodes,
+                self._row_roots,
+                prefix,
+                node["field_key"],
+                node["value"],
+                node["depth"],
+            )
+
+        leaf_depth = len(self._row_fields)
+        for row_key, columns in other._iter_cell_rows():
+            target_row = self._cell_buckets.setdefault(row_key, {})
+            for column_key, metric_buckets in columns.items():
+                if column_key not in target_row:
+                    self._increment_group_count(row_key, column_key)
+                    target_row[column_key] = {}
+                self._merge_metric_buckets(target_row[column_key], metric_buckets)
+            if other._leaf_from_cells and not self._leaf_from_cells:
+                self._merge_metric_buckets(
+                    self._row_prefix_buckets.setdefault(row_key, {}), other._leaf_buckets(columns)
+                )
+            self._maybe_spill()
+
+        for prefix, metric_buckets in other._row_prefix_buckets.items():
+            if self._leaf_from_cells and len(prefix) == leaf_depth:
+                continue
+            self._merge_metric_buckets(self._row_prefix_buckets.setdefault(prefix, {}), metric_buckets)
+        for prefix, metric_buckets in other._column_prefix_buckets.items():
+            self._merge_metric_buckets(self._column_prefix_buckets.setdefault(prefix, {}), metric_buckets)
+        self._merge_metric_buckets(self._total_buckets, other._total_buckets)
+        self._merge_unique_values(other._unique_values)
+        for field_key, values in other._top_n_approximate.items():
+            self._top_n_approximate.setdefault(field_key, set()).update(values)
+
+        for field_key, admitted in other._top_n_admitted.items():
+            target = self._top_n_admitted[field_key]
+            for value, weight in admitted.items():
+                target[value] = target.get(value, 0.0) + weight
+            evicted = self._top_n_evicted[field_key]
+            evicted.update(other._top_n_evicted.get(field_key, ()))
+            # значение, вытесненное в одном из частичных агрегатов, целиком уходит в «Прочее»
+            stale = {value for value in target if value in evicted}
+            for value in stale:
+                del target[value]
+            self._fold_top_n_values(field_key, stale)
+            sketch = other._top_n_sketches.get(field_key)
+            if sketch is not None and field_key in self._top_n_sketches:
+                self._top_n_sketches[field_key].update(sketch)
+            budget = self._top_n_budgets.get(field_key)
+            if budget is not None:
+                self._trim_top_n(field_key, budget)
+
+    def to_state(self) -> Dict[str, Any]:
+        row_keys = list(self._row_index.keys())
+        column_keys = list(self._column_index.keys())
+        row_positions = {key: idx for idx, key in enumerate(row_keys)}
+        column_positions = {key: idx for idx, key in enumerate(column_keys)}
+
+        def dump_buckets(metric_buckets: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+            return {key: pivot_core._bucket_to_state(bucket) for key, bucket in metric_buckets.items()}
+
+        cells = []
+        # при spill листья дерева строк собираются из ячеек: в состоянии они хранятся как обычные префиксы
+        leaf_prefixes = []
+        for row_key, columns in self._iter_cell_rows():
+            for column_key, metric_buckets in columns.items():
+                cells.append([row_positions[row_key], column_positions[column_key], dump_buckets(metric_buckets)])
+            if self._leaf_from_cells:
+                leaf_prefixes.append([list(row_key), dump_buckets(self._leaf_buckets(columns))])
+
+        nodes = sorted(self._row_nodes.values(), key=lambda node: node["order"])
+        return {
+            "version": STATE_SCHEMA_VERSION,
+            "config": self._state_config(),
+            "rows": [[list(key), self._row_index[key]] for key in row_keys],
+            "columns": [[list(key), self._column_index[key]] for key in column_keys],
+            "nodes": [[list(node["path"]), node["field_key"], node["value"]] for node in nodes],
+            "cells": cells,
+            "rowPrefixes": [
+                [list(prefix), dump_buckets(buckets)] for prefix, buckets in self._row_prefix_buckets.items()
+            ]
+            + leaf_prefixes,
+            "columnPrefixes": [
+                [list(prefix), dump_buckets(buckets)] for prefix, buckets in self._column_prefix_buckets.items()
+            ],
+            "totals": dump_buckets(self._total_buckets),
+            "uniqueValues": {key: sorted(values) for key, values in self._unique_values.items()},
+            "topN": {
+                field_key: {
+                    "admitted": [[value, weight] for value, weight in admitted.items()],
+                    "evicted": sorted(self._top_n_evicted[field_key]),
+                    "approximate": sorted(self._top_n_approximate.get(field_key, ())),
+                    "sketch": (
+                        self._top_n_sketches[field_key].to_state() if field_key in self._top_n_sketches else None
+                    ),
+                }
+                for field_key, admitted in self._top_n_admitted.items()
+            },
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        """Вливает сохранённое состояние (см. to_state) в текущий агрегатор."""
+        if not isinstance(state, dict):
+            raise ValueError("Invalid streaming aggregator state")
+        version = state.get("version")
+        if version not in _SUPPORTED_STATE_VERSIONS:
+            raise ValueError(f"Unsupported streaming aggregator state version: {version}")
+        if version == 1:
+            state = _upgrade_state_v1(state)
+        if state.get("version") == 2:
+            state = _upgrade_state_v2(state)
+        if state.get("config") != self._state_config():
+            raise ValueError("Streaming aggregator state does not match pivot configuration")
+
+        other = type(self)(self._snapshot, top_n_candidate_factor=self._top_n_candidate_factor)
+
+        def load_buckets(payload: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+            return {key: pivot_core._bucket_from_state(bucket) for key, bucket in (payload or {}).items()}
+
+        def restore_other(key: Tuple[Any, ...], value: Any, idx: int) -> Any:
+            # в JSON «Прочее» — обычная строка; ключ "__OTHER__" бывает только у «Прочее»
+            return pivot_core.OTHER_VALUE if idx < len(key) and key[idx] == pivot_core.OTHER_VALUE else value
+
+        def load_meta(key: Tuple[Any, ...], meta: Dict[str, Any]) -> Dict[str, Any]:
+            values = [restore_other(key, value, idx) for idx, value in enumerate(meta.get("values") or [])]
+            return {**meta, "values": values}
+
+        row_keys = []
+        for key, meta in state.get("rows") or []:
+            row_key = tuple(key)
+            row_keys.append(row_key)
+            if row_key not in other._row_index:
+                other._row_order.append(row_key)
+            other._row_index[row_key] = load_meta(row_key, meta)
+        column_keys = []
+        for key, meta in state.get("columns") or []:
+            column_key = tuple(key)
+            column_keys.append(column_key)
+            if column_key not in other._column_index:
+                other._column_order.append(column_key)
+            other._column_index[column_key] = load_meta(column_key, meta)
+        for path, field_key, value in state.get("nodes") or []:
+            prefix = tuple(path)
+            pivot_core._ensure_row_node(
+                other._row_nodes,
+                other._row_roots,
+                prefix,
+                field_key,
+                restore_other(prefix, value, len(prefix) - 1),
+                len(prefix) - 1,
+            )
+        for row_position, column_position, buckets in state.get("cells") or []:
+            row_cells = other._cell_buckets.setdefault(row_keys[row_position], {})
+            row_cells[column_keys[column_position]] = load_buckets(buckets)
+        for prefix, buckets in state.get("rowPrefixes") or []:
+            other._row_prefix_buckets[tuple(prefix)] = load_buckets(buckets)
+        for prefix, buckets in state.get("columnPrefixes") or []:
+            other._column_prefix_buckets[tuple(prefix)] = load_buckets(buckets)
+        other._total_buckets = load_buckets(state.get("totals") or {})
+        other._unique_values = {key: set(values) for key, values in (state.get("uniqueValues") or {}).items()}
+        for field_key, payload in (state.get("topN") or {}).items():
+            if field_key not in other._top_n_admitted:
+                continue
+            other._top_n_admitted[field_key] = {str(value): float(weight) for value, weight in payload.get("admitted") or []}
+            other._top_n_evicted[field_key] = {str(value) for value in payload.get("evicted") or []}
+            if payload.get("approximate"):
+                other._top_n_approximate[field_key] = {str(value) for value in payload["approximate"]}
+            if payload.get("sketch") and field_key in other._top_n_sketches:
+                other._top_n_sketches[field_key] = FrequentItems.from_state(payload["sketch"])
+        self.merge(other)
+
+    def serialize(self) -> bytes:
+        payload = json.dumps(self.to_state(), ensure_ascii=False, separators=(",", ":"), default=str)
+        return _STATE_HEADER.pack(_STATE_MAGIC, STATE_SCHEMA_VERSION) + zlib.compress(payload.encode("utf-8"))
+
+    @classmethod
+    def deserialize(
+        cls,
+        snapshot: Any,
+        payload: bytes,
+        *,
+        max_groups: int | None = None,
+        max_unique_values_per_dim: int | None = None,
+        top_n_candidate_factor: int | None = None,
+    ) -> "StreamingPivotAggregator":
+        aggregator = cls(
+            snapshot,
+            max_groups=max_groups,
+            max_unique_values_per_dim=max_unique_values_per_dim,
+            top_n_candidate_factor=top_n_candidate_factor,
+        )
+        aggregator.load_state(decode_state(payload))
+        return aggregator
+
+    def _build_row_result(
+        self,
+        row_key: Tuple[Any, ...],
+        row_cells: Dict[Tuple[Any, ...], Dict[str, Dict[str, Any]]],
+        column_entries: List[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        row_meta = self._row_index[row_key]
+        column_contexts: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for column_key in self._column_order:
+            ctx: Dict[str, Any] = {}
+            for metric in self._base_metrics:
+                bucket = row_cells.get(column_key, {}).get(metric["key"])
+                ctx[metric["key"]] = pivot_core._finalize_bucket(bucket, metric["op"])
+            column_contexts[column_key] = ctx
+
+        cells: List[Dict[str, Any]] = []
+        for column in column_entries:
+            column_key = column["column_key"]
+            metric_key = column["metric_key"]
+            if column["metric_type"] == "formula":
+                ctx = column_contexts[column_key]
+                try:
+                    value = pivot_core._safe_eval(column["expression"], ctx)
+                except Exception:
+                    value = None
+                ctx[metric_key] = value
+            else:
+                value = column_contexts[column_key].get(metric_key)
+
+            cells.append(
+                {
+                    "key": f"{row_meta['key']}||{column['base_key']}||{metric_key}",
+                    "value": value,
+                }
+            )
+
+        return {
+            "key": row_meta["key"],
+            "label": row_meta["label"],
+            "values": row_meta.get("values", []),
+            "cells": cells,
+        }
+
+    def _finalize_columns(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Общая часть finalize: top-N, итоги и сортировка колонок, колонки результата."""
+        for field_key, entry in self._top_n.items():
+            weights = (
+                self._top_n_metric_totals(field_key)
+                if entry["by"] == "metric" and self._primary_metric_key
+                else None
+            )
+            self._trim_top_n(field_key, entry["limit"], weights)
 
         column_prefix_totals = pivot_core._finalize_prefix_totals(self._column_prefix_buckets, self._metrics)
 
@@ -197,13 +863,9 @@ class StreamingPivotAggregator:
                 self._primary_metric_key,
             )
 
-        if self._row_roots and self._row_sort_config:
-            pivot_core._sort_row_tree_by_config(
-                self._row_roots, self._row_sort_config, self._primary_metric_key
-            )
-
-        if self._row_fields and self._row_roots:
-            self._row_order = pivot_core._flatten_row_tree(self._row_roots)
+        if self._top_n:
+            # «Прочее» всегда в конце своего уровня, независимо от сортировки
+            self._column_order.sort(key=lambda key: tuple(part == pivot_core.OTHER_VALUE for part in key))
 
         columns_result: List[Dict[str, Any]] = []
         column_entries: List[Dict[str, Any]] = []
@@ -237,73 +899,293 @@ class StreamingPivotAggregator:
                     column_payload["formatting"] = column_rules
                 columns_result.append(column_payload)
                 column_entries.append(entry)
+        self._column_totals = column_prefix_totals
+        self._column_entries = column_entries
+        return columns_result, column_entries
 
-        rows_result_map: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
-        for row_key, row_meta in self._row_index.items():
-            column_contexts: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
-            for column_key in self._column_order:
-                ctx: Dict[str, Any] = {}
-                for metric in self._base_metrics:
-                    bucket = self._cell_buckets.get(row_key, {}).get(column_key, {}).get(metric["key"])
-                    ctx[metric["key"]] = pivot_core._finalize_bucket(bucket, metric["op"])
-                column_contexts[column_key] = ctx
-
-            cells: List[Dict[str, Any]] = []
-            for column in column_entries:
-                column_key = column["column_key"]
-                metric_key = column["metric_key"]
-                if column["metric_type"] == "formula":
-                    ctx = column_contexts[column_key]
-                    try:
-                        value = pivot_core._safe_eval(column["expression"], ctx)
-                    except Exception:
-                        value = None
-                    ctx[metric_key] = value
-                else:
-                    value = column_contexts[column_key].get(metric_key)
-
-                cells.append(
-                    {
-                        "key": f"{row_meta['key']}||{column['base_key']}||{metric_key}",
-                        "value": value,
-                    }
-                )
-
-            rows_result_map[row_key] = {
-                "key": row_meta["key"],
-                "label": row_meta["label"],
-                "values": row_meta.get("values", []),
-                "cells": cells,
-            }
+    def _finalize_row_order(self, leaf_totals: Dict[Tuple[Any, ...], Dict[str, Any]] | None = None) -> None:
+        """
+        Промежуточные итоги узлов дерева строк, сортировка и порядок строк.
+        leaf_totals — итоги листьев, собранные из слитых ячеек (см. _leaf_from_cells).
+        """
+        if self._row_fields:
+            row_prefix_totals = pivot_core._finalize_prefix_totals(self._row_prefix_buckets, self._metrics)
+            if leaf_totals:
+                row_prefix_totals.update(leaf_totals)
+            for prefix, node in self._row_nodes.items():
+                node["totals"] = row_prefix_totals.get(prefix, {})
 
+        if self._row_roots and self._row_sort_config:
+            pivot_core._sort_row_tree_by_config(
+                self._row_roots, self._row_sort_config, self._primary_metric_key
+            )
+        if self._top_n:
+            _move_other_nodes_last(self._row_roots)
+        if self._row_fields and self._row_roots:
+            self._row_order = pivot_core._flatten_row_tree(self._row_roots)
         if not self._row_order and self._row_index:
             self._row_order = list(self._row_index.keys())
 
+    def _finalize_totals(self) -> Dict[str, Any] | None:
+        if not self._metrics:
+            return None
+        totals: Dict[str, Any] = {}
+        for metric in self._base_metrics:
+            totals[metric["key"]] = pivot_core._finalize_bucket(
+                self._total_buckets.get(metric["key"]),
+                metric["op"],
+            )
+        for metric in self._metrics:
+            if metric["type"] != "formula":
+                continue
+            try:
+                value = pivot_core._safe_eval(metric["expression"], totals)
+            except Exception:
+                value = None
+            totals[metric["key"]] = value
+        return totals
+
+    def finalize(self) -> Dict[str, Any]:
+        columns_result, column_entries = self._finalize_columns()
+
+        rows_result_map: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        leaf_totals: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for row_key, row_cells in self._iter_cell_rows():
+            if row_key in self._row_index:
+                rows_result_map[row_key] = self._build_row_result(row_key, row_cells, column_entries)
+                if self._leaf_from_cells:
+                    leaf_totals[row_key] = self._leaf_totals(row_cells)
+        for row_key in self._row_index:
+            if row_key not in rows_result_map:
+                rows_result_map[row_key] = self._build_row_result(row_key, {}, column_entries)
+        self.cleanup()
+        self._finalize_row_order(leaf_totals)
+
         rows_result = [
             rows_result_map[row_key]
             for row_key in self._row_order
             if row_key in rows_result_map
         ]
 
-        totals: Dict[str, Any] | None = None
-        if self._metrics:
-            totals = {}
-            for metric in self._base_metrics:
-                totals[metric["key"]] = pivot_core._finalize_bucket(
-                    self._total_buckets.get(metric["key"]),
-                    metric["op"],
-                )
-            for metric in self._metrics:
-                if metric["type"] != "formula":
-                    continue
-                try:
-                    value = pivot_core._safe_eval(metric["expression"], totals)
-                except Exception:
-                    value = None
-                totals[metric["key"]] = value
+        totals = self._finalize_totals()
 
-        return {
+        result = {
             "columns": columns_result,
             "rows": rows_result,
             "totals": totals,
         }
+        meta: Dict[str, Any] = {}
+        approximate_metrics = pivot_core._collect_approximate_metrics(self._metrics)
+        if approximate_metrics:
+            meta["approximateMetrics"] = approximate_metrics
+        approximate_top_n = self.approximate_top_n()
+        if approximate_top_n:
+            meta["approximateTopN"] = approximate_top_n
+        if meta:
+            result["meta"] = meta
+        return result
+
+    def approximate_top_n(self) -> Dict[str, List[str]]:
+        """
+        Значения top-N измерений с приближёнными итогами: часть их записей
+        осталась в «Прочее» — значение допущено после того, как скетч уже видел
+        его записи, или запись ушла в «Прочее» при исчерпании бюджета групп
+        (измерения без top-N не дают ограничить число групп). «Прочее» таких
+        измерений тоже приближённое. Вытесненные значения обратно не допускаются,
+        поэтому их записи целиком остаются в «Прочее».
+        """
+        result: Dict[str, List[str]] = {}
+        for field_key, values in self._top_n_approximate.items():
+            if values:
+                admitted = self._top_n_admitted.get(field_key) or {}
+                result[field_key] = sorted(value for value in values if value in admitted) + [pivot_core.OTHER_VALUE]
+        return result
+
+    def iter_finalized_rows(self) -> Tuple[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+        """
+        finalize() для экспорта: колонки сразу, строки — генератором в порядке
+        pivot, без сборки полного view. После spill-файлов готовые строки пишутся
+        в порядке слияния run-файлов во временный файл и читаются по смещениям
+        в порядке pivot — ячейки всех строк в памяти не собираются. Порядок строк
+        считается при запросе первой строки: итоги листьев при spill собираются
+        из слитых ячеек в том же проходе.
+        """
+        columns_result, column_entries = self._finalize_columns()
+        leaf_totals: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+
+        def built_rows() -> Iterator[Tuple[Tuple[Any, ...], Dict[str, Any]]]:
+            for row_key, row_cells in self._iter_cell_rows():
+                if row_key in self._row_index:
+                    if self._leaf_from_cells:
+                        leaf_totals[row_key] = self._leaf_totals(row_cells)
+                    yield row_key, self._build_row_result(row_key, row_cells, column_entries)
+
+        def rows() -> Iterator[Dict[str, Any]]:
+            if not self._spill_paths:
+                if self._leaf_from_cells:
+                    leaf_totals.update(
+                        (row_key, self._leaf_totals(row_cells)) for row_key, row_cells in self._cell_buckets.items()
+                    )
+                self._finalize_row_order(leaf_totals)
+                for row_key in self._row_order:
+                    if row_key in self._row_index:
+                        yield self._build_row_result(row_key, self._cell_buckets.get(row_key, {}), column_entries)
+                return
+            path, offsets = pivot_spill.write_row_results(self._spill_dir, built_rows())
+            self.cleanup()
+            self._finalize_row_order(leaf_totals)
+            try:
+                order = (row_key for row_key in self._row_order if row_key in self._row_index)
+                for row_key, row in pivot_spill.iter_row_results(path, offsets, order):
+                    yield row if row is not None else self._build_row_result(row_key, {}, column_entries)
+            finally:
+                pivot_spill.remove_runs([path])
+
+        return columns_result, rows()
+
+    def totals_row(self) -> Dict[str, Any] | None:
+        """
+        Строка итогов для экспорта (после finalize или iter_finalized_rows): для
+        каждой колонки pivot — итог колонки по всем строкам, без полей столбцов —
+        общие итоги. Без метрик возвращает None.
+        """
+        if not self._metrics:
+            return None
+        grand_totals = self._finalize_totals() or {}
+        cells: List[Dict[str, Any]] = []
+        for column in self._column_entries:
+            totals = self._column_totals.get(column["column_key"], {}) if self._column_fields else grand_totals
+            cells.append(
+                {
+                    "key": f"{TOTALS_ROW_KEY}||{column['base_key']}||{column['metric_key']}",
+                    "value": totals.get(column["metric_key"]),
+                }
+            )
+        return {"key": TOTALS_ROW_KEY, "label": TOTALS_ROW_LABEL, "values": [], "cells": cells}
+
+    def row_tree(self) -> Dict[str, Any] | None:
+        """
+        Дерево строк после finalize(): узлы с промежуточными итогами
+        (из _finalize_prefix_totals) и ключами детей в порядке сортировки.
+        Листья используют ключи строк pivot. Без полей строк возвращает None.
+        """
+        if not self._row_fields or not self._row_roots:
+            return None
+        last_depth = len(self._row_fields) - 1
+        nodes: Dict[str, Dict[str, Any]] = {}
+
+        def visit(node: Dict[str, Any], parent_values: List[Any]) -> str:
+            depth = node["depth"]
+            values = parent_values + [node["value"]]
+            row_meta = self._row_index.get(node["path"]) if depth == last_depth else None
+            if row_meta is not None:
+                key = row_meta["key"]
+            else:
+                key = pivot_core._build_dimension_key(tuple(values), self._row_fields[: depth + 1])
+            children = [visit(child, values) for child in node.get("children") or []]
+            nodes[key] = {
+                "key": key,
+                "label": node["label"],
+                "values": values,
+                "depth": depth,
+                "totals": node.get("totals") or {},
+                "children": children,
+                "leaf": depth == last_depth,
+            }
+            return key
+
+        roots = [visit(node, []) for node in self._row_roots]
+        return {"roots": roots, "nodes": nodes}
+
+
+def decode_state(payload: bytes) -> Dict[str, Any]:
+    if not payload or len(payload) < _STATE_HEADER.size:
+        raise ValueError("Invalid streaming aggregator state payload")
+    magic, version = _STATE_HEADER.unpack_from(payload)
+    if magic != _STATE_MAGIC:
+        raise ValueError("Invalid streaming aggregator state payload")
+    if version not in _SUPPORTED_STATE_VERSIONS:
+        raise ValueError(f"Unsupported streaming aggregator state version: {version}")
+    try:
+        raw = zlib.decompress(payload[_STATE_HEADER.size :])
+        return json.loads(raw.decode("utf-8"))
+    except (zlib.error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError("Corrupted streaming aggregator state payload") from exc
+
+
+def _move_other_nodes_last(nodes: List[Dict[str, Any]]) -> None:
+    nodes.sort(key=lambda node: node["path"][-1] == pivot_core.OTHER_VALUE)
+    for node in nodes:
+        if node["children"]:
+            _move_other_nodes_last(node["children"])
+
+
+def _upgrade_state_v1(state: Dict[str, Any]) -> Dict[str, Any]:
+    """v1 хранил distinct-значения строками и не знал о HLL: переводим строки в хеши."""
+
+    def upgrade_buckets(buckets: Dict[str, Any]) -> Dict[str, Any]:
+        upgraded = {}
+        for key, bucket in (buckets or {}).items():
+            bucket = dict(bucket)
+            if "d" in bucket:
+                bucket["d"] = [hash64(str(value)) for value in bucket.get("d") or []]
+            upgraded[key] = bucket
+        return upgraded
+
+    config = dict(state.get("config") or {})
+    config["metrics"] = [list(metric[:2]) + [None] for metric in config.get("metrics") or []]
+    return {
+        **state,
+        "version": 2,
+        "config": config,
+        "cells": [[row, column, upgrade_buckets(buckets)] for row, column, buckets in state.get("cells") or []],
+        "rowPrefixes": [[prefix, upgrade_buckets(buckets)] for prefix, buckets in state.get("rowPrefixes") or []],
+        "columnPrefixes": [
+            [prefix, upgrade_buckets(buckets)] for prefix, buckets in state.get("columnPrefixes") or []
+        ],
+        "totals": upgrade_buckets(state.get("totals") or {}),
+    }
+
+
+def _upgrade_state_v2(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    До v3 реальное значение "__OTHER__" не экранировалось в ключах: экранируем его.
+    В полях под top-N такое значение уже слито с «Прочее» и остаётся им.
+    """
+    config = state.get("config") or {}
+    top_n = config.get("topN") or {}
+
+    def escape(field_key: str, part: Any) -> Any:
+        if not isinstance(part, str) or (field_key in top_n and part == pivot_core.OTHER_VALUE):
+            return part
+        return pivot_core._escape_other_key(part)
+
+    def escape_key(key: List[Any], fields: List[str]) -> List[Any]:
+        return [escape(field_key, part) for field_key, part in zip(fields, key)]
+
+    rows = config.get("rows") or []
+    columns = config.get("columns") or []
+    return {
+        **state,
+        "version": STATE_SCHEMA_VERSION,
+        "rows": [[escape_key(key, rows), meta] for key, meta in state.get("rows") or []],
+        "columns": [[escape_key(key, columns), meta] for key, meta in state.get("columns") or []],
+        "nodes": [[escape_key(path, rows), field_key, value] for path, field_key, value in state.get("nodes") or []],
+        "rowPrefixes": [[escape_key(prefix, rows), buckets] for prefix, buckets in state.get("rowPrefixes") or []],
+        "columnPrefixes": [
+            [escape_key(prefix, columns), buckets] for prefix, buckets in state.get("columnPrefixes") or []
+        ],
+        "uniqueValues": {
+            field_key: [escape(field_key, value) for value in values]
+            for field_key, values in (state.get("uniqueValues") or {}).items()
+        },
+        "topN": {
+            field_key: {
+                **payload,
+                "admitted": [[escape(field_key, value), weight] for value, weight in payload.get("admitted") or []],
+                "evicted": [escape(field_key, value) for value in payload.get("evicted") or []],
+                "approximate": [escape(field_key, value) for value in payload.get("approximate") or []],
+            }
+            for field_key, payload in (state.get("topN") or {}).items()
+        },
+    }
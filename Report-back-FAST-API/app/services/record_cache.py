@@ -7,9 +7,11 @@ from typing import Any, Dict, Tuple
 
 import redis.asyncio as redis
 
+from app.config import get_settings
 from app.models.filters import Filters
 from app.services.computed_fields import extract_computed_fields
 from app.services.data_source_client import build_request_payloads, normalize_remote_body
+from app.services.record_index import RecordIndex
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +19,7 @@ logger = logging.getLogger(__name__)
 _CACHE_TTL_SECONDS = float(os.getenv("REPORT_FILTERS_CACHE_TTL", "30"))
 _CACHE_MAX_ITEMS = int(os.getenv("REPORT_FILTERS_CACHE_MAX", "20"))
 _STORE: Dict[str, Tuple[float, Any]] = {}
+_INDEXES: Dict[str, RecordIndex] = {}
 _REDIS_CLIENT: redis.Redis | None = None
 _REDIS_URL: str | None = None
 
@@ -72,7 +75,7 @@ async def get_cached_records(key: str) -> Any | None:
         return None
     created_at, value = entry
     if time.time() - created_at > _CACHE_TTL_SECONDS:
-        _STORE.pop(key, None)
+        _drop_entry(key)
         logger.info("Record cache miss", extra={"backend": "memory", "key": key[:12]})
         return None
     logger.info("Record cache hit", extra={"backend": "memory", "key": key[:12]})
@@ -95,12 +98,38 @@ async def set_cached_records(key: str, value: Any) -> None:
         except Exception as exc:
             logger.warning("Record cache redis set failed", extra={"error": str(exc)})
 
-    if len(_STORE) >= _CACHE_MAX_ITEMS:
+    if key not in _STORE and len(_STORE) >= _CACHE_MAX_ITEMS:
         oldest_key = min(_STORE.items(), key=lambda item: item[1][0])[0]
-        _STORE.pop(oldest_key, None)
+        _drop_entry(oldest_key)
+    _INDEXES.pop(key, None)
     _STORE[key] = (time.time(), value)
 
 
+def _drop_entry(key: str) -> None:
+    _STORE.pop(key, None)
+    _INDEXES.pop(key, None)
+
+
+def get_record_index(key: str, records: Any) -> RecordIndex | None:
+    """
+    Индекс значений для записей из in-memory кэша (REPORT_RECORD_INDEX=1).
+    Создаётся пустым при первом обращении, поля индексируются лениво; удаляется
+    вместе с записью кэша. Для Redis-бэкенда (записи десериализуются заново
+    на каждый запрос) индекс не строится.
+    """
+    settings = get_settings()
+    if not settings.report_record_index or not key or not isinstance(records, list):
+        return None
+    entry = _STORE.get(key)
+    if not entry or entry[1] is not records:
+        return None
+    index = _INDEXES.get(key)
+    if index is None or index.records is not records:
+        index = RecordIndex(records, settings.report_record_index_max_bytes)
+        _INDEXES[key] = index
+    return index
+
+
 def _safe_json_payload(value: Any) -> Any:
     if isinstance(value, (dict, list, str, int, float, bool)) or value is None:
         return value
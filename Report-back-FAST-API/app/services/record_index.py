@@ -0,0 +1,297 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# значение → array("I") row id (редкие) или int-битмап (частые)
+Postings = Dict[str, Any]
+
+# поле с большим числом различных значений не попадает в инвертированный индекс
+_MAX_DISTINCT_FLOOR = 1024
+
+# битовые позиции для каждого значения байта — для быстрого перебора битмапа
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+
+
+def bitmap_from_positions(positions: Iterable[int], size: int) -> int:
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def bitmap_positions(bitmap: int) -> List[int]:
+    """Номера установленных битов по возрастанию (порядок записей сохраняется)."""
+    positions: List[int] = []
+    if not bitmap:
+        return positions
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    append = positions.append
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index << 3
+            for bit in _BYTE_BITS[byte]:
+                append(base + bit)
+    return positions
+
+
+def bitmap_bytes(bitmap: int, size: int) -> bytes:
+    """Битмап как bytes для проверки отдельных позиций за O(1)."""
+    return bitmap.to_bytes((size + 7) // 8, "little")
+
+
+def _postings_nbytes(postings: Postings) -> int:
+    total = sys.getsizeof(postings)
+    for value, rows in postings.items():
+        total += sys.getsizeof(value)
+        total += rows.itemsize * len(rows) + 64 if isinstance(rows, array) else sys.getsizeof(rows)
+    return total
+
+
+class SortedRange:
+    """
+    Отсортированные значения поля для диапазонных фильтров: для каждого пути
+    сравнения (epoch ms / число) — значения по возрастанию и номера строк.
+    Строки always проходят любой диапазон (NaN: сравнения с ним всегда ложны).
+    """
+
+    def __init__(self, pairs_by_path: Dict[str, List[Tuple[Any, int]]], always: List[int]) -> None:
+        self.paths: Dict[str, Tuple[List[Any], array]] = {}
+        for path, pairs in pairs_by_path.items():
+            pairs.sort()
+            self.paths[path] = ([value for value, _ in pairs], array("I", [row for _, row in pairs]))
+        self.always = array("I", always)
+
+    def rows_between(self, path: str, start: Any, end: Any) -> Iterable[int]:
+        entry = self.paths.get(path)
+        if entry is None:
+            return ()
+        values, rows = entry
+        low = bisect_left(values, start) if start is not None else 0
+        high = bisect_right(values, end) if end is not None else len(values)
+        return rows[low:high] if low < high else ()
+
+    def nbytes(self) -> int:
+        total = sys.getsizeof(self.always) + len(self.always) * self.always.itemsize
+        for values, rows in self.paths.values():
+            total += sys.getsizeof(values) + len(values) * 32 + rows.itemsize * len(rows) + 64
+        return total
+
+
+class ValueDictionary:
+    """
+    Отсортированный словарь различных значений поля для typeahead: значения
+    в порядке выдачи опций, их текст для поиска (casefold) и для каждой строки —
+    порядковый номер её значения. Счётчики по произвольному набору строк —
+    один проход по ordinals, без сортировки и разбора записей.
+    Строковое поле (field_type "string") отсортировано по тексту — префикс
+    ищется бинарным поиском.
+    """
+
+    def __init__(self, values: List[Any], ordinals: array, field_type: str) -> None:
+        self.values = values
+        self.texts = [str(value).casefold() for value in values]
+        self.ordinals = ordinals
+        self.field_type = field_type
+        self.text_sorted = field_type == "string"
+        totals = [0] * len(values)
+        for ordinal in ordinals:
+            totals[ordinal] += 1
+        self.totals = totals
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def counts(self, positions: Iterable[int] | None) -> List[int]:
+        """Число строк на значение среди positions (None — по всем строкам)."""
+        if positions is None:
+            return self.totals
+        counts = [0] * len(self.values)
+        ordinals = self.ordinals
+        for position in positions:
+            counts[ordinals[position]] += 1
+        return counts
+
+    def prefix_start(self, prefix: str) -> int:
+        return bisect_left(self.texts, prefix) if self.text_sorted and prefix else 0
+
+    def nbytes(self) -> int:
+        total = sys.getsizeof(self.values) + sys.getsizeof(self.texts) + sys.getsizeof(self.totals)
+        total += sum(sys.getsizeof(text) for text in self.texts) + len(self.values) * 32
+        return total + self.ordinals.itemsize * len(self.ordinals) + 64
+
+
+class RecordIndex:
+    """
+    Индекс по закэшированному набору записей. Инвертированный: для поля —
+    нормализованное значение (_normalize_filter_value) → номера строк; редкие
+    значения хранятся массивом row id, частые — битмапом (int), как в
+    roaring-контейнерах. Диапазонный: для поля — SortedRange с заранее
+    приведёнными значениями. Поля индексируются лениво при первом обращении;
+    индекс живёт и вытесняется вместе с записью кэша, суммарный размер
+    ограничен max_bytes — поле сверх бюджета не индексируется (обычный скан).
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], max_bytes: int) -> None:
+        self.records = records
+        self.size = len(records)
+        self.all_rows = (1 << self.size) - 1
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._fields: Dict[str, Postings] = {}
+        self._ranges: Dict[Tuple[str, bool], SortedRange] = {}
+        self._dictionaries: Dict[Tuple[str, Any], ValueDictionary] = {}
+        self._skipped: set = set()
+        self._lock = threading.Lock()
+
+    def _store(self, target: Dict[Any, Any], key: Any, built: Any, nbytes: int) -> Any:
+        with self._lock:
+            if key in target:
+                return target[key]
+            if self.max_bytes and self.nbytes + nbytes > self.max_bytes:
+                self._skipped.add(key)
+                return None
+            target[key] = built
+            self.nbytes += nbytes
+        return built
+
+    def postings(
+        self,
+        field: str,
+        resolve: Callable[[Dict[str, Any]], Any],
+        normalize: Callable[[Any], str],
+    ) -> Optional[Postings]:
+        postings = self._fields.get(field)
+        if postings is not None or field in self._skipped:
+            return postings
+        rows_by_value: Dict[str, List[int]] = {}
+        for position, record in enumerate(self.records):
+            normalized = normalize(resolve(record))
+            rows = rows_by_value.get(normalized)
+            if rows is None:
+                rows_by_value[normalized] = [position]
+            else:
+                rows.append(position)
+        if len(rows_by_value) > max(_MAX_DISTINCT_FLOOR, self.size // 4):
+            # почти уникальное поле (id, суммы): инвертированный индекс не окупается
+            with self._lock:
+                self._skipped.add(field)
+            return None
+        postings = self._compact(rows_by_value)
+        return self._store(self._fields, field, postings, _postings_nbytes(postings))
+
+    def _compact(self, rows_by_value: Dict[Any, List[int]]) -> Postings:
+        postings = {}
+        dense_threshold = max(1, self.size // 32)
+        for value, rows in rows_by_value.items():
+            if len(rows) > dense_threshold:
+                postings[value] = bitmap_from_positions(rows, self.size)
+            else:
+                postings[value] = array("I", rows)
+        return postings
+
+    def cell_postings(
+        self,
+        fields: Tuple[str, ...],
+        resolvers: List[Callable[[Dict[str, Any]], Any]],
+        normalize: Callable[[Any], str],
+    ) -> Optional[Postings]:
+        """
+        Строки по ячейкам измерения pivot (fields — поля строк или колонок по порядку):
+        кортеж нормализованных значений каждого префикса ключа → строки. Строится
+        одним проходом, как ключи row_key / column_key в pivot; ячейка детализации
+        затем берётся одним обращением, без нормализации записей.
+        """
+        key = ("cells", fields)
+        postings = self._fields.get(key)
+        if postings is not None or key in self._skipped:
+            return postings
+        rows_by_prefix: Dict[Tuple[str, ...], List[int]] = {}
+        for position, record in enumerate(self.records):
+            values = tuple(normalize(resolve(record)) for resolve in resolvers)
+            for depth in range(1, len(values) + 1):
+                rows = rows_by_prefix.get(values[:depth])
+                if rows is None:
+                    rows_by_prefix[values[:depth]] = [position]
+                else:
+                    rows.append(position)
+        postings = self._compact(rows_by_prefix)
+        return self._store(self._fields, key, postings, _postings_nbytes(postings))
+
+    def sorted_range(
+        self,
+        field: str,
+        meta_is_date: bool,
+        resolve: Callable[[Dict[str, Any]], Any],
+        convert: Callable[[Any, bool], Tuple[str, Any] | None],
+    ) -> Optional[SortedRange]:
+        """
+        Диапазонный индекс поля. convert(value, meta_is_date) один раз на строку
+        решает путь сравнения ("ms", "num", "always") и приводит значение;
+        None — строка не проходит ни один диапазон.
+        """
+        key = (field, meta_is_date)
+        sorted_range = self._ranges.get(key)
+        if sorted_range is not None or key in self._skipped:
+            return sorted_range
+        pairs_by_path: Dict[str, List[Tuple[Any, int]]] = {}
+        always: List[int] = []
+        for position, record in enumerate(self.records):
+            converted = convert(resolve(record), meta_is_date)
+            if converted is None:
+                continue
+            path, value = converted
+            if path == "always":
+                always.append(position)
+            else:
+                pairs_by_path.setdefault(path, []).append((value, position))
+        sorted_range = SortedRange(pairs_by_path, always)
+        return self._store(self._ranges, key, sorted_range, sorted_range.nbytes())
+
+    def value_dictionary(
+        self,
+        field: str,
+        variant: Any,
+        build: Callable[[List[Dict[str, Any]]], ValueDictionary],
+    ) -> Optional[ValueDictionary]:
+        """
+        Словарь значений поля, построенный build(records) при первом обращении;
+        variant — всё, от чего зависит порядок значений (тип поля из fieldMeta).
+        """
+        key = ("dictionary", field, variant)
+        dictionary = self._dictionaries.get(key)
+        if dictionary is not None or key in self._skipped:
+            return dictionary
+        dictionary = build(self.records)
+        return self._store(self._dictionaries, key, dictionary, dictionary.nbytes())
+
+    def range_bitmap(self, sorted_range: SortedRange, bounds: Dict[str, Tuple[Any, Any]]) -> int:
+        """Строки, попавшие в диапазон: по два бинарных поиска на путь сравнения."""
+        rows = [sorted_range.rows_between(path, start, end) for path, (start, end) in bounds.items()]
+        return bitmap_from_positions(chain(sorted_range.always, *rows), self.size)
+
+    def union(self, postings: Postings, values: Iterable[str]) -> int:
+        buffer = bytearray((self.size + 7) // 8)
+        dense = 0
+        for value in values:
+            rows = postings.get(value)
+            if rows is None:
+                continue
+            if isinstance(rows, int):
+                dense |= rows
+                continue
+            for position in rows:
+                buffer[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(buffer, "little") | dense
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.size,
+            "fields": sorted(field for field in self._fields if isinstance(field, str)),
+            "cells": sorted("|".join(key[1]) for key in self._fields if isinstance(key, tuple)),
+            "ranges": sorted(field for field, _ in self._ranges),
+            "dictionaries": sorted(field for _, field, _ in self._dictionaries),
+            "bytes": self.nbytes,
+        }
@@ -10,7 +10,7 @@ from app.services.computed_fields import (
     split_computed_fields_by_join_dependency,
 )
 from app.services.data_source_client import async_load_records
-from app.services.join_service import apply_joins, resolve_joins
+from app.services.join_service import apply_joins, load_records_with_joins, resolve_joins
 
 
 @dataclass(frozen=True)
@@ -80,10 +80,14 @@ async def build_records_pipeline(
     pre_engine = build_computed_fields_engine_from_entries(pre_entries)
     post_engine = build_computed_fields_engine_from_entries(post_entries)
 
-    records = await async_load_records(
-        remote_source,
-        payload_filters=payload_filters,
-        pushdown_enabled=pushdown_enabled,
+    records, loaded_sources = await load_records_with_joins(
+        async_load_records(
+            remote_source,
+            payload_filters=payload_filters,
+            pushdown_enabled=pushdown_enabled,
+        ),
+        joins,
+        max_records=max_records,
     )
     if max_records is not None and len(records) > max_records:
         raise ValueError(f"Records limit exceeded: {len(records)} > {max_records}")
@@ -96,6 +100,7 @@ async def build_records_pipeline(
         remote_source,
         joins_override=joins,
         max_records=max_records,
+        loaded_sources=loaded_sources,
     )
 
     if post_engine:
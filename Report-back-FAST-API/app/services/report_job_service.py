@@ -11,6 +11,7 @@ import redis.asyncio as redis
 from app.config import get_settings
 from app.models.view_request import ViewRequest
 from app.observability.otel import get_tracer
+from app.services.pivot_spill import cleanup_stale_runs
 from app.services.report_view_builder import build_report_view_response
 
 
@@ -201,6 +202,7 @@ def _cleanup_results_dir(ttl_seconds: int) -> None:
                 removed += 1
             except OSError:
                 continue
+    removed += cleanup_stale_runs(os.path.join(_job_dir(), "spill"), ttl_seconds)
     if removed:
         logger.info("Report results cleanup", extra={"removed": removed, "ttl_seconds": ttl_seconds})
 
@@ -1,39 +1,52 @@
-import asyncio
 import logging
 import os
 import time
-from typing import Any, Optional
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 
-from app.observability.metrics import record_report_view_metrics
+from app.observability.loop_monitor import LoopLagProbe
+from app.observability.metrics import (
+    record_report_view_metrics,
+    record_streaming_loop_lag,
+    record_streaming_spill,
+)
 from app.observability.otel import get_tracer
 from app.config import get_settings
-from app.models.view import ChartConfig, ViewResponse
-from app.models.view_request import ViewRequest
+from app.models.view import ChartConfig, PivotView, ViewResponse
+from app.models.view_request import ViewRequest, ViewWindow
 from app.services.computed_fields import build_computed_fields_engine, extract_computed_fields
-from app.services.data_source_client import async_iter_records, async_load_records, get_records_limit
-from app.services.filter_service import apply_filters
+from app.services.data_source_client import (
+    RecordsLimitExceeded,
+    async_iter_records,
+    async_load_records,
+    get_records_limit,
+)
+from app.services.detail_service import DetailsCollector, resolve_detail_sort, resolve_detail_total_mode
+from app.services.export_service import (
+    EXPORT_BATCH_ROWS,
+    create_export_writer,
+    pivot_export_header,
+    pivot_export_row,
+    pivot_export_totals_row,
+)
+from app.services.filter_service import FilterOptionsCounter, RecordFilter, apply_filters, compile_record_filter
 from app.services.join_service import (
     apply_joins,
-    apply_prepared_join_lookups,
+    load_records_with_joins,
     prepare_joins_streaming,
     resolve_joins,
 )
 from app.services.pivot_streaming import StreamingPivotAggregator
 from app.services.records_pipeline import build_records_pipeline
+from app.services.stage_executor import run_stage
+from app.services.streaming_pipeline import FusedRecordPipeline, drive_chunks
+from app.services.view_cache import expanded_tree_keys, slice_rows, store_view, tree_rows
 from app.services.view_service import build_view
 
 
 logger = logging.getLogger(__name__)
 
 
-class RecordsLimitExceeded(ValueError):
-    def __init__(self, count: int, limit: int | None, stage: str) -> None:
-        super().__init__(f"Records limit exceeded after {stage}: {count} > {limit}")
-        self.count = count
-        self.limit = limit
-        self.stage = stage
-
-
 def _enforce_records_limit(count: int, limit: Optional[int], stage: str) -> None:
     if limit is None:
         return
@@ -85,10 +98,14 @@ async def _build_report_view_parity(
 
     filters_started = time.monotonic()
     with tracer.start_as_current_span("apply_filters") as span:
-        filtered_records, filter_debug = apply_filters(
+        filtered_records, filter_debug = await run_stage(
+            "apply_filters",
+            apply_filters,
             rows,
             payload.snapshot,
             payload.filters,
+            pure=True,
+            input_size=len(rows),
         )
         span.set_attribute("streaming_enabled", False)
         span.set_attribute("records_count", len(filtered_records))
@@ -106,7 +123,15 @@ async def _build_report_view_parity(
 
     pivot_started = time.monotonic()
     with tracer.start_as_current_span("build_pivot") as span:
-        pivot_view = await asyncio.to_thread(build_view, filtered_records, payload.snapshot)
+        pivot_view = await run_stage(
+            "build_view",
+            build_view,
+            filtered_records,
+            payload.snapshot,
+            payload.rowMode == "tree",
+            pure=True,
+            input_size=len(filtered_records),
+        )
         span.set_attribute("streaming_enabled", False)
     if pipeline.warnings:
         pivot_view.setdefault("meta", {})["computedWarnings"] = pipeline.warnings
@@ -161,7 +186,89 @@ async def build_report_view_response(
     payload: ViewRequest,
     request_id: str | None = None,
 ) -> ViewResponse:
+    response = await _build_report_view_full(payload, request_id)
+    if payload.rowMode != "tree" and payload.window is None:
+        # плоский ответ без окна: pivot отдаётся как есть, без копирования в dict
+        return response
+    view_payload = response.view.dict()
+    row_tree = view_payload.pop("rowTree", None)
+    if row_tree:
+        await _apply_tree_mode(response, view_payload, row_tree, payload.window)
+    elif payload.window is not None:
+        await _apply_view_window(response, view_payload, payload.window)
+    else:
+        # без полей строк дерево пустое — отдаём плоский pivot
+        response.view = PivotView(**view_payload)
+    return response
+
+
+async def _apply_tree_mode(
+    response: ViewResponse,
+    view_payload: dict,
+    row_tree: dict,
+    window: ViewWindow | None,
+) -> None:
+    """
+    Tree-режим: в ответе только узлы верхнего уровня с подытогами и числом детей.
+    Полный pivot и дерево сохраняются в кэше представлений, дети раскрываются
+    через GET /api/report/view/{handle}/children без пересчёта. Если представление
+    не поместилось в кэш, раскрывать узлы потом нечем — дерево отдаётся раскрытым
+    целиком (meta.tree.expanded). Pivot к этому моменту уже построен полностью:
+    уменьшается ответ, а не время его построения (см. README).
+    """
+    settings = get_settings()
+    positions = {row["key"]: idx for idx, row in enumerate(view_payload.get("rows") or [])}
+    for node in row_tree["nodes"].values():
+        if node["leaf"]:
+            node["row"] = positions.get(node["key"])
+    entry = {"view": view_payload, "tree": row_tree}
+    handle = await store_view(entry)
+    offset = window.offset if window is not None else 0
+    limit = window.limit if window is not None else settings.report_view_window_max_rows
+    limit = min(limit, settings.report_view_window_max_rows)
+    roots = row_tree["roots"]
+    meta = dict(view_payload.get("meta") or {})
+    if handle is None:
+        rows = tree_rows(entry, expanded_tree_keys(row_tree))
+        meta["tree"] = {"handle": None, "offset": 0, "limit": len(roots), "totalRows": len(roots), "expanded": True}
+    else:
+        rows = tree_rows(entry, roots[offset : offset + limit])
+        meta["tree"] = {"handle": handle, "offset": offset, "limit": limit, "totalRows": len(roots)}
+    response.view = PivotView(**{**view_payload, "rows": rows, "meta": meta})
+
+
+async def _apply_view_window(response: ViewResponse, view_payload: dict, window: ViewWindow) -> None:
+    """
+    Сохраняет полный pivot в кэше представлений и оставляет в ответе только окно строк.
+    Следующие окна отдаёт GET /api/report/view/{handle}/rows без пересчёта. Если
+    представление не поместилось в кэш, следующих окон не будет — в ответе все
+    строки (с сортировкой окна), handle равен null.
+    """
     settings = get_settings()
+    handle = await store_view({"view": view_payload})
+    if handle is None:
+        offset, limit = 0, len(view_payload.get("rows") or [])
+    else:
+        offset, limit = window.offset, min(window.limit, settings.report_view_window_max_rows)
+    window_payload = slice_rows(
+        view_payload,
+        offset,
+        limit,
+        sort_column=window.sortColumn,
+        direction=window.sortDirection,
+    )
+    rows = window_payload.pop("rows")
+    meta = dict(view_payload.get("meta") or {})
+    meta["window"] = {"handle": handle, **window_payload}
+    response.view = PivotView(**{**view_payload, "rows": rows, "meta": meta})
+
+
+async def _build_report_view_full(
+    payload: ViewRequest,
+    request_id: str | None = None,
+) -> ViewResponse:
+    settings = get_settings()
+    joins = None
     if settings.pivot_parity_joins:
         joins = await resolve_joins(payload.remoteSource)
         has_computed = bool(extract_computed_fields(payload.remoteSource))
@@ -186,15 +293,21 @@ async def build_report_view_response(
         return await _build_report_view_streaming(payload, request_id, computed_engine)
 
     max_records = get_records_limit()
+    if joins is None:
+        joins = await resolve_joins(payload.remoteSource)
 
     try:
         load_started = time.monotonic()
         stats: dict = {}
         with tracer.start_as_current_span("load_records") as span:
-            records = await async_load_records(
-                payload.remoteSource,
-                payload_filters=payload.filters,
-                stats=stats,
+            records, loaded_sources = await load_records_with_joins(
+                async_load_records(
+                    payload.remoteSource,
+                    payload_filters=payload.filters,
+                    stats=stats,
+                ),
+                joins,
+                max_records=max_records,
             )
             span.set_attribute("streaming_enabled", False)
             span.set_attribute("records_count", len(records))
@@ -214,14 +327,16 @@ async def build_report_view_response(
         )
 
         if computed_engine:
-            computed_engine.apply(records)
+            await run_stage("computed_fields", computed_engine.apply, records)
 
         joins_started = time.monotonic()
         with tracer.start_as_current_span("apply_joins") as span:
             joined_records, join_debug = await apply_joins(
                 records,
                 payload.remoteSource,
+                joins_override=joins,
                 max_records=max_records,
+                loaded_sources=loaded_sources,
             )
             span.set_attribute("streaming_enabled", False)
             span.set_attribute("records_count", len(joined_records))
@@ -239,10 +354,14 @@ async def build_report_view_response(
 
         filters_started = time.monotonic()
         with tracer.start_as_current_span("apply_filters") as span:
-            filtered_records, filter_debug = apply_filters(
+            filtered_records, filter_debug = await run_stage(
+                "apply_filters",
+                apply_filters,
                 joined_records,
                 payload.snapshot,
                 payload.filters,
+                pure=True,
+                input_size=len(joined_records),
             )
             span.set_attribute("streaming_enabled", False)
             span.set_attribute("records_count", len(filtered_records))
@@ -259,7 +378,15 @@ async def build_report_view_response(
 
         pivot_started = time.monotonic()
         with tracer.start_as_current_span("build_pivot") as span:
-            pivot_view = await asyncio.to_thread(build_view, filtered_records, payload.snapshot)
+            pivot_view = await run_stage(
+                "build_view",
+                build_view,
+                filtered_records,
+                payload.snapshot,
+                payload.rowMode == "tree",
+                pure=True,
+                input_size=len(filtered_records),
+            )
             span.set_attribute("streaming_enabled", False)
         if computed_engine and computed_engine.warnings:
             pivot_view.setdefault("meta", {})["computedWarnings"] = computed_engine.warnings
@@ -337,54 +464,6 @@ def _init_join_debug(prepared_joins: list) -> dict:
     }
 
 
-def _merge_join_debug(target: dict, source: dict) -> None:
-    if not target["sampleKeys"]["beforeJoin"] and source["sampleKeys"].get("beforeJoin"):
-        target["sampleKeys"]["beforeJoin"] = source["sampleKeys"]["beforeJoin"]
-    if not target["sampleKeys"]["afterJoin"] and source["sampleKeys"].get("afterJoin"):
-        target["sampleKeys"]["afterJoin"] = source["sampleKeys"]["afterJoin"]
-    for idx, entry in enumerate(source.get("joinsApplied", [])):
-        if idx >= len(target["joinsApplied"]):
-            break
-        target_entry = target["joinsApplied"][idx]
-        target_entry["baseBefore"] += entry.get("baseBefore", 0)
-        target_entry["baseAfter"] += entry.get("baseAfter", 0)
-        target_entry["matchedRows"] += entry.get("matchedRows", 0)
-
-
-def _merge_filter_debug(target: dict | None, source: dict) -> dict:
-    if target is None:
-        payload = {
-            "counts": dict(source.get("counts") or {}),
-            "effectiveFilters": source.get("effectiveFilters"),
-            "appliedKeys": source.get("appliedKeys"),
-            "sampleRecordKeys": dict(source.get("sampleRecordKeys") or {}),
-        }
-        if "reasonsDropped" in source:
-            payload["reasonsDropped"] = list(source["reasonsDropped"])
-        return payload
-
-    target_counts = target.setdefault("counts", {})
-    source_counts = source.get("counts") or {}
-    target_counts["beforeFilters"] = target_counts.get("beforeFilters", 0) + source_counts.get("beforeFilters", 0)
-    target_counts["afterFilters"] = target_counts.get("afterFilters", 0) + source_counts.get("afterFilters", 0)
-
-    target_samples = target.setdefault("sampleRecordKeys", {})
-    source_samples = source.get("sampleRecordKeys") or {}
-    if not target_samples.get("beforeFilters") and source_samples.get("beforeFilters"):
-        target_samples["beforeFilters"] = source_samples.get("beforeFilters")
-    if not target_samples.get("afterFilters") and source_samples.get("afterFilters"):
-        target_samples["afterFilters"] = source_samples.get("afterFilters")
-
-    if source.get("reasonsDropped"):
-        target_reasons = target.setdefault("reasonsDropped", [])
-        for reason in source.get("reasonsDropped", []):
-            if len(target_reasons) >= 2:
-                break
-            target_reasons.append(reason)
-
-    return target
-
-
 async def _build_report_view_streaming(
     payload: ViewRequest,
     request_id: str | None = None,
@@ -405,19 +484,24 @@ async def _build_report_view_streaming(
         paging_force=settings.report_upstream_paging,
     )
     join_debug = _init_join_debug(prepared_joins)
-    filter_debug = None
+    pipeline = FusedRecordPipeline(
+        computed_engine=computed_engine,
+        prepared_joins=prepared_joins,
+        record_filter=compile_record_filter(payload.snapshot, payload.filters),
+        join_debug=join_debug,
+        max_records=max_records,
+    )
 
     aggregator = StreamingPivotAggregator(
         payload.snapshot,
         max_groups=settings.report_streaming_max_groups,
         max_unique_values_per_dim=settings.report_streaming_max_unique_values_per_dim,
+        top_n_candidate_factor=settings.report_top_n_candidate_factor,
+        spill_max_cells=settings.report_streaming_spill_cells,
+        spill_dir=os.path.join(settings.report_jobs_dir, "spill"),
     )
 
     total_records = 0
-    total_joined = 0
-    total_filtered = 0
-    join_duration_ms = 0
-    filter_duration_ms = 0
     update_duration_ms = 0
     pipeline_started = time.monotonic()
 
@@ -425,7 +509,9 @@ async def _build_report_view_streaming(
     paging_enabled = False
     paging_pages = 0
     pages_count = 0
-    with tracer.start_as_current_span("load_records") as load_span:
+
+    async def counted_chunks():
+        nonlocal total_records
         async for records_chunk in async_iter_records(
             payload.remoteSource,
             chunk_size,
@@ -437,107 +523,104 @@ async def _build_report_view_streaming(
         ):
             total_records += len(records_chunk)
             _enforce_records_limit(total_records, max_records, "load_records")
+            yield records_chunk
 
-            if computed_engine:
-                computed_engine.apply(records_chunk)
-
-            joins_started = time.monotonic()
-            with tracer.start_as_current_span("apply_joins") as span:
-                if prepared_joins:
-                    joined_chunk, chunk_join_debug = apply_prepared_join_lookups(
-                        records_chunk,
-                        prepared_joins,
-                        max_records=max_records,
-                    )
-                    _merge_join_debug(join_debug, chunk_join_debug)
-                else:
-                    joined_chunk = records_chunk
-                    if not join_debug["sampleKeys"]["beforeJoin"] and records_chunk:
-                        join_debug["sampleKeys"]["beforeJoin"] = list(records_chunk[0].keys())
-                    if not join_debug["sampleKeys"]["afterJoin"] and records_chunk:
-                        join_debug["sampleKeys"]["afterJoin"] = list(records_chunk[0].keys())
-                span.set_attribute("streaming_enabled", True)
-                span.set_attribute("records_count", len(joined_chunk))
-            join_duration_ms += int((time.monotonic() - joins_started) * 1000)
-
-            total_joined += len(joined_chunk)
-            _enforce_records_limit(total_joined, join_max_records, "apply_joins")
-
-            filters_started = time.monotonic()
-            with tracer.start_as_current_span("apply_filters") as span:
-                filtered_chunk, chunk_filter_debug = apply_filters(
-                    joined_chunk,
-                    payload.snapshot,
-                    payload.filters,
+    def process_chunk(records_chunk: list) -> None:
+        # вычисляемые поля, join, фильтры и агрегация — один проход по записям чанка;
+        # при REPORT_STREAMING_QUEUE_SIZE > 0 выполняется в рабочем потоке
+        nonlocal update_duration_ms
+        update_started = time.monotonic()
+        with tracer.start_as_current_span("streaming_pipeline") as span:
+            aggregator.update(pipeline.iter_chunk(records_chunk))
+            span.set_attribute("streaming_enabled", True)
+            span.set_attribute("records_count", len(records_chunk))
+        update_duration_ms += int((time.monotonic() - update_started) * 1000)
+        _enforce_records_limit(pipeline.total_joined, join_max_records, "apply_joins")
+
+    try:
+        with tracer.start_as_current_span("load_records") as load_span:
+            async with LoopLagProbe() as loop_probe:
+                await drive_chunks(
+                    counted_chunks(),
+                    process_chunk,
+                    queue_size=settings.report_streaming_queue_size,
                 )
-                span.set_attribute("streaming_enabled", True)
-                span.set_attribute("records_count", len(filtered_chunk))
-            filter_duration_ms += int((time.monotonic() - filters_started) * 1000)
-            filter_debug = _merge_filter_debug(filter_debug, chunk_filter_debug)
+            paging_enabled = paging_stats.get("paging_enabled", False)
+            paging_pages = paging_stats.get("paging_pages", 0)
+            pages_count = paging_pages if paging_enabled else (1 if total_records else 0)
+            load_span.set_attribute("streaming_enabled", True)
+            load_span.set_attribute("records_count", total_records)
+            load_span.set_attribute("pages_count", pages_count)
+            load_span.set_attribute("pushdown_enabled", bool(paging_stats.get("pushdown_enabled")))
+            load_span.set_attribute(
+                "pushdown_filters_applied",
+                int(paging_stats.get("pushdown_filters_applied") or 0),
+            )
+            load_span.set_attribute("pushdown_paging_applied", bool(paging_stats.get("pushdown_paging_applied")))
 
-            total_filtered += len(filtered_chunk)
+        total_joined = pipeline.total_joined
+        total_filtered = pipeline.total_filtered
+        total_duration_ms = int((time.monotonic() - pipeline_started) * 1000)
+        load_duration_ms = max(0, total_duration_ms - update_duration_ms)
 
-            update_started = time.monotonic()
-            with tracer.start_as_current_span("streaming_pivot") as span:
-                aggregator.update(filtered_chunk)
-                span.set_attribute("streaming_enabled", True)
-                span.set_attribute("records_count", len(filtered_chunk))
-            update_duration_ms += int((time.monotonic() - update_started) * 1000)
-        paging_enabled = paging_stats.get("paging_enabled", False)
-        paging_pages = paging_stats.get("paging_pages", 0)
-        pages_count = paging_pages if paging_enabled else (1 if total_records else 0)
-        load_span.set_attribute("streaming_enabled", True)
-        load_span.set_attribute("records_count", total_records)
-        load_span.set_attribute("pages_count", pages_count)
-        load_span.set_attribute("pushdown_enabled", bool(paging_stats.get("pushdown_enabled")))
-        load_span.set_attribute(
-            "pushdown_filters_applied",
-            int(paging_stats.get("pushdown_filters_applied") or 0),
+        logger.info(
+            "report.view.load_records",
+            extra={
+                "templateId": payload.templateId,
+                "requestId": request_id,
+                "records": total_records,
+                "duration_ms": load_duration_ms,
+                "paging_enabled": paging_enabled,
+                "paging_pages": paging_pages,
+            },
         )
-        load_span.set_attribute("pushdown_paging_applied", bool(paging_stats.get("pushdown_paging_applied")))
 
-    total_duration_ms = int((time.monotonic() - pipeline_started) * 1000)
-    load_duration_ms = max(0, total_duration_ms - join_duration_ms - filter_duration_ms - update_duration_ms)
-
-    logger.info(
-        "report.view.load_records",
-        extra={
-            "templateId": payload.templateId,
-            "requestId": request_id,
-            "records": total_records,
-            "duration_ms": load_duration_ms,
-            "paging_enabled": paging_enabled,
-            "paging_pages": paging_pages,
-        },
-    )
+        logger.info(
+            "report.view.apply_joins",
+            extra={
+                "templateId": payload.templateId,
+                "requestId": request_id,
+                "recordsBefore": total_records,
+                "recordsAfter": total_joined,
+                "join_streaming_enabled": True,
+                "fused": True,
+            },
+        )
 
-    logger.info(
-        "report.view.apply_joins",
-        extra={
-            "templateId": payload.templateId,
-            "requestId": request_id,
-            "recordsBefore": total_records,
-            "recordsAfter": total_joined,
-            "duration_ms": join_duration_ms,
-            "join_streaming_enabled": True,
-        },
-    )
+        logger.info(
+            "report.view.apply_filters",
+            extra={
+                "templateId": payload.templateId,
+                "requestId": request_id,
+                "recordsBefore": total_joined,
+                "recordsAfter": total_filtered,
+                "fused": True,
+            },
+        )
 
-    logger.info(
-        "report.view.apply_filters",
-        extra={
-            "templateId": payload.templateId,
-            "requestId": request_id,
-            "recordsBefore": total_joined,
-            "recordsAfter": total_filtered,
-            "duration_ms": filter_duration_ms,
-        },
-    )
+        logger.info(
+            "report.view.streaming_pipeline",
+            extra={
+                "templateId": payload.templateId,
+                "requestId": request_id,
+                "records": total_records,
+                "recordsAfter": total_filtered,
+                "duration_ms": update_duration_ms,
+                "queue_size": settings.report_streaming_queue_size,
+                "records_per_second": int(total_records * 1000 / total_duration_ms) if total_duration_ms else None,
+                "loop_lag_max_ms": round(loop_probe.max_lag_ms, 1),
+            },
+        )
+        record_streaming_loop_lag(loop_probe.max_lag_ms / 1000)
 
-    pivot_started = time.monotonic()
-    with tracer.start_as_current_span("build_pivot") as span:
-        pivot_view = await asyncio.to_thread(aggregator.finalize)
-        span.set_attribute("streaming_enabled", True)
+        pivot_started = time.monotonic()
+        with tracer.start_as_current_span("build_pivot") as span:
+            pivot_view = await run_stage("build_pivot", aggregator.finalize)
+            if payload.rowMode == "tree":
+                pivot_view["rowTree"] = aggregator.row_tree()
+            span.set_attribute("streaming_enabled", True)
+    finally:
+        aggregator.cleanup()
     if computed_engine and computed_engine.warnings:
         pivot_view.setdefault("meta", {})["computedWarnings"] = computed_engine.warnings
     logger.info(
@@ -560,9 +643,21 @@ async def _build_report_view_streaming(
         options={},
     )
     record_report_view_metrics(total_records, pages_count, pivot_view)
+    spill_stats = dict(aggregator.spill_stats)
+    if spill_stats["runs"]:
+        record_streaming_spill(spill_stats["runs"], spill_stats["bytes"])
+        logger.info(
+            "report.view.spill",
+            extra={
+                "templateId": payload.templateId,
+                "requestId": request_id,
+                **spill_stats,
+            },
+        )
 
     debug_payload = None
     if os.getenv("REPORT_DEBUG_FILTERS"):
+        filter_debug = pipeline.filter_debug()
         if filter_debug is None:
             filter_debug = {
                 "counts": {"beforeFilters": total_joined, "afterFilters": total_filtered},
@@ -586,6 +681,8 @@ async def _build_report_view_streaming(
             debug_payload = join_debug
         else:
             debug_payload["joins"] = join_debug
+    if debug_payload is not None and spill_stats["runs"]:
+        debug_payload["spill"] = spill_stats
 
     return ViewResponse(
         view=pivot_view,
@@ -593,3 +690,360 @@ async def _build_report_view_streaming(
         chart=chart_config,
         debug=debug_payload,
     )
+
+
+class _JoinedRecordStream:
+    """
+    Подготовленный потоковый проход для /filters, /details и экспорта:
+    join-lookup, FusedRecordPipeline и счётчики чтения upstream. chunks() читает
+    чанки источника, process(chunk, consume) прогоняет чанк через конвейер.
+    """
+
+    def __init__(
+        self,
+        payload: ViewRequest,
+        record_filter: RecordFilter,
+        *,
+        payload_filters: Any = None,
+        pushdown_enabled: bool | None = None,
+    ) -> None:
+        self.settings = get_settings()
+        self.payload = payload
+        self.record_filter = record_filter
+        self.payload_filters = payload_filters
+        self.pushdown_enabled = pushdown_enabled
+        self.max_records = _get_streaming_records_limit(self.settings)
+        self.join_max_records = self.settings.report_join_max_records or None
+        self.computed_engine = build_computed_fields_engine(payload.remoteSource)
+        self.total_records = 0
+        self.update_duration_ms = 0
+        self.paging_stats: Dict[str, Any] = {}
+        self.started = 0.0
+        self.pipeline: FusedRecordPipeline | None = None
+        self.join_debug: Dict[str, Any] = {}
+
+    async def prepare(self) -> "_JoinedRecordStream":
+        settings = self.settings
+        prepared_joins = await prepare_joins_streaming(
+            self.payload.remoteSource,
+            settings.report_chunk_size,
+            max_records=self.max_records,
+            lookup_max_keys=settings.report_join_lookup_max_keys,
+            paging_allowlist=settings.report_paging_allowlist,
+            paging_max_pages=settings.report_paging_max_pages,
+            paging_force=settings.report_upstream_paging,
+        )
+        self.join_debug = _init_join_debug(prepared_joins)
+        self.pipeline = FusedRecordPipeline(
+            computed_engine=self.computed_engine,
+            prepared_joins=prepared_joins,
+            record_filter=self.record_filter,
+            join_debug=self.join_debug,
+            max_records=self.max_records,
+        )
+        self.started = time.monotonic()
+        return self
+
+    async def chunks(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        settings = self.settings
+        async for records_chunk in async_iter_records(
+            self.payload.remoteSource,
+            settings.report_chunk_size,
+            payload_filters=self.payload_filters,
+            pushdown_enabled=self.pushdown_enabled,
+            paging_allowlist=settings.report_paging_allowlist,
+            paging_max_pages=settings.report_paging_max_pages,
+            paging_force=settings.report_upstream_paging,
+            stats=self.paging_stats,
+        ):
+            self.total_records += len(records_chunk)
+            _enforce_records_limit(self.total_records, self.max_records, "load_records")
+            yield records_chunk
+
+    def process(
+        self,
+        records_chunk: List[Dict[str, Any]],
+        consume: Callable[[Iterator[Dict[str, Any]]], Any],
+        span_name: str,
+    ) -> Any:
+        update_started = time.monotonic()
+        try:
+            with get_tracer().start_as_current_span(span_name) as span:
+                span.set_attribute("streaming_enabled", True)
+                span.set_attribute("records_count", len(records_chunk))
+                result = consume(self.pipeline.iter_chunk(records_chunk))
+        finally:
+            self.update_duration_ms += int((time.monotonic() - update_started) * 1000)
+        _enforce_records_limit(self.pipeline.total_joined, self.join_max_records, "apply_joins")
+        return result
+
+    def summary(self, loop_lag_max_ms: float) -> Dict[str, Any]:
+        pipeline = self.pipeline
+        total_duration_ms = int((time.monotonic() - self.started) * 1000)
+        return {
+            "records": self.total_records,
+            "recordsProcessed": pipeline.records_read,
+            "recordsReceived": max(self.total_records, self.paging_stats.get("records_received") or 0),
+            "recordsComplete": bool(self.paging_stats.get("records_complete")),
+            "recordsAfterJoin": pipeline.total_joined,
+            "recordsAfterFilter": pipeline.total_filtered,
+            "joins": self.join_debug,
+            "filterDebug": pipeline.filter_debug(),
+            "computedWarnings": list(getattr(self.computed_engine, "warnings", []) or []),
+            "duration_ms": self.update_duration_ms,
+            "records_per_second": int(self.total_records * 1000 / total_duration_ms) if total_duration_ms else None,
+            "loop_lag_max_ms": round(loop_lag_max_ms, 1),
+        }
+
+
+async def _stream_joined_records(
+    payload: ViewRequest,
+    record_filter: RecordFilter,
+    consume: Callable[[Iterator[Dict[str, Any]]], None],
+    *,
+    span_name: str,
+    payload_filters: Any = None,
+    pushdown_enabled: bool | None = None,
+) -> Dict[str, Any]:
+    """
+    Потоковый проход для /api/report/filters и /api/report/details: чанки upstream
+    проходят вычисляемые поля, join и record_filter (FusedRecordPipeline), а
+    consume получает итератор строк чанка в рабочем потоке drive_chunks.
+    consume может бросить StopChunks — чтение upstream прекращается.
+    Возвращает сводку прохода.
+    """
+    stream = await _JoinedRecordStream(
+        payload,
+        record_filter,
+        payload_filters=payload_filters,
+        pushdown_enabled=pushdown_enabled,
+    ).prepare()
+    async with LoopLagProbe() as loop_probe:
+        await drive_chunks(
+            stream.chunks(),
+            lambda records_chunk: stream.process(records_chunk, consume, span_name),
+            queue_size=stream.settings.report_streaming_queue_size,
+        )
+    record_streaming_loop_lag(loop_probe.max_lag_ms / 1000)
+    return stream.summary(loop_probe.max_lag_ms)
+
+
+async def collect_filter_options_streaming(
+    payload: ViewRequest,
+    request_id: str | None = None,
+    max_unique: int = 200,
+) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+    """
+    Каскадные опции фильтров без материализации набора записей: строки чанков
+    после вычисляемых полей и join (без фильтров) сразу попадают в
+    FilterOptionsCounter. Ключ, у которого различных значений больше
+    REPORT_FILTERS_STREAMING_MAX_VALUES, считается heavy-hitters скетчем
+    (max_unique × REPORT_TOP_N_CANDIDATE_FACTOR счётчиков) — память ограничена.
+    Возвращает результат в формате collect_filter_options и сводку прохода.
+    """
+    settings = get_settings()
+    counter = FilterOptionsCounter(
+        payload.snapshot,
+        payload.filters,
+        max_values=settings.report_filters_streaming_max_values,
+        sketch_capacity=max_unique * settings.report_top_n_candidate_factor,
+    )
+    summary = await _stream_joined_records(
+        payload,
+        compile_record_filter({}, None),
+        counter.update,
+        span_name="streaming_filter_options",
+        pushdown_enabled=False,
+    )
+    result = await run_stage("collect_filter_options", counter.result, max_unique)
+    logger.info(
+        "report.filters.streaming_pipeline",
+        extra={
+            "templateId": payload.templateId,
+            "requestId": request_id,
+            "records": summary["records"],
+            "recordsAfterJoin": summary["recordsAfterJoin"],
+            "approximate_keys": counter.approximate_keys,
+            "duration_ms": summary["duration_ms"],
+            "records_per_second": summary["records_per_second"],
+            "loop_lag_max_ms": summary["loop_lag_max_ms"],
+        },
+    )
+    return result, summary
+
+
+async def build_details_streaming(
+    payload: ViewRequest,
+    details_payload: Dict[str, Any],
+    request_id: str | None = None,
+    limit: int = 200,
+    offset: int = 0,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Детализация ячейки потоковым проходом (DetailsCollector): строки после join и
+    фильтров проверяются по мере чтения upstream, в памяти — только страница.
+    Чтение прекращается, как только набрана страница и total в нужном режиме
+    (totalMode: exact / capped / estimate).
+    """
+    settings = get_settings()
+    collector = DetailsCollector(
+        payload.snapshot,
+        details_payload,
+        limit=limit,
+        offset=offset,
+        total_mode=resolve_detail_total_mode(details_payload),
+        total_cap=settings.report_details_total_cap,
+    )
+    summary = await _stream_joined_records(
+        payload,
+        compile_record_filter(payload.snapshot, payload.filters),
+        collector.update,
+        span_name="streaming_details",
+        payload_filters=payload.filters,
+    )
+    response = collector.result(
+        summary["recordsProcessed"],
+        summary["recordsReceived"],
+        records_total=summary["recordsReceived"] if summary["recordsComplete"] else None,
+    )
+    logger.info(
+        "report.details.streaming_pipeline",
+        extra={
+            "templateId": payload.templateId,
+            "requestId": request_id,
+            "records": summary["records"],
+            "recordsAfterFilter": summary["recordsAfterFilter"],
+            "entries": len(response["entries"]),
+            "totalMode": response["totalMode"],
+            "stoppedEarly": collector.stopped,
+            "duration_ms": summary["duration_ms"],
+            "records_per_second": summary["records_per_second"],
+            "loop_lag_max_ms": summary["loop_lag_max_ms"],
+        },
+    )
+    return response, summary
+
+
+async def stream_details_export(
+    payload: ViewRequest,
+    details_payload: Dict[str, Any],
+    export_format: str,
+    request_id: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Выгрузка детализации в CSV/XLSX потоковым проходом по источнику: строки после
+    join и фильтров проверяются на ограничения ячейки (DetailsCollector) и
+    сериализуются по чанку. Следующий чанк upstream читается, только когда клиент
+    забрал предыдущую порцию; в памяти — один чанк и буфер writer. Первая порция
+    (заголовок) отдаётся вместе с первым чанком, чтобы ошибки загрузки источника
+    успели стать HTTP-статусом.
+    """
+    if resolve_detail_sort(details_payload):
+        raise ValueError("sort is not supported for details export")
+    collector = DetailsCollector(payload.snapshot, details_payload)
+    writer = create_export_writer(export_format)
+    stream = await _JoinedRecordStream(
+        payload,
+        compile_record_filter(payload.snapshot, payload.filters),
+        payload_filters=payload.filters,
+    ).prepare()
+
+    def consume(rows: Iterator[Dict[str, Any]]) -> bytes:
+        return writer.write_rows(collector.iter_rows(rows))
+
+    pending = writer.header(collector.field_labels())
+    chunks = stream.chunks()
+    try:
+        async for records_chunk in chunks:
+            pending += await run_stage("export_details", stream.process, records_chunk, consume, "streaming_export")
+            if pending:
+                yield pending
+                pending = b""
+            if getattr(writer, "truncated", False):
+                # лист XLSX заполнен: остальные строки всё равно не попадут в файл, upstream больше не читаем
+                break
+    finally:
+        await chunks.aclose()
+    yield pending + writer.close()
+    logger.info(
+        "report.details.export",
+        extra={
+            "templateId": payload.templateId,
+            "requestId": request_id,
+            "format": export_format,
+            "records": stream.total_records,
+            "rows": writer.rows_written,
+            "truncated": getattr(writer, "truncated", False),
+            "duration_ms": int((time.monotonic() - stream.started) * 1000),
+        },
+    )
+
+
+async def stream_view_export(
+    payload: ViewRequest,
+    export_format: str,
+    request_id: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Выгрузка pivot в CSV/XLSX: записи источника агрегируются потоковым проходом
+    (StreamingPivotAggregator с бюджетами REPORT_STREAMING_*), строки результата
+    финализируются по одной (iter_finalized_rows) и сериализуются порциями
+    по EXPORT_BATCH_ROWS — ни набор записей, ни полный view в памяти не собираются.
+    Последней идёт строка итогов «Итого» по колонкам.
+    """
+    settings = get_settings()
+    started = time.monotonic()
+    aggregator = StreamingPivotAggregator(
+        payload.snapshot,
+        max_groups=settings.report_streaming_max_groups,
+        max_unique_values_per_dim=settings.report_streaming_max_unique_values_per_dim,
+        top_n_candidate_factor=settings.report_top_n_candidate_factor,
+        spill_max_cells=settings.report_streaming_spill_cells,
+        spill_dir=os.path.join(settings.report_jobs_dir, "spill"),
+    )
+    try:
+        summary = await _stream_joined_records(
+            payload,
+            compile_record_filter(payload.snapshot, payload.filters),
+            aggregator.update,
+            span_name="streaming_export",
+            payload_filters=payload.filters,
+        )
+        columns, rows = await run_stage("build_pivot", aggregator.iter_finalized_rows)
+        snapshot_dict = payload.snapshot.dict() if hasattr(payload.snapshot, "dict") else payload.snapshot
+        row_fields = (snapshot_dict.get("pivot") or {}).get("rows") or []
+        has_row_fields = bool(row_fields)
+        writer = create_export_writer(export_format)
+
+        def encode_batch() -> Tuple[bytes, int]:
+            written = writer.rows_written
+            data = writer.write_rows(pivot_export_row(row, has_row_fields) for row in islice(rows, EXPORT_BATCH_ROWS))
+            return data, writer.rows_written - written
+
+        pending = writer.header(pivot_export_header(snapshot_dict, columns))
+        while True:
+            data, batch_rows = await run_stage("export_view", encode_batch)
+            pending += data
+            if pending:
+                yield pending
+                pending = b""
+            if batch_rows < EXPORT_BATCH_ROWS:
+                break
+        totals_row = aggregator.totals_row()
+        if totals_row is not None:
+            pending = writer.write_rows([pivot_export_totals_row(totals_row, len(row_fields))])
+        yield pending + writer.close()
+    finally:
+        aggregator.cleanup()
+    logger.info(
+        "report.view.export",
+        extra={
+            "templateId": payload.templateId,
+            "requestId": request_id,
+            "format": export_format,
+            "records": summary["records"],
+            "rows": writer.rows_written,
+            "truncated": getattr(writer, "truncated", False),
+            "duration_ms": int((time.monotonic() - started) * 1000),
+        },
+    )
@@ -0,0 +1,309 @@
+import base64
+import hashlib
+import math
+from typing import Any, Dict, List, Tuple
+
+HLL_MIN_PRECISION = 4
+HLL_MAX_PRECISION = 18
+HLL_DEFAULT_PRECISION = 14
+
+TDIGEST_DEFAULT_COMPRESSION = 100
+
+_MASK_64 = (1 << 64) - 1
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(66)]
+
+
+def hash64(text: str) -> int:
+    """Стабильный 64-битный хеш строки (одинаков между процессами и воркерами)."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def normalize_hll_precision(value: Any, default: int = HLL_DEFAULT_PRECISION) -> int:
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(parsed, HLL_MIN_PRECISION), HLL_MAX_PRECISION)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog для приближённого count_distinct.
+
+    Пока заполнено мало регистров, хранится разреженно (index -> rank), затем
+    переходит на плотный bytearray из 2^precision регистров. Относительная
+    погрешность ~1.04 / sqrt(2^precision).
+    """
+
+    __slots__ = ("precision", "_sparse", "_registers")
+
+    def __init__(self, precision: int = HLL_DEFAULT_PRECISION) -> None:
+        self.precision = normalize_hll_precision(precision)
+        self._sparse: Dict[int, int] | None = {}
+        self._registers: bytearray | None = None
+
+    @property
+    def size(self) -> int:
+        return 1 << self.precision
+
+    def add(self, value_hash: int) -> None:
+        precision = self.precision
+        index = value_hash >> (64 - precision)
+        remainder = (value_hash << precision) & _MASK_64
+        rank = 65 - remainder.bit_length() if remainder else 65 - precision
+        self._set_register(index, rank)
+
+    def _set_register(self, index: int, rank: int) -> None:
+        registers = self._registers
+        if registers is not None:
+            if rank > registers[index]:
+                registers[index] = rank
+            return
+        sparse = self._sparse
+        if rank > sparse.get(index, 0):
+            sparse[index] = rank
+            if len(sparse) > self.size // 32:
+                self._densify()
+
+    def _densify(self) -> None:
+        registers = bytearray(self.size)
+        for index, rank in (self._sparse or {}).items():
+            registers[index] = rank
+        self._registers = registers
+        self._sparse = None
+
+    def update(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        if other._registers is None:
+            for index, rank in (other._sparse or {}).items():
+                self._set_register(index, rank)
+            return
+        if self._registers is None:
+            self._densify()
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def count(self) -> int:
+        size = self.size
+        if self._registers is None:
+            ranks = self._sparse.values()
+            zeros = size - len(self._sparse)
+            inverse_sum = zeros + sum(_INVERSE_POWERS[rank] for rank in ranks)
+        else:
+            zeros = self._registers.count(0)
+            inverse_sum = sum(map(_INVERSE_POWERS.__getitem__, self._registers))
+        if size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / size)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[size]
+        estimate = alpha * size * size / inverse_sum
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_state(self) -> Dict[str, Any]:
+        if self._registers is None:
+            return {"p": self.precision, "s": sorted([index, rank] for index, rank in self._sparse.items())}
+        return {"p": self.precision, "r": base64.b64encode(bytes(self._registers)).decode("ascii")}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(state.get("p", HLL_DEFAULT_PRECISION))
+        if "r" in state:
+            registers = bytearray(base64.b64decode(state["r"]))
+            if len(registers) != sketch.size:
+                raise ValueError("Invalid HyperLogLog state")
+            sketch._registers = registers
+            sketch._sparse = None
+            return sketch
+        for index, rank in state.get("s") or []:
+            sketch._set_register(int(index), int(rank))
+        return sketch
+
+
+class TDigest:
+    """
+    Merging t-digest для квантилей (median/p90/p95) в потоковом режиме.
+
+    Значения копятся в буфере и периодически сжимаются в центроиды со scale-функцией
+    k1 (asin), поэтому хвосты распределения остаются точными. Пока центроиды состоят
+    из одиночных значений, квантиль совпадает с интерполяцией по отсортированному ряду.
+    """
+
+    __slots__ = ("compression", "count", "min", "max", "_means", "_weights", "_buffer")
+
+    def __init__(self, compression: int = TDIGEST_DEFAULT_COMPRESSION) -> None:
+        self.compression = compression
+        self.count = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+        self._means: List[float] = []
+        self._weights: List[float] = []
+        self._buffer: List[Tuple[float, float]] = []
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        if value != value:
+            return
+        self._buffer.append((value, weight))
+        self.count += weight
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if len(self._buffer) >= self.compression:
+            self._compress()
+
+    def update(self, other: "TDigest") -> None:
+        if not other.count:
+            return
+        self._buffer.extend(zip(other._means, other._weights))
+        self._buffer.extend(other._buffer)
+        self.count += other.count
+        if self.min is None or (other.min is not None and other.min < self.min):
+            self.min = other.min
+        if self.max is None or (other.max is not None and other.max > self.max):
+            self.max = other.max
+        self._compress()
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self._means, self._weights)) + self._buffer)
+        self._buffer = []
+        total = self.count
+        normalizer = self.compression / (2 * math.pi)
+        means: List[float] = []
+        weights: List[float] = []
+        current_mean, current_weight = points[0]
+        cumulative = 0.0
+        limit = total * self._k_inverse(self._k(0.0, normalizer) + 1, normalizer)
+        for mean, weight in points[1:]:
+            if cumulative + current_weight + weight <= limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+                continue
+            means.append(current_mean)
+            weights.append(current_weight)
+            cumulative += current_weight
+            limit = total * self._k_inverse(self._k(cumulative / total, normalizer) + 1, normalizer)
+            current_mean, current_weight = mean, weight
+        means.append(current_mean)
+        weights.append(current_weight)
+        self._means = means
+        self._weights = weights
+
+    @staticmethod
+    def _k(q: float, normalizer: float) -> float:
+        return normalizer * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    @staticmethod
+    def _k_inverse(k: float, normalizer: float) -> float:
+        if k / normalizer >= math.pi / 2:
+            return 1.0
+        return (math.sin(k / normalizer) + 1) / 2
+
+    def quantile(self, q: float) -> float | None:
+        self._compress()
+        if not self.count:
+            return None
+        means = self._means
+        weights = self._weights
+        if len(means) == 1:
+            return means[0]
+        index = q * self.count
+        # позиции центров центроидов на оси накопленного веса
+        center = weights[0] / 2
+        if index <= center:
+            if center <= 0.5:
+                return means[0]
+            return self.min + (means[0] - self.min) * index / center
+        for idx in range(1, len(means)):
+            next_center = center + (weights[idx - 1] + weights[idx]) / 2
+            if index <= next_center:
+                ratio = (index - center) / (next_center - center)
+                return means[idx - 1] + (means[idx] - means[idx - 1]) * ratio
+            center = next_center
+        tail = weights[-1] / 2
+        if tail <= 0.5:
+            return means[-1]
+        return means[-1] + (self.max - means[-1]) * min((index - center) / tail, 1.0)
+
+    def to_state(self) -> Dict[str, Any]:
+        self._compress()
+        return {
+            "c": self.compression,
+            "m": list(self._means),
+            "w": list(self._weights),
+            "n": self.min,
+            "x": self.max,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "TDigest":
+        digest = cls(int(state.get("c") or TDIGEST_DEFAULT_COMPRESSION))
+        digest._means = [float(value) for value in state.get("m") or []]
+        digest._weights = [float(value) for value in state.get("w") or []]
+        if len(digest._means) != len(digest._weights):
+            raise ValueError("Invalid t-digest state")
+        digest.count = sum(digest._weights)
+        digest.min = state.get("n")
+        digest.max = state.get("x")
+        return digest
+
+
+class FrequentItems:
+    """
+    Heavy hitters (взвешенный Misra–Gries) для top-N по измерению.
+
+    Хранит не больше capacity счётчиков: при переполнении все счётчики уменьшаются
+    на медиану, а уменьшение копится в offset. Истинный вес элемента лежит в
+    [lower_bound, lower_bound + offset].
+    """
+
+    __slots__ = ("capacity", "offset", "_counts")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(int(capacity), 2)
+        self.offset = 0.0
+        self._counts: Dict[str, float] = {}
+
+    def add(self, item: str, weight: float = 1.0) -> None:
+        counts = self._counts
+        counts[item] = counts.get(item, 0.0) + max(weight, 0.0)
+        if len(counts) > self.capacity:
+            self._purge()
+
+    def _purge(self) -> None:
+        while len(self._counts) > self.capacity:
+            values = sorted(self._counts.values())
+            threshold = values[len(values) // 2]
+            self.offset += threshold
+            self._counts = {item: count - threshold for item, count in self._counts.items() if count > threshold}
+
+    def lower_bound(self, item: str) -> float:
+        return self._counts.get(item, 0.0)
+
+    def upper_bound(self, item: str) -> float:
+        return self._counts.get(item, 0.0) + self.offset
+
+    def update(self, other: "FrequentItems") -> None:
+        counts = self._counts
+        for item, count in other._counts.items():
+            counts[item] = counts.get(item, 0.0) + count
+        self.offset += other.offset
+        self._purge()
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "k": self.capacity,
+            "o": self.offset,
+            "i": [[item, count] for item, count in self._counts.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "FrequentItems":
+        sketch = cls(int(state.get("k") or 2))
+        sketch.offset = float(state.get("o") or 0.0)
+        sketch._counts = {str(item): float(count) for item, count in state.get("i") or []}
+        return sketch
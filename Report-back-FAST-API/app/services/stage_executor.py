@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple, TypeVar
+
+from app.config import get_settings
+from app.observability.loop_monitor import LoopLagProbe
+from app.observability.metrics import record_loop_blocked, record_stage_duration
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STAGE_EXECUTORS = ("inline", "thread", "process")
+
+_executors: Dict[Tuple[str, int], Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def _resolve_mode(value: str) -> str:
+    mode = (value or "thread").strip().lower()
+    return mode if mode in STAGE_EXECUTORS else "thread"
+
+
+def _get_executor(mode: str, workers: int) -> Executor:
+    key = (mode, workers)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            max_workers = workers or None
+            if mode == "process":
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+            else:
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-stage")
+            _executors[key] = executor
+        return executor
+
+
+def shutdown_stage_executors() -> None:
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _report_loop_blocked(stage: str, duration_ms: float, threshold_ms: int) -> None:
+    record_loop_blocked(stage)
+    logger.warning(
+        "report.stage.loop_blocked",
+        extra={"stage": stage, "duration_ms": int(duration_ms), "threshold_ms": threshold_ms},
+    )
+
+
+@contextmanager
+def loop_guard(stage: str) -> Iterator[None]:
+    """
+    Синхронный участок, выполняемый прямо на event loop: если он занял loop
+    дольше REPORT_LOOP_BLOCK_WARN_MS, пишется report.stage.loop_blocked.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        duration_ms = (time.monotonic() - started) * 1000
+        threshold_ms = get_settings().report_loop_block_warn_ms
+        if threshold_ms and duration_ms > threshold_ms:
+            _report_loop_blocked(stage, duration_ms, threshold_ms)
+
+
+async def _run_in_executor(stage: str, executor: Executor, call: Callable[[], T]) -> T:
+    """
+    Этап в пуле потоков или процессов. Loop при этом тоже может стоять: GIL держит
+    рабочий поток, а в process-режиме — pickle аргументов и результата. Поэтому на
+    время этапа замеряется задержка loop, и превышение порога пишется так же, как в loop_guard.
+    """
+    threshold_ms = get_settings().report_loop_block_warn_ms
+    loop = asyncio.get_running_loop()
+    if not threshold_ms:
+        return await loop.run_in_executor(executor, call)
+    async with LoopLagProbe() as probe:
+        result = await loop.run_in_executor(executor, call)
+    if probe.max_lag_ms > threshold_ms:
+        _report_loop_blocked(stage, probe.max_lag_ms, threshold_ms)
+    return result
+
+
+async def run_stage(
+    stage: str,
+    func: Callable[..., T],
+    *args: Any,
+    pure: bool = False,
+    input_size: int | None = None,
+    **kwargs: Any,
+) -> T:
+    """
+    Выполняет CPU-этап запроса вне event loop (REPORT_STAGE_EXECUTOR):
+    inline — на loop под loop_guard, thread — в пуле потоков,
+    process — в пуле процессов, но только для pure-этапов (аргументы и результат
+    сериализуемы, входные данные не изменяются); остальные этапы идут в пул потоков.
+    input_size — число входных записей: аргументы уходят в процесс одним pickle,
+    поэтому выше REPORT_STAGE_PROCESS_MAX_RECORDS этап тоже идёт в пул потоков.
+    Во всех режимах задержка loop сверх REPORT_LOOP_BLOCK_WARN_MS пишется в
+    report.stage.loop_blocked. Длительность пишется в метрику report_stage_duration_seconds.
+    """
+    settings = get_settings()
+    mode = _resolve_mode(settings.report_stage_executor)
+    if mode == "process":
+        max_records = settings.report_stage_process_max_records
+        if not pure or (max_records and input_size is not None and input_size > max_records):
+            mode = "thread"
+    started = time.monotonic()
+    try:
+        if mode == "inline":
+            with loop_guard(stage):
+                return func(*args, **kwargs)
+        executor = _get_executor(mode, settings.report_stage_workers)
+        call = functools.partial(func, *args, **kwargs)
+        if mode == "thread":
+            # контекст (span OpenTelemetry, requestId) переносится в рабочий поток, как в asyncio.to_thread
+            call = functools.partial(contextvars.copy_context().run, call)
+        return await _run_in_executor(stage, executor, call)
+    finally:
+        record_stage_duration(stage, mode, time.monotonic() - started)
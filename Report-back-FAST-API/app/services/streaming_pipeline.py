@@ -0,0 +1,167 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from app.services.filter_service import RecordFilter
+from app.services.join_service import PreparedJoinLookup, probe_prepared_joins
+
+
+class FusedRecordPipeline:
+    """
+    Fused-конвейер потокового режима: вычисляемые поля, join по подготовленным
+    lookup и предикат фильтров применяются к записи за один проход, без
+    промежуточных списков и копий строк. Собирается один раз на запрос,
+    iter_chunk() отдаёт прошедшие фильтры записи прямо в StreamingPivotAggregator.update.
+
+    Счётчики и sample-ключи совпадают с поэтапным режимом (beforeJoin/afterJoin/
+    beforeFilters/afterFilters, joinsApplied, reasonsDropped).
+    """
+
+    def __init__(
+        self,
+        *,
+        computed_engine: Any | None,
+        prepared_joins: List[PreparedJoinLookup],
+        record_filter: RecordFilter,
+        join_debug: Dict[str, Any],
+        max_records: Optional[int] = None,
+    ) -> None:
+        self._computed_engine = computed_engine
+        self._prepared_joins = prepared_joins
+        self._record_filter = record_filter
+        self._join_debug = join_debug
+        self._max_records = max_records
+        # исходные записи, уже прошедшие через конвейер (при досрочной остановке — меньше прочитанных)
+        self.records_read = 0
+        self.total_joined = 0
+        self.total_filtered = 0
+        self.chunks = 0
+        self._sample_before_filters: List[str] = []
+        self._sample_after_filters: List[str] = []
+        self._dropped: List[Dict[str, Any]] = []
+
+    def iter_chunk(self, records: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        self.chunks += 1
+        computed_engine = self._computed_engine
+        prepared_joins = self._prepared_joins
+        join_stats = self._join_debug["joinsApplied"]
+        sample_keys = self._join_debug["sampleKeys"]
+        check = self._record_filter.check if self._record_filter.active else None
+        max_records = self._max_records if prepared_joins else None
+        chunk_started = [entry["baseAfter"] for entry in join_stats]
+
+        for record in records:
+            self.records_read += 1
+            if computed_engine is not None:
+                computed_engine.apply_record(record)
+            if not sample_keys["beforeJoin"]:
+                sample_keys["beforeJoin"] = list(record.keys())
+            joined = probe_prepared_joins(record, prepared_joins, join_stats) if prepared_joins else (record,)
+            if max_records:
+                # тот же лимит на размер чанка после каждого join, что и в apply_prepared_join_lookups;
+                # проверяется до отдачи строк, чтобы потребитель не получил строки сверх лимита
+                for entry, started in zip(join_stats, chunk_started):
+                    chunk_rows = entry["baseAfter"] - started
+                    if chunk_rows > max_records:
+                        raise ValueError(f"Records limit exceeded: {chunk_rows} > {max_records}")
+            for row in joined:
+                self.total_joined += 1
+                if not sample_keys["afterJoin"]:
+                    sample_keys["afterJoin"] = list(row.keys())
+                if not self._sample_before_filters:
+                    self._sample_before_filters = list(row.keys())
+                if check is not None:
+                    fail_reason = check(row)
+                    if fail_reason is not None:
+                        if len(self._dropped) < 2:
+                            self._dropped.append(fail_reason)
+                        continue
+                    if not self._sample_after_filters:
+                        self._sample_after_filters = list(row.keys())
+                self.total_filtered += 1
+                yield row
+
+    def filter_debug(self) -> Dict[str, Any] | None:
+        if not self.chunks:
+            return None
+        record_filter = self._record_filter
+        sample_record_keys: Dict[str, Any] = {"beforeFilters": self._sample_before_filters}
+        if record_filter.active:
+            sample_record_keys["afterFilters"] = self._sample_after_filters
+        payload: Dict[str, Any] = {
+            "counts": {"beforeFilters": self.total_joined, "afterFilters": self.total_filtered},
+            "effectiveFilters": record_filter.effective_filters(),
+            "appliedKeys": {
+                "values": list(record_filter.applied_values) if record_filter.active else [],
+                "ranges": list(record_filter.applied_ranges) if record_filter.active else [],
+            },
+            "sampleRecordKeys": sample_record_keys,
+        }
+        if self._dropped:
+            payload["reasonsDropped"] = list(self._dropped)
+        return payload
+
+
+_QUEUE_DONE = object()
+
+
+class StopChunks(Exception):
+    """process() сообщает drive_chunks, что результат готов и чтение можно прекратить."""
+
+
+async def drive_chunks(
+    chunks: AsyncIterator[List[Dict[str, Any]]],
+    process: Callable[[List[Dict[str, Any]]], None],
+    *,
+    queue_size: int,
+) -> None:
+    """
+    Producer/consumer для потокового режима: async-итератор чанков читает upstream
+    на event loop и кладёт чанки в ограниченную очередь, отдельный рабочий поток
+    вызывает process(chunk). Полная очередь тормозит чтение следующих страниц
+    (backpressure). queue_size <= 0 — обработка прямо на event loop.
+    Ошибка process прекращает чтение и пробрасывается вызывающему;
+    StopChunks — штатная досрочная остановка (upstream дальше не читается).
+    """
+    if queue_size <= 0:
+        try:
+            async for chunk in chunks:
+                process(chunk)
+        except StopChunks:
+            pass
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    failures: List[BaseException] = []
+
+    def consume() -> None:
+        while True:
+            chunk = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+            if chunk is _QUEUE_DONE:
+                return
+            if failures:
+                # после ошибки очередь только дренируется, чтобы producer не завис на put
+                continue
+            try:
+                process(chunk)
+            except BaseException as exc:
+                failures.append(exc)
+
+    worker = asyncio.ensure_future(asyncio.to_thread(consume))
+    try:
+        async for chunk in chunks:
+            if failures:
+                break
+            await queue.put(chunk)
+    finally:
+        await queue.put(_QUEUE_DONE)
+        await worker
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    if failures and not isinstance(failures[0], StopChunks):
+        raise failures[0]
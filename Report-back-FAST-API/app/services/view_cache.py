@@ -0,0 +1,246 @@
+import heapq
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+from uuid import uuid4
+
+import redis.asyncio as redis
+
+from app.config import get_settings
+from app.services import pivot_core
+
+
+logger = logging.getLogger(__name__)
+
+_VIEW_KEY_PREFIX = "report:view:"
+# строк / узлов дерева в выборке для оценки размера записи
+_SAMPLE_ITEMS = 64
+# handle → (время записи, оценка байт, запись); порядок — от старых к новым
+_STORE: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+_STORE_BYTES = 0
+_REDIS_CLIENT: redis.Redis | None = None
+_REDIS_URL: str | None = None
+
+
+def _get_redis_client() -> redis.Redis | None:
+    global _REDIS_CLIENT, _REDIS_URL
+    url = os.getenv("REDIS_URL")
+    if not url:
+        return None
+    if _REDIS_CLIENT is None or url != _REDIS_URL:
+        _REDIS_URL = url
+        _REDIS_CLIENT = redis.from_url(url)
+    return _REDIS_CLIENT
+
+
+def _json_nbytes(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _sample_nbytes(items: List[Any]) -> int:
+    if not items:
+        return 0
+    step = max(1, len(items) // _SAMPLE_ITEMS)
+    sample = items[::step][:_SAMPLE_ITEMS]
+    return int(sum(_json_nbytes(item) for item in sample) / len(sample) * len(items))
+
+
+def estimate_entry_nbytes(entry: Dict[str, Any]) -> int:
+    """
+    Оценка JSON-размера записи без полной сериализации: строки pivot и узлы
+    дерева оцениваются по равномерной выборке, остальное считается точно.
+    """
+    view = entry.get("view") or {}
+    tree = entry.get("tree") or {}
+    rest = {key: value for key, value in entry.items() if key not in ("view", "tree")}
+    return (
+        _json_nbytes({key: value for key, value in view.items() if key != "rows"})
+        + _sample_nbytes(view.get("rows") or [])
+        + _json_nbytes({key: value for key, value in tree.items() if key != "nodes"})
+        + _sample_nbytes(list((tree.get("nodes") or {}).values()))
+        + _json_nbytes(rest)
+    )
+
+
+def _drop_entry(handle: str) -> None:
+    global _STORE_BYTES
+    entry = _STORE.pop(handle, None)
+    if entry is not None:
+        _STORE_BYTES -= entry[1]
+
+
+def _evict_expired(ttl_seconds: int) -> None:
+    now = time.time()
+    for handle in [handle for handle, (created_at, _, _) in _STORE.items() if now - created_at > ttl_seconds]:
+        _drop_entry(handle)
+
+
+async def store_view(entry: Dict[str, Any]) -> str | None:
+    """
+    Сохраняет финализированный pivot (и сопутствующее состояние) под новым handle.
+    entry должен быть JSON-сериализуемым: {"view": {...}, ...}.
+    Запись больше REPORT_VIEW_CACHE_MAX_ENTRY_BYTES не кэшируется — возвращается None.
+    """
+    global _STORE_BYTES
+    settings = get_settings()
+    max_entry_bytes = settings.report_view_cache_max_entry_bytes
+    nbytes = estimate_entry_nbytes(entry)
+    if max_entry_bytes and nbytes > max_entry_bytes:
+        logger.info("View cache skip", extra={"bytes": nbytes, "maxBytes": max_entry_bytes})
+        return None
+    handle = uuid4().hex
+    client = _get_redis_client()
+    if client is not None:
+        try:
+            payload = json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8")
+            if max_entry_bytes and len(payload) > max_entry_bytes:
+                logger.info("View cache skip", extra={"bytes": len(payload), "maxBytes": max_entry_bytes})
+                return None
+            await client.setex(f"{_VIEW_KEY_PREFIX}{handle}", settings.report_view_cache_ttl_seconds, payload)
+            return handle
+        except Exception as exc:
+            logger.warning("View cache redis set failed", extra={"error": str(exc)})
+
+    _evict_expired(settings.report_view_cache_ttl_seconds)
+    max_bytes = settings.report_view_cache_max_bytes
+    if max_bytes and nbytes > max_bytes:
+        logger.info("View cache skip", extra={"bytes": nbytes, "maxBytes": max_bytes})
+        return None
+    while _STORE and (
+        len(_STORE) >= settings.report_view_cache_max_items or (max_bytes and _STORE_BYTES + nbytes > max_bytes)
+    ):
+        _drop_entry(next(iter(_STORE)))
+    _STORE[handle] = (time.time(), nbytes, entry)
+    _STORE_BYTES += nbytes
+    return handle
+
+
+def clear_view_cache() -> None:
+    global _STORE_BYTES
+    _STORE.clear()
+    _STORE_BYTES = 0
+
+
+def view_cache_stats() -> Dict[str, Any]:
+    return {"entries": len(_STORE), "bytes": _STORE_BYTES}
+
+
+async def get_view(handle: str) -> Dict[str, Any] | None:
+    if not handle:
+        return None
+    settings = get_settings()
+    client = _get_redis_client()
+    if client is not None:
+        try:
+            payload = await client.get(f"{_VIEW_KEY_PREFIX}{handle}")
+        except Exception as exc:
+            logger.warning("View cache redis get failed", extra={"error": str(exc)})
+        else:
+            if not payload:
+                return None
+            try:
+                return json.loads(payload)
+            except (TypeError, ValueError):
+                return None
+
+    entry = _STORE.get(handle)
+    if not entry:
+        return None
+    created_at, _, value = entry
+    if time.time() - created_at > settings.report_view_cache_ttl_seconds:
+        _drop_entry(handle)
+        return None
+    return value
+
+
+def _sorted_rows(
+    view: Dict[str, Any],
+    rows: List[Dict[str, Any]],
+    sort_column: str,
+    direction: str,
+    needed: int,
+) -> List[Dict[str, Any]]:
+    """
+    Строки, упорядоченные по значению колонки sort_column. Если нужно только окно
+    (needed меньше числа строк), используется heap-отбор top-k вместо полной сортировки.
+    """
+    if direction not in ("asc", "desc"):
+        raise ValueError(f"Unsupported sort direction: {direction}")
+    column_keys = [column.get("key") for column in view.get("columns") or []]
+    if sort_column not in column_keys:
+        raise ValueError(f"Unknown sort column: {sort_column}")
+    position = column_keys.index(sort_column)
+
+    def sort_key(row: Dict[str, Any]) -> Tuple[bool, float]:
+        cells = row.get("cells") or []
+        value = cells[position].get("value") if position < len(cells) else None
+        return pivot_core._number_sort_key(value, direction)
+
+    if needed < len(rows):
+        return heapq.nsmallest(needed, rows, key=sort_key)
+    return sorted(rows, key=sort_key)
+
+
+def slice_rows(
+    view: Dict[str, Any],
+    offset: int,
+    limit: int,
+    sort_column: str | None = None,
+    direction: str = "asc",
+) -> Dict[str, Any]:
+    rows = view.get("rows") or []
+    offset = max(0, offset)
+    total_rows = len(rows)
+    if sort_column:
+        rows = _sorted_rows(view, rows, sort_column, direction, offset + limit)
+    return {
+        "offset": offset,
+        "limit": limit,
+        "totalRows": total_rows,
+        "rows": rows[offset : offset + limit],
+    }
+
+
+def expanded_tree_keys(tree: Dict[str, Any]) -> List[str]:
+    """Ключи всех узлов дерева строк в порядке обхода в глубину (дерево, раскрытое целиком)."""
+    nodes = tree.get("nodes") or {}
+    keys: List[str] = []
+    stack = list(reversed(tree.get("roots") or []))
+    while stack:
+        key = stack.pop()
+        keys.append(key)
+        stack.extend(reversed((nodes.get(key) or {}).get("children") or []))
+    return keys
+
+
+def tree_rows(entry: Dict[str, Any], keys: List[str]) -> List[Dict[str, Any]]:
+    """
+    Строки tree-режима для узлов keys: листья — готовые строки pivot с ячейками,
+    промежуточные узлы — подытоги (totals) и число детей без ячеек.
+    """
+    nodes = (entry.get("tree") or {}).get("nodes") or {}
+    rows = (entry.get("view") or {}).get("rows") or []
+    result: List[Dict[str, Any]] = []
+    for key in keys:
+        node = nodes.get(key)
+        if node is None:
+            continue
+        position = node.get("row")
+        if node.get("leaf") and position is not None:
+            result.append({**rows[position], "depth": node["depth"], "childCount": 0})
+            continue
+        result.append(
+            {
+                "key": node["key"],
+                "label": node["label"],
+                "values": node["values"],
+                "cells": [],
+                "depth": node["depth"],
+                "childCount": len(node["children"]),
+                "totals": node["totals"],
+            }
+        )
+    return result
@@ -0,0 +1,142 @@
+from typing import Any, Dict, List, Optional
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+COMPACT_MEDIA_TYPE = "application/vnd.report.pivot+json"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+VIEW_FORMATS = ("default", "compact", "msgpack")
+CELL_LAYOUTS = ("auto", "dense", "sparse")
+
+# доля пустых ячеек, начиная с которой auto выбирает sparse
+_SPARSE_NULL_RATIO = 0.5
+
+
+def resolve_view_format(format_param: Optional[str], accept: Optional[str]) -> str:
+    """
+    Формат ответа pivot: query-параметр format имеет приоритет над Accept.
+    Неизвестный format — ValueError (422).
+    """
+    if format_param:
+        value = format_param.strip().lower()
+        if value == "json":
+            value = "default"
+        if value not in VIEW_FORMATS:
+            raise ValueError(f"Unsupported view format: {format_param}")
+        return value
+    accept_value = (accept or "").lower()
+    if MSGPACK_MEDIA_TYPE in accept_value:
+        return "msgpack"
+    if COMPACT_MEDIA_TYPE in accept_value:
+        return "compact"
+    return "default"
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def _split_column_key(column_key: str) -> List[str]:
+    base_key, _, metric_key = column_key.rpartition("::")
+    return [base_key, metric_key]
+
+
+def _row_cell_values(row: Dict[str, Any], column_keys: List[str], column_positions: Dict[str, int]) -> List[Any]:
+    cells = row.get("cells") or []
+    if len(cells) == len(column_keys):
+        return [cell.get("value") for cell in cells]
+    # строки без полного набора ячеек (узлы tree-режима) раскладываются по ключам колонок
+    values: List[Any] = [None] * len(column_keys)
+    for cell in cells:
+        _, _, column_part = cell.get("key", "").partition("||")
+        base_key, _, metric_key = column_part.partition("||")
+        position = column_positions.get(f"{base_key}::{metric_key}")
+        if position is not None:
+            values[position] = cell.get("value")
+    return values
+
+
+def encode_compact_view(view: Dict[str, Any], layout: str = "auto") -> Dict[str, Any]:
+    """
+    Компактное колоночное представление pivot: колонки и строки перечислены один раз,
+    значения ячеек — плотной матрицей rows × columns (dense) или тройками
+    индекс строки / индекс колонки / значение (sparse). Ключи ячеек
+    "{rowKey}||{baseKey}||{metricKey}" клиент собирает сам.
+    """
+    if layout not in CELL_LAYOUTS:
+        raise ValueError(f"Unsupported cell layout: {layout}")
+    columns = view.get("columns") or []
+    rows = view.get("rows") or []
+    column_keys = [column["key"] for column in columns]
+    column_positions = {key: idx for idx, key in enumerate(column_keys)}
+    matrix = [_row_cell_values(row, column_keys, column_positions) for row in rows]
+
+    if layout == "auto":
+        total = len(rows) * len(column_keys)
+        filled = sum(1 for values in matrix for value in values if value is not None)
+        layout = "sparse" if total and (total - filled) / total >= _SPARSE_NULL_RATIO else "dense"
+
+    if layout == "dense":
+        cells: Dict[str, Any] = {"layout": "dense", "values": matrix}
+    else:
+        row_indexes: List[int] = []
+        column_indexes: List[int] = []
+        values: List[Any] = []
+        for row_idx, row_values in enumerate(matrix):
+            for column_idx, value in enumerate(row_values):
+                if value is None:
+                    continue
+                row_indexes.append(row_idx)
+                column_indexes.append(column_idx)
+                values.append(value)
+        cells = {"layout": "sparse", "rows": row_indexes, "columns": column_indexes, "values": values}
+
+    result = {key: value for key, value in view.items() if key not in ("columns", "rows")}
+    result["format"] = "compact"
+    result["columns"] = [
+        {**column, "baseKey": base_key, "metricKey": metric_key}
+        for column, (base_key, metric_key) in zip(columns, map(_split_column_key, column_keys))
+    ]
+    result["rows"] = [{key: value for key, value in row.items() if key != "cells"} for row in rows]
+    result["cells"] = cells
+    return result
+
+
+def decode_compact_view(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Обратное преобразование compact → стандартный view (для Python-клиентов и тестов)."""
+    columns = payload.get("columns") or []
+    rows = payload.get("rows") or []
+    cells = payload.get("cells") or {}
+    if cells.get("layout") == "sparse":
+        matrix: List[List[Any]] = [[None] * len(columns) for _ in rows]
+        for row_idx, column_idx, value in zip(cells["rows"], cells["columns"], cells["values"]):
+            matrix[row_idx][column_idx] = value
+    else:
+        matrix = cells.get("values") or [[None] * len(columns) for _ in rows]
+
+    view = {key: value for key, value in payload.items() if key not in ("format", "columns", "rows", "cells")}
+    view["columns"] = [
+        {key: value for key, value in column.items() if key not in ("baseKey", "metricKey")}
+        for column in columns
+    ]
+    view["rows"] = [
+        {
+            **row,
+            "cells": [
+                {"key": f"{row['key']}||{column['baseKey']}||{column['metricKey']}", "value": value}
+                for column, value in zip(columns, row_values)
+            ],
+        }
+        for row, row_values in zip(rows, matrix)
+    ]
+    return view
+
+
+def encode_msgpack(payload: Dict[str, Any]) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(payload, use_bin_type=True, default=str)
@@ -12,6 +12,10 @@ def _snapshot_to_dict(snapshot: Snapshot | Dict[str, Any]) -> Dict[str, Any]:
     return snapshot
 
 
-def build_view(records: List[Dict[str, Any]], snapshot: Snapshot) -> Dict[str, Any]:
-    pivot = build_pivot_view(records, _snapshot_to_dict(snapshot))
+def build_view(
+    records: List[Dict[str, Any]],
+    snapshot: Snapshot,
+    include_row_tree: bool = False,
+) -> Dict[str, Any]:
+    pivot = build_pivot_view(records, _snapshot_to_dict(snapshot), include_row_tree=include_row_tree)
     return pivot
@@ -1,6 +1,9 @@
+import io
 import json
 import os
 import unittest
+import zipfile
+from xml.etree import ElementTree
 
 import asyncio
 from unittest.mock import AsyncMock, patch
@@ -15,6 +18,7 @@ from app.services import record_cache
 from app.services.records_pipeline import build_records_pipeline
 from app.services.source_registry import SourceConfig
 from app.services.view_service import build_view
+from app.services.view_codec import decode_compact_view
 from app.storage.job_store import get_job_store
 
 
@@ -188,10 +192,10 @@ class ApiIntegrationTests(unittest.TestCase):
         async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
             return await client.post(path, json=payload)
 
-    async def _get(self, path: str) -> httpx.Response:
+    async def _get(self, path: str, headers: dict | None = None) -> httpx.Response:
         transport = httpx.ASGITransport(app=app)
         async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
-            return await client.get(path)
+            return await client.get(path, headers=headers)
 
     def test_report_view_shape(self) -> None:
         router = self._mock_upstream()
@@ -743,6 +747,170 @@ class ApiIntegrationTests(unittest.TestCase):
         finally:
             router.__exit__(None, None, None)
 
+    def test_report_view_window_and_rows_endpoint(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            full = asyncio.run(self._post("/api/report/view", payload)).json()["view"]
+
+            windowed_payload = dict(payload)
+            windowed_payload["window"] = {"offset": 0, "limit": 1}
+            response = asyncio.run(self._post("/api/report/view", windowed_payload))
+            self.assertEqual(response.status_code, 200)
+            view = response.json()["view"]
+            self.assertEqual(view["columns"], full["columns"])
+            self.assertEqual(view["totals"], full["totals"])
+            self.assertEqual(view["rows"], full["rows"][:1])
+            window = view["meta"]["window"]
+            self.assertEqual(window["totalRows"], len(full["rows"]))
+
+            rows_response = asyncio.run(self._get(f"/api/report/view/{window['handle']}/rows?offset=1&limit=5"))
+            self.assertEqual(rows_response.status_code, 200)
+            self.assertEqual(rows_response.json()["rows"], full["rows"][1:])
+
+            missing = asyncio.run(self._get("/api/report/view/unknown/rows"))
+            self.assertEqual(missing.status_code, 404)
+        finally:
+            router.__exit__(None, None, None)
+
+    def test_report_view_flat_response_is_not_copied(self) -> None:
+        from app.models.view import PivotView, ViewResponse
+        from app.services import report_view_builder
+
+        view = PivotView(columns=[], rows=[], totals={"value__sum": 1.0})
+        built = ViewResponse(view=view)
+        payload = ViewRequest(**self._base_payload())
+        with patch.object(report_view_builder, "_build_report_view_full", new=AsyncMock(return_value=built)), patch.object(
+            PivotView, "dict", side_effect=AssertionError("flat view must not be copied")
+        ):
+            response = asyncio.run(report_view_builder.build_report_view_response(payload))
+        self.assertIs(response.view, built.view)
+
+    def test_report_view_tree_mode_and_children_endpoint(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            payload["snapshot"]["pivot"]["rows"] = ["cls", "year"]
+            payload["snapshot"]["pivot"]["columns"] = []
+            full = asyncio.run(self._post("/api/report/view", payload)).json()["view"]
+
+            tree_payload = dict(payload)
+            tree_payload["rowMode"] = "tree"
+            response = asyncio.run(self._post("/api/report/view", tree_payload))
+            self.assertEqual(response.status_code, 200)
+            view = response.json()["view"]
+            self.assertEqual(view["totals"], full["totals"])
+            self.assertNotIn("rowTree", view)
+            self.assertEqual([row["label"] for row in view["rows"]], ["A", "B"])
+            self.assertEqual([row["childCount"] for row in view["rows"]], [1, 1])
+            self.assertEqual(view["rows"][1]["totals"], {"value__sum": 20.0})
+            tree = view["meta"]["tree"]
+            self.assertEqual(tree["totalRows"], 2)
+
+            children = asyncio.run(
+                self._get(f"/api/report/view/{tree['handle']}/children?key={view['rows'][0]['key']}")
+            )
+            self.assertEqual(children.status_code, 200)
+            leaf = children.json()["rows"][0]
+            self.assertEqual(leaf["cells"], full["rows"][0]["cells"])
+            self.assertEqual(leaf["depth"], 1)
+
+            missing = asyncio.run(self._get(f"/api/report/view/{tree['handle']}/children?key=unknown"))
+            self.assertEqual(missing.status_code, 404)
+        finally:
+            router.__exit__(None, None, None)
+
+    def test_report_view_returns_all_rows_when_view_is_not_cached(self) -> None:
+        router = self._mock_upstream()
+        previous = os.environ.get("REPORT_VIEW_CACHE_MAX_ENTRY_BYTES")
+        os.environ["REPORT_VIEW_CACHE_MAX_ENTRY_BYTES"] = "1"
+        try:
+            payload = self._base_payload()
+            payload["snapshot"]["pivot"]["rows"] = ["cls", "year"]
+            payload["snapshot"]["pivot"]["columns"] = []
+            full = asyncio.run(self._post("/api/report/view", payload)).json()["view"]
+
+            windowed_payload = dict(payload)
+            windowed_payload["window"] = {"offset": 1, "limit": 1}
+            view = asyncio.run(self._post("/api/report/view", windowed_payload)).json()["view"]
+            # следующие окна недоступны без handle — ответ содержит все строки
+            self.assertEqual(view["rows"], full["rows"])
+            self.assertEqual(
+                view["meta"]["window"],
+                {"handle": None, "offset": 0, "limit": len(full["rows"]), "totalRows": len(full["rows"])},
+            )
+
+            tree_payload = dict(payload)
+            tree_payload["rowMode"] = "tree"
+            tree_payload["window"] = {"offset": 0, "limit": 1}
+            view = asyncio.run(self._post("/api/report/view", tree_payload)).json()["view"]
+            self.assertEqual([(row["label"], row["depth"]) for row in view["rows"]], [("A", 0), ("A / 2024", 1), ("B", 0), ("B / 2024", 1)])
+            self.assertEqual(view["rows"][1]["cells"], full["rows"][0]["cells"])
+            self.assertEqual(view["meta"]["tree"]["handle"], None)
+            self.assertTrue(view["meta"]["tree"]["expanded"])
+        finally:
+            if previous is None:
+                os.environ.pop("REPORT_VIEW_CACHE_MAX_ENTRY_BYTES", None)
+            else:
+                os.environ["REPORT_VIEW_CACHE_MAX_ENTRY_BYTES"] = previous
+            router.__exit__(None, None, None)
+
+    def test_report_view_compact_format(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            full = asyncio.run(self._post("/api/report/view", payload)).json()["view"]
+
+            response = asyncio.run(self._post("/api/report/view?format=compact&layout=dense", payload))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers["content-type"].startswith("application/vnd.report.pivot+json"))
+            compact = response.json()["view"]
+            self.assertEqual(compact["cells"]["layout"], "dense")
+            self.assertEqual(decode_compact_view(compact), full)
+
+            invalid = asyncio.run(self._post("/api/report/view?format=xml", payload))
+            self.assertEqual(invalid.status_code, 422)
+        finally:
+            router.__exit__(None, None, None)
+
+    def test_report_view_rows_and_children_follow_requested_format(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            payload["snapshot"]["pivot"]["rows"] = ["cls", "year"]
+            payload["snapshot"]["pivot"]["columns"] = []
+            full = asyncio.run(self._post("/api/report/view", payload)).json()["view"]
+
+            windowed_payload = dict(payload)
+            windowed_payload["window"] = {"offset": 0, "limit": 1}
+            window = asyncio.run(self._post("/api/report/view?format=compact", windowed_payload)).json()["view"]
+            rows_response = asyncio.run(
+                self._get(f"/api/report/view/{window['meta']['window']['handle']}/rows?offset=1&format=compact&layout=dense")
+            )
+            self.assertTrue(rows_response.headers["content-type"].startswith("application/vnd.report.pivot+json"))
+            page = rows_response.json()
+            self.assertEqual((page["format"], page["offset"], page["totalRows"]), ("compact", 1, len(full["rows"])))
+            self.assertEqual(decode_compact_view(page)["rows"], full["rows"][1:])
+
+            tree_payload = dict(payload)
+            tree_payload["rowMode"] = "tree"
+            tree = asyncio.run(self._post("/api/report/view", tree_payload)).json()["view"]
+            children = asyncio.run(
+                self._get(
+                    f"/api/report/view/{tree['meta']['tree']['handle']}/children?key={tree['rows'][0]['key']}",
+                    headers={"Accept": "application/vnd.report.pivot+json"},
+                )
+            )
+            self.assertTrue(children.headers["content-type"].startswith("application/vnd.report.pivot+json"))
+            leaf = decode_compact_view(children.json())["rows"][0]
+            self.assertEqual(leaf["cells"], full["rows"][0]["cells"])
+            self.assertEqual(leaf["depth"], 1)
+
+            invalid = asyncio.run(self._get(f"/api/report/view/{window['meta']['window']['handle']}/rows?format=xml"))
+            self.assertEqual(invalid.status_code, 422)
+        finally:
+            router.__exit__(None, None, None)
+
     def test_report_filters_shape(self) -> None:
         router = self._mock_upstream()
         try:
@@ -847,6 +1015,147 @@ class ApiIntegrationTests(unittest.TestCase):
         finally:
             router.__exit__(None, None, None)
 
+    def test_report_filters_and_details_use_record_index_on_cache_hit(self) -> None:
+        router = self._mock_upstream()
+        os.environ["REPORT_DEBUG_FILTERS"] = "1"
+        try:
+            payload = self._base_payload()
+            payload["filters"] = {"globalFilters": {"cls": {"values": ["B"]}}, "containerFilters": {}}
+            baseline = asyncio.run(self._post("/api/report/filters", payload)).json()
+            details_payload = {**payload, "detailFields": ["cls", "value"], "cell": {"rowFields": ["cls"], "rowValues": ["B"]}}
+            baseline_details = asyncio.run(self._post("/api/report/details", details_payload)).json()
+
+            os.environ["REPORT_RECORD_INDEX"] = "1"
+            indexed = asyncio.run(self._post("/api/report/filters", payload)).json()
+            indexed_details = asyncio.run(self._post("/api/report/details", details_payload)).json()
+
+            self.assertEqual(indexed["options"], baseline["options"])
+            self.assertEqual(indexed["options"]["cls"], [{"value": "A", "count": 1}, {"value": "B", "count": 1}])
+            self.assertEqual(indexed["debug"]["recordsAfterFilter"], 1)
+            self.assertEqual(indexed["debug"]["recordIndex"]["fields"], ["cls"])
+            self.assertEqual(indexed_details["entries"], baseline_details["entries"])
+            self.assertEqual(indexed_details["entries"], [{"cls": "B", "value": 20}])
+            self.assertIn("recordIndex", indexed_details["debug"])
+        finally:
+            os.environ.pop("REPORT_RECORD_INDEX", None)
+            os.environ.pop("REPORT_DEBUG_FILTERS", None)
+            router.__exit__(None, None, None)
+
+    def test_report_filters_stream_when_records_limit_exceeded(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            baseline = asyncio.run(self._post("/api/report/filters", payload)).json()
+
+            record_cache._STORE.clear()
+            os.environ["REPORT_MAX_RECORDS"] = "1"
+            streamed = asyncio.run(self._post("/api/report/filters", payload))
+            self.assertEqual(streamed.status_code, 200, streamed.text)
+            self.assertTrue(streamed.json()["streaming"])
+            self.assertEqual(streamed.json()["options"], baseline["options"])
+
+            os.environ["REPORT_STREAMING_ON_LIMIT"] = "0"
+            rejected = asyncio.run(self._post("/api/report/filters", payload))
+            self.assertEqual(rejected.status_code, 422)
+        finally:
+            os.environ.pop("REPORT_STREAMING_ON_LIMIT", None)
+            router.__exit__(None, None, None)
+
+    def test_report_details_streaming_modes(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            payload.update({"detailFields": ["cls", "value"], "limit": 1})
+            baseline = asyncio.run(self._post("/api/report/details", payload)).json()
+            self.assertEqual((baseline["total"], baseline["totalMode"], baseline["hasMore"]), (2, "exact", True))
+
+            record_cache._STORE.clear()
+            os.environ["REPORT_DETAILS_STREAMING"] = "1"
+            exact = asyncio.run(self._post("/api/report/details", payload)).json()
+            self.assertTrue(exact["streaming"])
+            self.assertEqual(exact["entries"], baseline["entries"])
+            self.assertEqual((exact["total"], exact["totalMode"]), (2, "exact"))
+
+            estimated = asyncio.run(self._post("/api/report/details", {**payload, "totalMode": "estimate"})).json()
+            self.assertEqual(estimated["entries"], baseline["entries"])
+            self.assertEqual((estimated["total"], estimated["totalMode"], estimated["hasMore"]), (2, "estimated", True))
+
+            invalid = asyncio.run(self._post("/api/report/details", {**payload, "totalMode": "approx"}))
+            self.assertEqual(invalid.status_code, 422)
+        finally:
+            os.environ.pop("REPORT_DETAILS_STREAMING", None)
+            router.__exit__(None, None, None)
+
+    def test_report_details_sorted_keyset_pages(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            payload.update({"detailFields": ["cls", "value"], "limit": 1, "sort": [{"field": "value", "direction": "desc"}]})
+            first = asyncio.run(self._post("/api/report/details", payload)).json()
+            self.assertEqual([entry["value"] for entry in first["entries"]], [20])
+            self.assertEqual(first["sort"], [{"field": "value", "direction": "desc", "type": "number"}])
+            self.assertTrue(first["hasMore"])
+
+            second = asyncio.run(self._post("/api/report/details", {**payload, "cursor": first["nextCursor"]})).json()
+            self.assertEqual([entry["value"] for entry in second["entries"]], [10])
+            self.assertIsNone(second["nextCursor"])
+
+            invalid = asyncio.run(self._post("/api/report/details", {**payload, "sort": {"field": "value", "direction": "up"}}))
+            self.assertEqual(invalid.status_code, 422)
+        finally:
+            router.__exit__(None, None, None)
+
+    def test_report_exports_stream_csv_and_xlsx(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            view_csv = asyncio.run(self._post("/api/report/view/export?format=csv", payload))
+            self.assertEqual(view_csv.status_code, 200)
+            self.assertEqual(view_csv.headers["content-type"], "text/csv; charset=utf-8")
+            lines = view_csv.content.decode("utf-8-sig").splitlines()
+            self.assertEqual(lines, ["cls,2024 - value__sum", "A,10.0", "B,20.0", "Итого,30.0"])
+
+            details_payload = {**payload, "cell": {"rowFields": ["cls"], "rowValues": ["B"]}, "detailFields": ["cls", "value"]}
+            details_xlsx = asyncio.run(self._post("/api/report/details/export?format=xlsx", details_payload))
+            self.assertEqual(details_xlsx.status_code, 200)
+            self.assertIn('filename="details.xlsx"', details_xlsx.headers["content-disposition"])
+            archive = zipfile.ZipFile(io.BytesIO(details_xlsx.content))
+            sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+            namespace = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+            rows = [
+                ["".join(cell.itertext()) for cell in row.iter(f"{namespace}c")]
+                for row in sheet.iter(f"{namespace}row")
+            ]
+            self.assertEqual(rows, [["cls", "value"], ["B", "20"]])
+
+            invalid = asyncio.run(self._post("/api/report/view/export?format=pdf", payload))
+            self.assertEqual(invalid.status_code, 422)
+        finally:
+            router.__exit__(None, None, None)
+
+    def test_report_filter_options_typeahead_pages(self) -> None:
+        router = self._mock_upstream()
+        try:
+            payload = self._base_payload()
+            first = asyncio.run(self._post("/api/report/filters/options?key=cls&limit=1", payload))
+            self.assertEqual(first.status_code, 200)
+            first_json = first.json()
+            self.assertEqual(first_json["options"], [{"value": "A", "count": 1}])
+            self.assertEqual(first_json["distinctValues"], 2)
+
+            cursor = first_json["nextCursor"]
+            second = asyncio.run(self._post(f"/api/report/filters/options?key=cls&limit=1&cursor={cursor}", payload))
+            self.assertEqual(second.json()["options"], [{"value": "B", "count": 1}])
+            self.assertIsNone(second.json()["nextCursor"])
+
+            searched = asyncio.run(self._post("/api/report/filters/options?key=cls&q=b", payload))
+            self.assertEqual(searched.json()["options"], [{"value": "B", "count": 1}])
+
+            invalid = asyncio.run(self._post("/api/report/filters/options?key=cls&match=regex", payload))
+            self.assertEqual(invalid.status_code, 422)
+        finally:
+            router.__exit__(None, None, None)
+
     def test_report_details_metric_filter(self) -> None:
         router = self._mock_upstream()
         try:
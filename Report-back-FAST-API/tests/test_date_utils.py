@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime, timezone
+
+from app.services.date_utils import parse_date_input, resolve_date_part_value
+
+
+class DateUtilsTests(unittest.TestCase):
+    def test_fast_paths_match_iso_parsing(self) -> None:
+        expected = datetime(2024, 1, 5, tzinfo=timezone.utc)
+        self.assertEqual(parse_date_input("2024-01-05"), expected)
+        self.assertEqual(parse_date_input("05.01.2024"), expected)
+        self.assertEqual(parse_date_input(" 2024-01-05 "), expected)
+        self.assertEqual(parse_date_input("2024-01-05T10:00:00Z"), datetime(2024, 1, 5, 10, tzinfo=timezone.utc))
+        self.assertEqual(parse_date_input("1.2.2024"), None)
+
+    def test_iso_z_fast_path_matches_offset_form(self) -> None:
+        for value in ("2024-01-05T10:00:00Z", "2024-01-05T10:00:00.250Z", "2024-01-05T10:00Z"):
+            parsed = parse_date_input(value)
+            self.assertEqual(parsed, datetime.fromisoformat(value[:-1] + "+00:00"), value)
+            self.assertEqual(parsed.tzinfo, timezone.utc, value)
+        for value in ("2024-13-05T10:00:00Z", "2024-01-05TxxZ"):
+            self.assertIsNone(parse_date_input(value), value)
+
+    def test_invalid_fixed_width_dates(self) -> None:
+        for value in ("2023-02-29", "31.02.2024", "2024-13-01", "+024-01-05", "2024-01-0５", ""):
+            self.assertIsNone(parse_date_input(value), value)
+
+    def test_date_parts_are_cached_per_raw_value(self) -> None:
+        self.assertEqual(resolve_date_part_value("05.03.2024", "month"), "03 — Март")
+        self.assertEqual(resolve_date_part_value("05.03.2024", "year"), "2024")
+        self.assertEqual(resolve_date_part_value(datetime(2024, 3, 5, tzinfo=timezone.utc), "day"), "05")
+        self.assertIsNone(resolve_date_part_value("not a date", "year"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+from app.services.filter_service import (
+    FilterOptionsCounter,
+    RecordFilter,
+    apply_filters,
+    collect_filter_options,
+    compile_record_filter,
+)
+
+
+SNAPSHOT = {
+    "pivot": {"rows": [], "columns": [], "filters": ["city", "amount", "createdAt"]},
+    "fieldMeta": {"createdAt": {"type": "date"}},
+}
+
+
+def _filters(cities: list, start: str = "2024-01-01") -> dict:
+    return {
+        "globalFilters": {
+            "amount": {"range": {"start": 10, "end": 100}},
+            "createdAt": {"range": {"start": start, "end": "2024-12-31"}},
+            "city": {"values": {"mode": "include", "items": cities}},
+        },
+        "containerFilters": {},
+    }
+
+
+class FilterPlanTests(unittest.TestCase):
+    def test_plan_is_cached_by_filter_hash(self) -> None:
+        plan = compile_record_filter(SNAPSHOT, _filters(["Almaty"]))
+
+        self.assertIs(compile_record_filter(dict(SNAPSHOT), _filters(["Almaty"])), plan)
+        self.assertIsNot(compile_record_filter(SNAPSHOT, _filters(["Astana"])), plan)
+        self.assertIsNot(compile_record_filter(SNAPSHOT, _filters(["Almaty"], start="2024-06-01")), plan)
+
+    def test_selective_include_is_checked_first(self) -> None:
+        plan = RecordFilter(SNAPSHOT, _filters(["Almaty"]))
+
+        reason = plan.check({"city": "Astana", "amount": 1, "createdAt": "2020-01-01"})
+        self.assertEqual(reason, {"key": "city", "type": "values", "value": "Astana"})
+        self.assertEqual([entry[0] for entry in plan._checks], ["city", "amount", "createdAt"])
+
+    def test_preparsed_bounds_match_record_formats(self) -> None:
+        records = [
+            {"city": "Almaty", "amount": "50", "createdAt": "15.03.2024"},
+            {"city": "Almaty", "amount": 50, "createdAt": 1717200000},
+            {"city": "Almaty", "amount": 50, "createdAt": "2023-12-31"},
+            {"city": "Almaty", "amount": 500, "createdAt": "2024-05-05"},
+            {"city": "Almaty", "amount": None, "createdAt": "2024-05-05"},
+        ]
+        filtered, debug = apply_filters(records, SNAPSHOT, _filters(["Almaty"]))
+
+        self.assertEqual(filtered, records[:2])
+        self.assertEqual(debug["appliedKeys"], {"values": ["city"], "ranges": ["amount", "createdAt"]})
+
+    def test_cascading_options_exclude_only_own_key(self) -> None:
+        records = [
+            {"city": "Almaty", "kind": "a"},
+            {"city": "Almaty", "kind": "b"},
+            {"city": "Astana", "kind": "a"},
+            {"city": "Shymkent", "kind": "c"},
+        ]
+        snapshot = {"pivot": {"rows": [], "columns": [], "filters": ["city", "kind"]}}
+        filters = {
+            "globalFilters": {
+                "city": {"values": {"mode": "include", "items": ["Almaty", "Aktau"]}},
+                "kind": {"values": {"mode": "exclude", "items": ["c"]}},
+            },
+            "containerFilters": {},
+        }
+        options, _, truncated, pruned, _ = collect_filter_options(records, snapshot, filters, max_unique=1)
+
+        self.assertEqual(options["city"], [{"value": "Almaty", "count": 2}])
+        self.assertEqual(truncated, {"city": True, "kind": True})
+        self.assertEqual(options["kind"], [{"value": "a", "count": 1}])
+        self.assertEqual(pruned, {"city": ["Aktau"], "kind": ["c"]})
+
+    def test_chunked_counter_switches_exploding_key_to_sketch(self) -> None:
+        records = [{"kind": "hot" if idx % 3 else "warm", "id": f"id-{idx}"} for idx in range(3000)]
+        snapshot = {"pivot": {"rows": [], "columns": [], "filters": ["kind", "id"]}}
+        counter = FilterOptionsCounter(snapshot, None, max_values=100, sketch_capacity=20)
+        for start in range(0, len(records), 250):
+            counter.update(iter(records[start : start + 250]))
+        options, _, truncated, _, debug = counter.result(max_unique=10)
+
+        self.assertEqual(counter.approximate_keys, ["id"])
+        self.assertEqual(debug["approximateKeys"], ["id"])
+        self.assertEqual(options["kind"], collect_filter_options(records, snapshot, None)[0]["kind"])
+        self.assertEqual(truncated, {"kind": False, "id": True})
+        self.assertLessEqual(len(options["id"]), 10)
+        self.assertLessEqual(len(counter._sketch_entries["id"]), 2 * 20 + 250)
+
+
+    def test_sketch_keeps_most_frequent_values_and_splits_selected(self) -> None:
+        # частые значения z-* идут в конце порядка значений, редкие a-* — в начале
+        records = [{"id": f"z-{idx % 3}"} for idx in range(600)]
+        records += [{"id": f"a-{idx}"} for idx in range(300)]
+        snapshot = {"pivot": {"rows": [], "columns": [], "filters": ["id"]}}
+        filters = {
+            "globalFilters": {"id": {"values": {"mode": "include", "items": ["a-7", "missing", "z-1"]}}},
+            "containerFilters": {},
+        }
+        counter = FilterOptionsCounter(snapshot, filters, max_values=50, sketch_capacity=12)
+        for start in range(0, len(records), 100):
+            counter.update(iter(records[start : start + 100]))
+        options, _, truncated, pruned, debug = counter.result(max_unique=3)
+
+        self.assertEqual(counter.approximate_keys, ["id"])
+        self.assertEqual([option["value"] for option in options["id"]], ["z-0", "z-1", "z-2"])
+        self.assertTrue(truncated["id"])
+        self.assertEqual(pruned, {"id": ["missing"]})
+        self.assertEqual(debug["selectedUnlisted"], {"id": ["a-7"]})
+        self.assertEqual(counter.counts()["id"]["a-7"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
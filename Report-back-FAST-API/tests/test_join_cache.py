@@ -0,0 +1,151 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app.models.remote_source import RemoteSource
+from app.services import join_cache
+from app.services.join_service import (
+    apply_joins,
+    apply_prepared_join_lookups,
+    prepare_joins_streaming,
+)
+from app.services.source_registry import SourceConfig
+
+
+def _join(**overrides):
+    join = {
+        "id": "join-1",
+        "targetSourceId": "objects",
+        "primaryKey": "obj",
+        "foreignKey": "id",
+        "joinType": "left",
+        "resultPrefix": "o",
+        "fields": ["name"],
+        "filters": [{"field": "active", "op": "eq", "value": True}],
+    }
+    join.update(overrides)
+    return join
+
+
+class JoinCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self._env = {key: os.environ.get(key) for key in ("REPORT_JOIN_CACHE_TTL", "REPORT_JOIN_CACHE_MAX_BYTES")}
+        os.environ["REPORT_JOIN_CACHE_TTL"] = "60"
+        os.environ.pop("REPORT_JOIN_CACHE_MAX_BYTES", None)
+        join_cache.clear_join_cache()
+        self.config = SourceConfig(
+            source_id="objects",
+            url="https://example.com/objects",
+            method="POST",
+            body={},
+            raw_body=None,
+            headers={},
+        )
+        self.join_rows = [
+            {"id": 1, "name": "A", "active": True},
+            {"id": 2, "name": "B", "active": False},
+            {"id": 3, "name": "C", "active": True},
+        ]
+        self.base_rows = [{"obj": 1}, {"obj": 2}, {"obj": 3}]
+
+    def tearDown(self) -> None:
+        for key, value in self._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        join_cache.clear_join_cache()
+
+    def _run(self, scenario, load_mock: AsyncMock, iter_mock=None):
+        iter_mock = iter_mock or AsyncMock(side_effect=AssertionError("streaming load is not expected"))
+        with patch(
+            "app.services.join_service.get_source_config",
+            new=AsyncMock(return_value=self.config),
+        ), patch("app.services.join_service.async_load_records", new=load_mock), patch(
+            "app.services.join_service.async_iter_records", new=iter_mock
+        ):
+            return asyncio.run(scenario())
+
+    def test_rows_and_lookups_are_shared_across_requests_and_paths(self) -> None:
+        load_mock = AsyncMock(side_effect=lambda source: [dict(row) for row in self.join_rows])
+        remote_source = RemoteSource(url="https://example.com/base", method="POST", body={})
+        join = _join()
+
+        async def materialized():
+            return await apply_joins(list(self.base_rows), remote_source, joins_override=[join])
+
+        first_rows, _ = self._run(materialized, load_mock)
+        # другой запрос с тем же источником и фильтрами join: другой id и порядок не мешают
+        second_rows, second_debug = self._run(materialized, load_mock)
+        self.assertEqual(load_mock.await_count, 1)
+        self.assertEqual(first_rows, second_rows)
+        self.assertEqual(second_rows[0], {"obj": 1, "o.name": "A"})
+        self.assertEqual(second_rows[1], {"obj": 2})
+        self.assertEqual(second_debug["joinsApplied"][0]["matchedRows"], 2)
+
+        async def streaming():
+            return await prepare_joins_streaming(remote_source, 100, joins_override=[_join(id="join-2")])
+
+        # потоковый режим строит lookup из строк, закэшированных материализованным режимом
+        prepared = self._run(streaming, load_mock)
+        streamed_rows, _ = apply_prepared_join_lookups(list(self.base_rows), prepared)
+        self.assertEqual(streamed_rows, first_rows)
+        self.assertEqual(prepared[0].join["id"], "join-2")
+        self.assertEqual(load_mock.await_count, 1)
+        self.assertEqual(join_cache.join_cache_stats()["entries"], 2)
+
+        # другие фильтры join — другой ключ и новая загрузка
+        async def other_filters():
+            return await apply_joins(
+                list(self.base_rows),
+                remote_source,
+                joins_override=[_join(filters=[{"field": "active", "op": "eq", "value": False}])],
+            )
+
+        other_rows, _ = self._run(other_filters, load_mock)
+        self.assertEqual(load_mock.await_count, 2)
+        self.assertEqual(other_rows[1], {"obj": 2, "o.name": "B"})
+
+    def test_cache_respects_ttl_switch_and_byte_budget(self) -> None:
+        load_mock = AsyncMock(side_effect=lambda source: [dict(row) for row in self.join_rows])
+        remote_source = RemoteSource(url="https://example.com/base", method="POST", body={})
+
+        async def materialized():
+            return await apply_joins(list(self.base_rows), remote_source, joins_override=[_join()])
+
+        os.environ["REPORT_JOIN_CACHE_MAX_BYTES"] = "64"
+        self._run(materialized, load_mock)
+        self._run(materialized, load_mock)
+        self.assertEqual(load_mock.await_count, 2)
+        self.assertEqual(join_cache.join_cache_stats(), {"entries": 0, "bytes": 0})
+
+        os.environ["REPORT_JOIN_CACHE_TTL"] = "0"
+        os.environ.pop("REPORT_JOIN_CACHE_MAX_BYTES")
+        self._run(materialized, load_mock)
+        self._run(materialized, load_mock)
+        self.assertEqual(load_mock.await_count, 4)
+        self.assertEqual(join_cache.join_cache_stats()["entries"], 0)
+
+    def test_cached_lookup_rechecks_request_limits(self) -> None:
+        remote_source = RemoteSource(url="https://example.com/base", method="POST", body={})
+
+        async def chunks(*args, **kwargs):
+            yield [dict(row) for row in self.join_rows]
+
+        async def streaming(lookup_max_keys=None):
+            return await prepare_joins_streaming(
+                remote_source,
+                100,
+                joins_override=[_join()],
+                lookup_max_keys=lookup_max_keys,
+            )
+
+        load_mock = AsyncMock(side_effect=AssertionError("materialized load is not expected"))
+        self._run(streaming, load_mock, iter_mock=chunks)
+        with self.assertRaisesRegex(ValueError, "Join lookup max keys exceeded"):
+            self._run(lambda: streaming(lookup_max_keys=1), load_mock)
+
+
+if __name__ == "__main__":
+    unittest.main()
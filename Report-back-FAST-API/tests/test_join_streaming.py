@@ -10,8 +10,10 @@ import respx
 from app.models.remote_source import RemoteSource
 from app.services.join_service import (
     PreparedJoin,
+    apply_joins,
     apply_prepared_join_lookups,
     apply_prepared_joins,
+    load_records_with_joins,
     prepare_joins_streaming,
 )
 from app.services.source_registry import SourceConfig
@@ -19,14 +21,15 @@ from app.services.source_registry import SourceConfig
 
 class JoinStreamingTests(unittest.TestCase):
     def setUp(self) -> None:
-        self._remote_allowlist = os.environ.get("REPORT_REMOTE_ALLOWLIST")
+        self._env = {key: os.environ.get(key) for key in ("REPORT_REMOTE_ALLOWLIST", "REPORT_JOIN_LOAD_CONCURRENCY")}
         os.environ["REPORT_REMOTE_ALLOWLIST"] = "example.com"
 
     def tearDown(self) -> None:
-        if self._remote_allowlist is None:
-            os.environ.pop("REPORT_REMOTE_ALLOWLIST", None)
-        else:
-            os.environ["REPORT_REMOTE_ALLOWLIST"] = self._remote_allowlist
+        for key, value in self._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
 
     def test_prepare_joins_streaming_uses_paging(self) -> None:
         join_rows = [
@@ -97,6 +100,69 @@ class JoinStreamingTests(unittest.TestCase):
         finally:
             router.__exit__(None, None, None)
 
+    def test_join_sources_load_concurrently_with_base_and_apply_in_order(self) -> None:
+        os.environ["REPORT_JOIN_LOAD_CONCURRENCY"] = "2"
+        joins = [
+            {
+                "id": f"join-{name}",
+                "targetSourceId": name,
+                "primaryKey": "obj",
+                "foreignKey": "id",
+                "joinType": "left",
+                "resultPrefix": name,
+                "fields": ["value"],
+            }
+            for name in ("a", "b", "c")
+        ]
+        remote_source = RemoteSource(url="https://example.com/base", method="POST", body={}, joins=joins)
+        in_flight = {"base": 0, "joins": 0, "max_joins": 0, "joins_with_base": 0}
+
+        async def fake_config(source_id: str) -> SourceConfig:
+            await asyncio.sleep(0.01)
+            return SourceConfig(
+                source_id=source_id,
+                url=f"https://example.com/{source_id}",
+                method="POST",
+                body={},
+                raw_body=None,
+                headers={},
+            )
+
+        async def fake_join_load(source: RemoteSource) -> list:
+            in_flight["joins"] += 1
+            in_flight["max_joins"] = max(in_flight["max_joins"], in_flight["joins"])
+            if in_flight["base"]:
+                in_flight["joins_with_base"] += 1
+            # первый объявленный join грузится дольше всех: порядок применения от этого не зависит
+            await asyncio.sleep(0.06 if source.id == "a" else 0.02)
+            in_flight["joins"] -= 1
+            return [{"id": 1, "value": source.id}]
+
+        async def base_load() -> list:
+            in_flight["base"] += 1
+            await asyncio.sleep(0.05)
+            in_flight["base"] -= 1
+            return [{"obj": 1}, {"obj": 2}]
+
+        async def scenario() -> tuple:
+            records, loaded_sources = await load_records_with_joins(base_load(), joins)
+            return await apply_joins(records, remote_source, joins_override=joins, loaded_sources=loaded_sources)
+
+        with patch(
+            "app.services.join_service.get_source_config",
+            new=AsyncMock(side_effect=fake_config),
+        ), patch(
+            "app.services.join_service.async_load_records",
+            new=AsyncMock(side_effect=fake_join_load),
+        ):
+            rows, debug = asyncio.run(scenario())
+
+        self.assertEqual(in_flight["max_joins"], 2)
+        self.assertGreaterEqual(in_flight["joins_with_base"], 1)
+        self.assertEqual([entry["joinId"] for entry in debug["joinsApplied"]], ["join-a", "join-b", "join-c"])
+        self.assertEqual(rows[0], {"obj": 1, "a.value": "a", "b.value": "b", "c.value": "c"})
+        self.assertEqual(rows[1], {"obj": 2})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,9 @@
+import os
 import unittest
 
+from app.models.snapshot import Snapshot
 from app.services.pivot_core import build_pivot_view
+from app.services.pivot_streaming import StreamingPivotAggregator
 
 
 class PivotCountDistinctTests(unittest.TestCase):
@@ -75,6 +78,65 @@ class PivotCountDistinctTests(unittest.TestCase):
         self.assertEqual(result["totals"]["PLAN.plan_evt_2026_01__sum"], 10.0)
         self.assertEqual(result["totals"]["PLAN.plan_obj_2026_01__sum"], 2.0)
 
+    def test_approx_count_distinct_per_metric(self) -> None:
+        records = [{"group": f"g{idx % 2}", "item": f"item-{idx % 5000}"} for idx in range(20000)]
+        snapshot = {
+            "pivot": {"rows": ["group"], "columns": [], "filters": []},
+            "metrics": [
+                {"key": "exact", "sourceKey": "item", "op": "count_distinct"},
+                {
+                    "key": "approx",
+                    "sourceKey": "item",
+                    "op": "count_distinct",
+                    "distinctMode": "approx",
+                    "distinctPrecision": 12,
+                },
+            ],
+        }
+
+        result = build_pivot_view(records, snapshot)
+
+        self.assertEqual(result["totals"]["exact"], 5000)
+        self.assertAlmostEqual(result["totals"]["approx"], 5000, delta=5000 * 0.05)
+        self.assertEqual(result["meta"], {"approximateMetrics": ["approx"]})
+
+        left = StreamingPivotAggregator(snapshot)
+        left.update(records[:7000])
+        right = StreamingPivotAggregator(snapshot)
+        right.update(records[7000:])
+        left.merge(right)
+        restored = StreamingPivotAggregator.deserialize(snapshot, left.serialize())
+        self.assertEqual(restored.finalize(), result)
+
+    def test_hll_mode_is_accepted_by_snapshot_model(self) -> None:
+        snapshot = Snapshot(
+            pivot={"rows": ["group"], "columns": [], "filters": []},
+            metrics=[{"key": "hll", "sourceKey": "item", "op": "count_distinct", "distinctMode": "hll"}],
+        )
+        records = [{"group": "A", "item": value} for value in ("x", "y", "z", "x")]
+        result = build_pivot_view(records, snapshot)
+        self.assertEqual(result["totals"]["hll"], 3)
+        self.assertEqual(result["meta"], {"approximateMetrics": ["hll"]})
+
+    def test_global_approx_mode_small_cardinality(self) -> None:
+        previous = os.environ.get("REPORT_COUNT_DISTINCT_MODE")
+        os.environ["REPORT_COUNT_DISTINCT_MODE"] = "approx"
+        try:
+            records = [{"group": "A", "item": value} for value in ("x", "y", "z", "x")]
+            snapshot = {
+                "pivot": {"rows": ["group"], "columns": [], "filters": []},
+                "metrics": [{"key": "item__count_distinct", "sourceKey": "item", "op": "count_distinct"}],
+            }
+            result = build_pivot_view(records, snapshot)
+        finally:
+            if previous is None:
+                os.environ.pop("REPORT_COUNT_DISTINCT_MODE", None)
+            else:
+                os.environ["REPORT_COUNT_DISTINCT_MODE"] = previous
+
+        self.assertEqual(result["totals"]["item__count_distinct"], 3)
+        self.assertEqual(result["meta"], {"approximateMetrics": ["item__count_distinct"]})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from app.services.pivot_core import build_pivot_view
+from app.services.view_cache import slice_rows
+
+
+RECORDS = [
+    {"region": "north", "city": "b", "amount": 5},
+    {"region": "North", "city": "a", "amount": 5},
+    {"region": "south", "city": "c", "amount": 30},
+    {"region": "south", "city": "d", "amount": None},
+    {"region": "east", "city": "e", "amount": 7},
+    {"region": None, "city": "f", "amount": 1},
+]
+
+
+def _snapshot(sorts: dict) -> dict:
+    return {
+        "pivot": {"rows": ["region", "city"], "columns": [], "filters": []},
+        "metrics": [{"key": "amount__sum", "sourceKey": "amount", "op": "sum"}],
+        "options": {"sorts": {"rows": sorts}},
+    }
+
+
+class PivotSortingTests(unittest.TestCase):
+    def test_rows_sorted_by_metric_desc_then_casefolded_value(self) -> None:
+        result = build_pivot_view(
+            RECORDS,
+            _snapshot({"region": {"metric": "desc", "value": "asc"}, "city": {"value": "desc"}}),
+        )
+        labels = [row["label"] for row in result["rows"]]
+        self.assertEqual(labels[:2], ["south / d", "south / c"])
+        self.assertEqual(labels[2], "east / e")
+        # north и North — разные узлы с равной суммой, порядок появления сохраняется
+        self.assertEqual(labels[3:5], ["north / b", "North / a"])
+
+    def test_empty_metric_goes_last_on_asc(self) -> None:
+        result = build_pivot_view(RECORDS, _snapshot({"city": {"metric": "asc"}}))
+        south = [row["label"] for row in result["rows"] if row["values"][0] == "south"]
+        self.assertEqual(south, ["south / c", "south / d"])
+
+    def test_window_top_k_matches_full_sort(self) -> None:
+        rows = [
+            {"key": f"r{idx}", "cells": [{"key": f"r{idx}||__all__||m", "value": value}]}
+            for idx, value in enumerate([3, None, 9, 1, 9, 4, None, 7])
+        ]
+        view = {"columns": [{"key": "__all__::m"}], "rows": rows}
+        full = slice_rows(view, 0, 100, sort_column="__all__::m", direction="desc")
+        self.assertEqual([row["key"] for row in full["rows"]], ["r1", "r6", "r2", "r4", "r7", "r5", "r0", "r3"])
+        window = slice_rows(view, 2, 3, sort_column="__all__::m", direction="desc")
+        self.assertEqual(window["rows"], full["rows"][2:5])
+        self.assertEqual(window["totalRows"], 8)
+        with self.assertRaises(ValueError):
+            slice_rows(view, 0, 1, sort_column="missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,32 @@
+import os
+import struct
+import tempfile
 import unittest
 
 from app.services.pivot_core import build_pivot_view
 from app.services.pivot_streaming import StreamingPivotAggregator
 
 
+RECORDS = [
+    {"cls": "A", "year": 2024, "value": 10, "count": 1},
+    {"cls": "A", "year": 2024, "value": 20, "count": 2},
+    {"cls": "B", "year": 2024, "value": 5, "count": 3},
+    {"cls": "B", "year": 2023, "value": 15, "count": 4},
+]
+SNAPSHOT = {
+    "pivot": {"rows": ["cls"], "columns": ["year"], "filters": []},
+    "metrics": [
+        {"key": "value__sum", "sourceKey": "value", "op": "sum"},
+        {"key": "count__sum", "sourceKey": "count", "op": "sum"},
+        {
+            "key": "value_avg_formula",
+            "type": "formula",
+            "expression": "value__sum / count__sum",
+        },
+    ],
+}
+
+
 class PivotStreamingTests(unittest.TestCase):
     def test_streaming_matches_single_chunk(self) -> None:
         records = [
@@ -38,6 +61,251 @@ class PivotStreamingTests(unittest.TestCase):
         self.assertEqual(single_result, chunked_result)
         self.assertEqual(single_result, expected)
 
+    def test_merge_of_partial_aggregates_matches_single_pass(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["cls", "kind"], "columns": ["year"], "filters": []},
+            "metrics": [
+                {"key": "value__sum", "sourceKey": "value", "op": "sum"},
+                {"key": "value__avg", "sourceKey": "value", "op": "avg"},
+                {"key": "kind__count_distinct", "sourceKey": "kind", "op": "count_distinct"},
+                {"key": "value__value", "sourceKey": "value", "op": "value"},
+            ],
+        }
+        records = [dict(record, kind=f"k{idx % 3}") for idx, record in enumerate(RECORDS * 3)]
+
+        single = StreamingPivotAggregator(snapshot)
+        single.update(records)
+
+        left = StreamingPivotAggregator(snapshot)
+        left.update(records[:5])
+        right = StreamingPivotAggregator(snapshot)
+        right.update(records[5:])
+        left.merge(right)
+
+        self.assertEqual(left.finalize(), single.finalize())
+
+    def test_serialized_state_roundtrip(self) -> None:
+        aggregator = StreamingPivotAggregator(SNAPSHOT)
+        aggregator.update(RECORDS[:3])
+        payload = aggregator.serialize()
+        self.assertIsInstance(payload, bytes)
+
+        restored = StreamingPivotAggregator.deserialize(SNAPSHOT, payload)
+        restored.update(RECORDS[3:])
+        self.assertEqual(restored.finalize(), build_pivot_view(RECORDS, SNAPSHOT))
+
+    def test_min_max_and_quantiles(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["cls"], "columns": [], "filters": []},
+            "metrics": [
+                {"key": "value__min", "sourceKey": "value", "op": "min"},
+                {"key": "value__max", "sourceKey": "value", "op": "max"},
+                {"key": "value__median", "sourceKey": "value", "op": "median"},
+                {"key": "value__p90", "sourceKey": "value", "agg": "p90"},
+                {"key": "value__p95", "sourceKey": "value", "op": "p95"},
+            ],
+        }
+        records = [{"cls": "A" if value % 2 else "B", "value": value} for value in range(1, 101)]
+        records.append({"cls": "A", "value": "n/a"})
+
+        expected = build_pivot_view(records, snapshot)
+        rows_by_cls = {row["values"][0]: row for row in expected["rows"]}
+        self.assertEqual([cell["value"] for cell in rows_by_cls["A"]["cells"][:3]], [1.0, 99.0, 50.0])
+        self.assertEqual(expected["totals"]["value__min"], 1.0)
+        self.assertEqual(expected["totals"]["value__max"], 100.0)
+        self.assertAlmostEqual(expected["totals"]["value__median"], 50.5, delta=0.5)
+        self.assertAlmostEqual(expected["totals"]["value__p90"], 90.5, delta=1.0)
+        self.assertAlmostEqual(expected["totals"]["value__p95"], 95.5, delta=1.0)
+
+        left = StreamingPivotAggregator(snapshot)
+        left.update(records[:40])
+        right = StreamingPivotAggregator(snapshot)
+        right.update(records[40:])
+        left.merge(right)
+        restored = StreamingPivotAggregator.deserialize(snapshot, left.serialize())
+        merged = restored.finalize()
+        self.assertEqual(merged["rows"], expected["rows"])
+        for key, value in expected["totals"].items():
+            self.assertAlmostEqual(merged["totals"][key], value, delta=1.0)
+
+    def test_spill_to_disk_matches_in_memory(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["obj"], "columns": ["year"], "filters": []},
+            "metrics": [
+                {"key": "value__sum", "sourceKey": "value", "op": "sum"},
+                {"key": "obj__count_distinct", "sourceKey": "obj", "op": "count_distinct"},
+                {"key": "value__value", "sourceKey": "value", "op": "value"},
+            ],
+        }
+        records = [{"obj": f"o{idx % 17}", "year": 2020 + idx % 3, "value": idx} for idx in range(200)]
+        expected = build_pivot_view(records, snapshot)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            # 17 × 3 = 51 различная ячейка: повторы из прошлых run-файлов в лимит групп не входят
+            aggregator = StreamingPivotAggregator(snapshot, max_groups=51, spill_max_cells=5, spill_dir=spill_dir)
+            for offset in range(0, len(records), 20):
+                aggregator.update(records[offset : offset + 20])
+            self.assertGreater(aggregator.spill_stats["runs"], 1)
+            self.assertTrue(os.listdir(spill_dir))
+
+            restored = StreamingPivotAggregator.deserialize(snapshot, aggregator.serialize())
+            self.assertEqual(restored.finalize(), expected)
+            self.assertEqual(aggregator.finalize(), expected)
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_spill_keeps_max_groups_limit(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["obj"], "columns": ["year"], "filters": []},
+            "metrics": [{"key": "value__sum", "sourceKey": "value", "op": "sum"}],
+        }
+        records = [{"obj": f"o{idx % 17}", "year": 2020 + idx % 3, "value": idx} for idx in range(200)]
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            aggregator = StreamingPivotAggregator(snapshot, max_groups=50, spill_max_cells=5, spill_dir=spill_dir)
+            with self.assertRaisesRegex(ValueError, "Streaming groups limit exceeded: 51 > 50"):
+                for offset in range(0, len(records), 20):
+                    aggregator.update(records[offset : offset + 20])
+            aggregator.cleanup()
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_spill_derives_leaf_totals_from_cells_and_checks_budget_per_record(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["obj", "kind"], "columns": ["year"], "filters": []},
+            "metrics": [
+                {"key": "value__avg", "sourceKey": "value", "op": "avg"},
+                {"key": "year__count_distinct", "sourceKey": "year", "op": "count_distinct"},
+            ],
+            "options": {"sorts": {"rows": {"obj": {"metric": "desc"}, "kind": {"metric": "asc"}}}},
+        }
+        records = [{"obj": f"o{idx % 7}", "kind": idx % 3, "year": 2020 + idx % 4, "value": idx} for idx in range(300)]
+        expected = build_pivot_view(records, snapshot, include_row_tree=True)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            aggregator = StreamingPivotAggregator(snapshot, max_groups=84, spill_max_cells=5, spill_dir=spill_dir)
+            # одна порция записей: бюджет проверяется на каждой записи, а не после update()
+            aggregator.update(records)
+            self.assertGreaterEqual(aggregator.spill_stats["runs"], 84 // 5)
+            self.assertLessEqual(len(aggregator._cell_buckets), 5)
+            self.assertEqual({len(prefix) for prefix in aggregator._row_prefix_buckets}, {1})
+
+            restored = StreamingPivotAggregator.deserialize(snapshot, aggregator.serialize())
+            restored_result = restored.finalize()
+            restored_result["rowTree"] = restored.row_tree()
+            self.assertEqual(restored_result, expected)
+
+            result = aggregator.finalize()
+            result["rowTree"] = aggregator.row_tree()
+            self.assertEqual(result, expected)
+
+            aggregator = StreamingPivotAggregator(snapshot, spill_max_cells=5, spill_dir=spill_dir)
+            aggregator.update(records)
+            columns, rows = aggregator.iter_finalized_rows()
+            self.assertEqual(list(rows), expected["rows"])
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_spill_merge_checks_exact_group_count(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["obj"], "columns": ["year"], "filters": []},
+            "metrics": [{"key": "value__sum", "sourceKey": "value", "op": "sum"}],
+        }
+        records = [{"obj": f"o{idx % 17}", "year": 2020 + idx % 3, "value": idx} for idx in range(200)]
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            aggregator = StreamingPivotAggregator(snapshot, max_groups=50, spill_max_cells=5, spill_dir=spill_dir)
+            # без оценки скетчем лимит проверяется точно при слиянии run-файлов
+            aggregator._spill_group_sketch = None
+            aggregator.update(records)
+            with self.assertRaisesRegex(ValueError, "Streaming groups limit exceeded: 51 > 50"):
+                aggregator.finalize()
+            aggregator.cleanup()
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_iter_finalized_rows_matches_finalize(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["obj", "kind"], "columns": ["year"], "filters": []},
+            "metrics": [{"key": "value__sum", "sourceKey": "value", "op": "sum"}],
+            "options": {"sorts": {"rows": {"obj": {"direction": "desc"}}}},
+        }
+        records = [{"obj": f"o{idx % 7}", "kind": idx % 2, "year": 2020 + idx % 3, "value": idx} for idx in range(120)]
+        expected = build_pivot_view(records, snapshot)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            for spill_cells in (None, 4):
+                aggregator = StreamingPivotAggregator(snapshot, spill_max_cells=spill_cells, spill_dir=spill_dir)
+                for offset in range(0, len(records), 25):
+                    aggregator.update(records[offset : offset + 25])
+                columns, rows = aggregator.iter_finalized_rows()
+                self.assertEqual(columns, expected["columns"])
+                self.assertEqual(list(rows), expected["rows"])
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_spilled_export_rows_stream_from_disk_with_totals(self) -> None:
+        snapshot = {
+            "pivot": {"rows": ["obj"], "columns": ["year"], "filters": []},
+            "metrics": [
+                {"key": "value__sum", "sourceKey": "value", "op": "sum"},
+                {"key": "value__avg", "sourceKey": "value", "op": "avg"},
+            ],
+            "options": {"sorts": {"rows": {"obj": {"direction": "desc"}}}},
+        }
+        records = [{"obj": f"o{idx % 11}", "year": 2020 + idx % 2, "value": idx} for idx in range(150)]
+        expected = build_pivot_view(records, snapshot)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            aggregator = StreamingPivotAggregator(snapshot, spill_max_cells=3, spill_dir=spill_dir)
+            for offset in range(0, len(records), 30):
+                aggregator.update(records[offset : offset + 30])
+            columns, rows = aggregator.iter_finalized_rows()
+            first = next(rows)
+            # run-файлы слиты в файл готовых строк, ячейки в памяти не собраны
+            self.assertEqual([name.startswith("pivot-rows-") for name in os.listdir(spill_dir)], [True])
+            self.assertEqual(aggregator._cell_buckets, {})
+            self.assertEqual([first] + list(rows), expected["rows"])
+            self.assertEqual(os.listdir(spill_dir), [])
+
+        totals = aggregator.totals_row()
+        self.assertEqual(totals["label"], "Итого")
+        by_year = {2020: [idx for idx in range(150) if idx % 2 == 0], 2021: [idx for idx in range(150) if idx % 2]}
+        self.assertEqual(
+            [cell["value"] for cell in totals["cells"]],
+            [sum(by_year[2020]), sum(by_year[2020]) / 75, sum(by_year[2021]), sum(by_year[2021]) / 75],
+        )
+
+        flat = StreamingPivotAggregator({**snapshot, "pivot": {"rows": ["obj"], "columns": [], "filters": []}})
+        flat.update(records)
+        flat.finalize()
+        self.assertEqual([cell["value"] for cell in flat.totals_row()["cells"]], [sum(range(150)), sum(range(150)) / 150])
+
+    def test_deserialize_rejects_unknown_version_and_other_config(self) -> None:
+        aggregator = StreamingPivotAggregator(SNAPSHOT)
+        aggregator.update(RECORDS)
+        payload = aggregator.serialize()
+
+        future_payload = payload[:4] + struct.pack(">H", 999) + payload[6:]
+        with self.assertRaises(ValueError):
+            StreamingPivotAggregator.deserialize(SNAPSHOT, future_payload)
+
+        other_snapshot = dict(SNAPSHOT, pivot={"rows": ["year"], "columns": [], "filters": []})
+        with self.assertRaises(ValueError):
+            StreamingPivotAggregator.deserialize(other_snapshot, payload)
+
+    def test_v2_state_escapes_real_other_value(self) -> None:
+        records = [dict(RECORDS[0], cls="__OTHER__"), *RECORDS[1:]]
+        aggregator = StreamingPivotAggregator(SNAPSHOT)
+        aggregator.update(records)
+        state = aggregator.to_state()
+        # v2 хранил реальное значение "__OTHER__" в ключах без экранирования
+        state["version"] = 2
+        for entry in state["rows"] + state["nodes"] + state["rowPrefixes"]:
+            entry[0] = [part.lstrip("\\") for part in entry[0]]
+
+        restored = StreamingPivotAggregator(SNAPSHOT)
+        restored.load_state(state)
+        restored.update(records[:1])
+        expected = StreamingPivotAggregator(SNAPSHOT)
+        expected.update(records + records[:1])
+        self.assertEqual(restored.finalize(), expected.finalize())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+
+from app.services.export_service import pivot_export_row
+from app.services.pivot_core import build_pivot_view
+from app.services.pivot_streaming import StreamingPivotAggregator
+
+
+def _snapshot(top_n: dict, rows=None, columns=None) -> dict:
+    return {
+        "pivot": {"rows": rows or ["city"], "columns": columns or [], "filters": []},
+        "metrics": [{"key": "amount__sum", "sourceKey": "amount", "op": "sum"}],
+        "options": {"topN": top_n},
+    }
+
+
+class PivotTopNTests(unittest.TestCase):
+    def test_materialized_top_n_by_count_folds_tail(self) -> None:
+        records = (
+            [{"city": "A", "amount": 1}] * 5
+            + [{"city": "B", "amount": 100}] * 2
+            + [{"city": "C", "amount": 1}] * 4
+            + [{"city": "D", "amount": 3}]
+        )
+        result = build_pivot_view(records, _snapshot({"city": {"limit": 2, "by": "count"}}))
+
+        self.assertEqual([row["label"] for row in result["rows"]], ["A", "C", "Прочее"])
+        other = result["rows"][-1]
+        self.assertEqual(other["values"], ["__OTHER__"])
+        self.assertEqual(other["cells"][0]["value"], 203.0)
+        self.assertEqual(result["totals"]["amount__sum"], 212.0)
+
+    def test_top_n_by_metric_on_columns_keeps_other_last(self) -> None:
+        records = [
+            {"city": "X", "year": "2021", "amount": 1},
+            {"city": "X", "year": "2022", "amount": 50},
+            {"city": "X", "year": "2023", "amount": 20},
+            {"city": "Y", "year": "2020", "amount": 5},
+        ]
+        snapshot = _snapshot({"year": 2}, rows=["city"], columns=["year"])
+        snapshot["options"]["sorts"] = {"columns": {"year": {"direction": "asc"}}}
+        result = build_pivot_view(records, snapshot)
+
+        self.assertEqual(
+            [column["label"] for column in result["columns"]],
+            ["2022 - amount__sum", "2023 - amount__sum", "Прочее - amount__sum"],
+        )
+        rows_by_city = {row["values"][0]: row for row in result["rows"]}
+        self.assertEqual([cell["value"] for cell in rows_by_city["Y"]["cells"]], [None, None, 5.0])
+
+    def test_top_n_by_metric_ranks_by_finalized_primary_metric(self) -> None:
+        records = (
+            [{"city": "A", "kind": "x", "amount": 10}] * 10
+            + [{"city": "B", "kind": "x", "amount": 50}]
+            + [{"city": "C", "kind": "y", "amount": 1}] * 30
+        )
+        snapshot = _snapshot({"city": {"limit": 1, "by": "metric"}})
+        snapshot["metrics"] = [{"key": "amount__avg", "sourceKey": "amount", "op": "avg"}]
+        result = build_pivot_view(records, snapshot)
+        self.assertEqual([row["label"] for row in result["rows"]], ["B", "Прочее"])
+
+        # поле не первого уровня: итоги значения собираются со всех родительских префиксов
+        snapshot = _snapshot({"kind": {"limit": 1}}, rows=["city", "kind"])
+        snapshot["metrics"] = [{"key": "city__count_distinct", "sourceKey": "city", "op": "count_distinct"}]
+        result = build_pivot_view(records, snapshot)
+        self.assertEqual([row["label"] for row in result["rows"]], ["A / x", "B / x", "C / Прочее"])
+
+    def test_real_other_value_is_not_merged_into_other_bucket(self) -> None:
+        records = (
+            [{"city": "A", "amount": 1}] * 3
+            + [{"city": "__OTHER__", "amount": 10}] * 2
+            + [{"city": "B", "amount": 100}]
+        )
+        snapshot = _snapshot({"city": {"limit": 2, "by": "count"}})
+        aggregator = StreamingPivotAggregator(snapshot)
+        aggregator.update(records)
+        restored = StreamingPivotAggregator.deserialize(snapshot, aggregator.serialize())
+
+        for result in (build_pivot_view(records, snapshot), restored.finalize()):
+            rows = [(row["label"], row["values"][0], row["cells"][0]["value"]) for row in result["rows"]]
+            self.assertEqual(rows, [("A", "A", 3.0), ("__OTHER__", "__OTHER__", 20.0), ("Прочее", "__OTHER__", 100.0)])
+            self.assertEqual(len({row["key"] for row in result["rows"]}), 3)
+            self.assertEqual(pivot_export_row(result["rows"][1], True)[0], "__OTHER__")
+            self.assertEqual(pivot_export_row(result["rows"][2], True)[0], "Прочее")
+
+    def test_streaming_heavy_hitter_survives_group_budget(self) -> None:
+        snapshot = _snapshot({"city": {"limit": 2}}, rows=["city", "kind"])
+        records = [{"city": f"tail-{idx}", "kind": "k", "amount": 1} for idx in range(50)]
+        records += [{"city": "late", "kind": kind, "amount": 10} for kind in ("a", "b")] * 30
+        records += [{"city": "tail-0", "kind": "k", "amount": 1}] * 3
+
+        aggregator = StreamingPivotAggregator(snapshot, max_groups=12, top_n_candidate_factor=2)
+        for offset in range(0, len(records), 7):
+            aggregator.update(records[offset : offset + 7])
+        restored = StreamingPivotAggregator.deserialize(
+            snapshot,
+            aggregator.serialize(),
+            max_groups=12,
+            top_n_candidate_factor=2,
+        )
+        result = restored.finalize()
+
+        labels = [row["label"] for row in result["rows"]]
+        # tail-0 вытеснен поздним heavy hitter и обратно не допускается: все его записи в «Прочее»
+        self.assertEqual(labels, ["tail-1 / k", "late / a", "late / b", "Прочее / k"])
+        self.assertEqual(result["rows"][-1]["cells"][0]["value"], 52.0)
+        self.assertEqual(result["totals"]["amount__sum"], 653.0)
+        self.assertEqual(sum(row["cells"][0]["value"] for row in result["rows"]), 653.0)
+
+    def test_streaming_evicted_value_is_not_readmitted(self) -> None:
+        snapshot = _snapshot({"city": {"limit": 1}})
+        records = [{"city": "H", "amount": 5}]
+        records += [{"city": f"t{idx}", "amount": 6} for idx in range(5)]
+        records += [{"city": "H", "amount": 10}] * 5
+
+        aggregator = StreamingPivotAggregator(snapshot, top_n_candidate_factor=2)
+        aggregator.update(records)
+        result = aggregator.finalize()
+
+        # H вытеснен до прихода тяжёлых записей: его итог целиком в «Прочее», без раздвоения
+        values = {row["label"]: row["cells"][0]["value"] for row in result["rows"]}
+        self.assertEqual(values, {"t0": 6.0, "Прочее": 79.0})
+        self.assertEqual(result["totals"]["amount__sum"], 85.0)
+        self.assertNotIn("meta", result)
+
+    def test_streaming_group_budget_keeps_admitted_values_exact(self) -> None:
+        snapshot = _snapshot({"city": {"limit": 2}, "year": {"limit": 2}}, rows=["city"], columns=["year"])
+        records = [
+            {"city": "A", "year": "2020", "amount": 1},
+            {"city": "B", "year": "2021", "amount": 2},
+            # новая ячейка уже допущенных значений после исчерпания бюджета групп
+            {"city": "A", "year": "2021", "amount": 4},
+            # C тяжелее B и вытесняет его: итоги B переходят в «Прочее» целиком
+            {"city": "C", "year": "2020", "amount": 8},
+        ]
+        aggregator = StreamingPivotAggregator(snapshot, max_groups=2, top_n_candidate_factor=1)
+        aggregator.update(records)
+        result = aggregator.finalize()
+
+        totals = {row["label"]: sum(cell["value"] or 0 for cell in row["cells"]) for row in result["rows"]}
+        self.assertEqual(totals, {"A": 5.0, "C": 8.0, "Прочее": 2.0})
+        self.assertNotIn("meta", result)
+
+        mixed = _snapshot({"city": {"limit": 2, "by": "count"}}, rows=["city", "kind"])
+        aggregator = StreamingPivotAggregator(mixed, max_groups=3, top_n_candidate_factor=1)
+        aggregator.update(
+            [
+                {"city": "A", "kind": "x", "amount": 1},
+                {"city": "C", "kind": "y", "amount": 2},
+                {"city": "B", "kind": "x", "amount": 4},
+                {"city": "C", "kind": "x", "amount": 8},
+            ]
+        )
+        result = aggregator.finalize()
+        # поле kind без top-N: новая группа C / x уходит в «Прочее», итоги C и «Прочее» помечены приближёнными
+        values = {row["label"]: row["cells"][0]["value"] for row in result["rows"]}
+        self.assertEqual(values, {"A / x": 1.0, "C / y": 2.0, "Прочее / x": 12.0})
+        self.assertEqual(result["meta"]["approximateTopN"], {"city": ["C", "__OTHER__"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
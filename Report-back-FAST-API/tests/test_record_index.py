@@ -0,0 +1,122 @@
+import unittest
+
+from app.services.detail_service import build_details
+from app.services.filter_service import apply_filters, collect_filter_option_page, collect_filter_options
+from app.services.record_index import RecordIndex
+
+
+SNAPSHOT = {
+    "pivot": {"rows": [], "columns": [], "filters": ["city", "amount", "day"]},
+    "fieldMeta": {"day": {"type": "date"}},
+}
+
+
+def _records() -> list:
+    return [
+        {"city": "A", "amount": 5, "day": "2024-01-10"},
+        {"city": "B", "amount": "15", "day": "10.02.2024"},
+        {"city": "A", "amount": "2024-01-01", "day": 1706745600},
+        {"city": "C", "amount": None, "day": "2024-03-01"},
+        {"city": "A", "amount": 25.5, "day": "bad"},
+        {"city": "B", "amount": "nan", "day": "2024-02-29"},
+    ]
+
+
+class RecordIndexTests(unittest.TestCase):
+    def test_range_filters_match_scan(self) -> None:
+        records = _records()
+        filters = {
+            "globalFilters": {
+                "amount": {"range": {"start": 10, "end": 30}},
+                "day": {"range": {"start": "2024-02-01", "end": "2024-02-29"}},
+            },
+            "containerFilters": {},
+        }
+        index = RecordIndex(records, 0)
+
+        expected, expected_debug = apply_filters(records, SNAPSHOT, filters)
+        actual, actual_debug = apply_filters(records, SNAPSHOT, filters, index=index)
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual_debug, expected_debug)
+        self.assertEqual([record["city"] for record in actual], ["B", "B"])
+        self.assertEqual(index.stats()["ranges"], ["amount", "day"])
+        self.assertEqual(
+            collect_filter_options(records, SNAPSHOT, filters, index=index),
+            collect_filter_options(records, SNAPSHOT, filters),
+        )
+
+    def test_near_unique_and_over_budget_fields_fall_back_to_scan(self) -> None:
+        records = [{"id": idx, "city": "A" if idx % 2 else "B"} for idx in range(2000)]
+        index = RecordIndex(records, 0)
+        self.assertIsNone(index.postings("id", lambda record: record.get("id"), str))
+        self.assertIsNotNone(index.postings("city", lambda record: record.get("city"), str))
+
+        tiny = RecordIndex(records, 64)
+        self.assertIsNone(tiny.postings("city", lambda record: record.get("city"), str))
+        filters = {"globalFilters": {"city": {"values": ["A"]}}, "containerFilters": {}}
+        self.assertEqual(
+            apply_filters(records, {"pivot": {"filters": ["city"]}}, filters, index=tiny)[0],
+            apply_filters(records, {"pivot": {"filters": ["city"]}}, filters)[0],
+        )
+
+    def test_cell_details_use_cell_index_and_match_scan(self) -> None:
+        records = [
+            {"id": idx, "city": ["A", "B", None, ""][idx % 4], "year": 2020 + idx % 3, "amount": idx % 50}
+            for idx in range(3000)
+        ]
+        snapshot = {"pivot": {"rows": ["city", "year"], "columns": ["amount"], "filters": ["amount"]}}
+        filters = {"globalFilters": {"amount": {"range": {"start": 5, "end": 40}}}, "containerFilters": {}}
+        index = RecordIndex(records, 0)
+        cells = [
+            {"rowFields": ["city", "year"], "rowValues": ["A", 2021], "columnFields": ["amount"], "columnValues": [8]},
+            {"rowFields": ["city"], "rowValues": [""], "columnFields": [], "columnValues": []},
+            {"rowFields": ["year"], "rowValues": ["2022"], "columnFields": ["amount"], "columnValues": ["12"]},
+        ]
+        for cell in cells:
+            payload = {"cell": cell, "detailFields": ["id"]}
+            expected, _ = build_details(records, snapshot, filters, payload, limit=5000)
+            actual, _ = build_details(records, snapshot, filters, payload, limit=5000, index=index)
+            self.assertEqual(actual, expected)
+            self.assertGreater(actual["total"], 0)
+        self.assertEqual(index.stats()["cells"], ["amount", "city|year"])
+        # ограничение не по префиксу измерения строк идёт через инвертированный индекс поля
+        self.assertEqual(index.stats()["fields"], ["year"])
+
+    def test_option_pages_follow_cascade_and_match_full_options(self) -> None:
+        records = [
+            {"name": f"item{idx:03d}", "group": "even" if idx % 2 == 0 else "odd"} for idx in range(300)
+        ] + [{"name": None, "group": "even"}]
+        snapshot = {"pivot": {"filters": ["name", "group"]}}
+        filters = {
+            "globalFilters": {"group": {"values": ["even"]}, "name": {"values": ["item004"]}},
+            "containerFilters": {},
+        }
+        options, _, _, _, _ = collect_filter_options(records, snapshot, filters, max_unique=0)
+
+        for index in (None, RecordIndex(records, 0)):
+            collected = []
+            cursor = 0
+            while cursor is not None:
+                page = collect_filter_option_page(
+                    records, snapshot, filters, "name", cursor=cursor, limit=40, index=index
+                )
+                collected.extend(page["options"])
+                cursor = page["nextCursor"]
+            self.assertEqual(collected, options["name"])
+            self.assertEqual(len(collected), 151)
+
+            found = collect_filter_option_page(records, snapshot, filters, "name", query="ITEM01", index=index)
+            self.assertEqual([option["value"] for option in found["options"]], [f"item{idx:03d}" for idx in range(10, 20, 2)])
+            found = collect_filter_option_page(
+                records, snapshot, filters, "name", query="99", match="contains", index=index
+            )
+            self.assertEqual(found["options"], [])
+            # по group каскад учитывает только фильтр name
+            groups = collect_filter_option_page(records, snapshot, filters, "group", index=index)
+            self.assertEqual(groups["options"], [{"value": "even", "count": 1}])
+        self.assertEqual(index.stats()["dictionaries"], ["group", "name"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+
+from app.services.stage_executor import run_stage, shutdown_stage_executors
+
+
+def _worker_identity() -> tuple:
+    return os.getpid(), threading.get_ident()
+
+
+def _busy(seconds: float) -> str:
+    time.sleep(seconds)
+    return "done"
+
+
+class StageExecutorTests(unittest.TestCase):
+    def setUp(self) -> None:
+        keys = ("REPORT_STAGE_EXECUTOR", "REPORT_LOOP_BLOCK_WARN_MS", "REPORT_STAGE_PROCESS_MAX_RECORDS")
+        self._env = {key: os.environ.get(key) for key in keys}
+
+    def tearDown(self) -> None:
+        for key, value in self._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutdown_stage_executors()
+
+    def test_inline_stage_over_threshold_is_logged(self) -> None:
+        os.environ["REPORT_STAGE_EXECUTOR"] = "inline"
+        os.environ["REPORT_LOOP_BLOCK_WARN_MS"] = "10"
+        with self.assertLogs("app.services.stage_executor", level="WARNING") as logs:
+            result = asyncio.run(run_stage("collect_filter_options", _busy, 0.05))
+        self.assertEqual(result, "done")
+        self.assertEqual(logs.records[0].getMessage(), "report.stage.loop_blocked")
+        self.assertEqual(logs.records[0].stage, "collect_filter_options")
+
+    def test_thread_stage_keeps_loop_responsive(self) -> None:
+        os.environ["REPORT_STAGE_EXECUTOR"] = "thread"
+
+        async def scenario() -> tuple:
+            ticks = 0
+
+            async def heartbeat() -> None:
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.005)
+                    ticks += 1
+
+            task = asyncio.create_task(heartbeat())
+            identity = await run_stage("apply_filters", _worker_identity)
+            await run_stage("apply_filters", _busy, 0.1)
+            task.cancel()
+            return identity, ticks
+
+        (pid, thread_id), ticks = asyncio.run(scenario())
+        self.assertEqual(pid, os.getpid())
+        self.assertNotEqual(thread_id, threading.get_ident())
+        self.assertGreater(ticks, 5)
+
+    def test_process_pool_only_for_pure_stages(self) -> None:
+        os.environ["REPORT_STAGE_EXECUTOR"] = "process"
+
+        async def scenario() -> tuple:
+            pure = await run_stage("build_details", _worker_identity, pure=True)
+            mutating = await run_stage("computed_fields", _worker_identity)
+            return pure, mutating
+
+        (pure_pid, _), (mutating_pid, _) = asyncio.run(scenario())
+        self.assertNotEqual(pure_pid, os.getpid())
+        self.assertEqual(mutating_pid, os.getpid())
+
+
+    def test_thread_stage_holding_gil_is_logged(self) -> None:
+        os.environ["REPORT_STAGE_EXECUTOR"] = "thread"
+        os.environ["REPORT_LOOP_BLOCK_WARN_MS"] = "10"
+
+        def hold_gil() -> str:
+            # один вызов C-функции не отпускает GIL, loop ждёт его завершения
+            sum(range(30_000_000))
+            return "done"
+
+        with self.assertLogs("app.services.stage_executor", level="WARNING") as logs:
+            result = asyncio.run(run_stage("build_view", hold_gil))
+        self.assertEqual(result, "done")
+        self.assertEqual(logs.records[0].getMessage(), "report.stage.loop_blocked")
+        self.assertEqual(logs.records[0].stage, "build_view")
+
+    def test_process_pool_skips_inputs_over_size_limit(self) -> None:
+        os.environ["REPORT_STAGE_EXECUTOR"] = "process"
+        os.environ["REPORT_STAGE_PROCESS_MAX_RECORDS"] = "100"
+
+        async def scenario() -> tuple:
+            small = await run_stage("apply_filters", _worker_identity, pure=True, input_size=100)
+            large = await run_stage("apply_filters", _worker_identity, pure=True, input_size=101)
+            return small, large
+
+        (small_pid, _), (large_pid, _) = asyncio.run(scenario())
+        self.assertNotEqual(small_pid, os.getpid())
+        self.assertEqual(large_pid, os.getpid())
+
+
+if __name__ == "__main__":
+    unittest.main()
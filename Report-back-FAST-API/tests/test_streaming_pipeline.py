@@ -0,0 +1,294 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from app.services.computed_fields import ComputedFieldsEngine
+from app.services.detail_service import DetailsCollector, build_details
+from app.services.export_service import CsvExportWriter, XlsxExportWriter, _csv_text_value
+from app.services.filter_service import RecordFilter, apply_filters
+from app.models.view_request import ViewRequest
+from app.services.join_service import PreparedJoinLookup, apply_prepared_join_lookups
+from app.services.report_view_builder import stream_details_export
+from app.services.streaming_pipeline import FusedRecordPipeline, StopChunks, drive_chunks
+
+
+JOIN = {"id": "join-1", "primaryKey": "obj", "foreignKey": "id", "joinType": "left"}
+LOOKUP = {1: [{"name": "A"}], 2: [{"name": "B1"}, {"name": "B2"}]}
+SNAPSHOT = {"pivot": {"rows": ["name"], "columns": [], "filters": ["name"]}, "metrics": []}
+FILTERS = {"globalFilters": {"name": {"values": ["A", "B2"]}}, "containerFilters": {}}
+
+
+def _records() -> list:
+    return [{"obj": 1, "qty": 2}, {"obj": 2, "qty": 3}, {"obj": 3, "qty": 4}, {"obj": 2, "qty": 5}]
+
+
+def _engine() -> ComputedFieldsEngine:
+    return ComputedFieldsEngine([{"fieldKey": "double", "expression": "{{qty}} * 2", "resultType": "number"}])
+
+
+class FusedRecordPipelineTests(unittest.TestCase):
+    def test_matches_staged_pipeline(self) -> None:
+        prepared = [PreparedJoinLookup(join=JOIN, lookup=LOOKUP, target_source_id="names")]
+
+        staged_records = _records()
+        _engine().apply(staged_records)
+        joined, join_debug = apply_prepared_join_lookups(staged_records, prepared)
+        expected, expected_filter_debug = apply_filters(joined, SNAPSHOT, FILTERS)
+
+        fused_join_debug = {
+            "joinsApplied": [{"joinId": "join-1", "baseBefore": 0, "baseAfter": 0, "matchedRows": 0}],
+            "sampleKeys": {"beforeJoin": [], "afterJoin": []},
+        }
+        pipeline = FusedRecordPipeline(
+            computed_engine=_engine(),
+            prepared_joins=prepared,
+            record_filter=RecordFilter(SNAPSHOT, FILTERS),
+            join_debug=fused_join_debug,
+        )
+        records = _records()
+        actual = list(pipeline.iter_chunk(records[:2])) + list(pipeline.iter_chunk(records[2:]))
+
+        self.assertEqual(actual, expected)
+        self.assertEqual([record["double"] for record in actual], [4.0, 6.0, 10.0])
+        self.assertEqual(pipeline.total_joined, len(joined))
+        self.assertEqual(pipeline.filter_debug(), expected_filter_debug)
+        self.assertEqual(fused_join_debug["sampleKeys"], join_debug["sampleKeys"])
+        applied = join_debug["joinsApplied"][0]
+        fused = fused_join_debug["joinsApplied"][0]
+        for key in ("baseBefore", "baseAfter", "matchedRows"):
+            self.assertEqual(fused[key], applied[key], key)
+
+    def test_chunk_join_limit(self) -> None:
+        prepared = [PreparedJoinLookup(join=JOIN, lookup=LOOKUP, target_source_id="names")]
+        pipeline = FusedRecordPipeline(
+            computed_engine=None,
+            prepared_joins=prepared,
+            record_filter=RecordFilter(SNAPSHOT, None),
+            join_debug={
+                "joinsApplied": [{"joinId": "join-1", "baseBefore": 0, "baseAfter": 0, "matchedRows": 0}],
+                "sampleKeys": {"beforeJoin": [], "afterJoin": []},
+            },
+            max_records=4,
+        )
+        with self.assertRaises(ValueError):
+            list(pipeline.iter_chunk(_records()))
+
+    def test_chunk_join_limit_checked_before_yield(self) -> None:
+        prepared = [PreparedJoinLookup(join=JOIN, lookup=LOOKUP, target_source_id="names")]
+        pipeline = FusedRecordPipeline(
+            computed_engine=None,
+            prepared_joins=prepared,
+            record_filter=RecordFilter(SNAPSHOT, None),
+            join_debug={
+                "joinsApplied": [{"joinId": "join-1", "baseBefore": 0, "baseAfter": 0, "matchedRows": 0}],
+                "sampleKeys": {"beforeJoin": [], "afterJoin": []},
+            },
+            max_records=4,
+        )
+        yielded = []
+        # 1 + 2 + 1 строки укладываются в лимит, последняя запись даёт ещё 2 — ошибка до их отдачи
+        with self.assertRaisesRegex(ValueError, "Records limit exceeded: 6 > 4"):
+            for row in pipeline.iter_chunk(_records()):
+                yielded.append(row)
+        self.assertEqual(len(yielded), 4)
+
+
+async def _chunks(count: int, consumed: list):
+    for idx in range(count):
+        consumed.append(idx)
+        yield [idx]
+
+
+class DriveChunksTests(unittest.TestCase):
+    def test_worker_processes_chunks_in_order(self) -> None:
+        for queue_size in (0, 2):
+            processed: list = []
+            threads: set = set()
+
+            def process(chunk: list) -> None:
+                threads.add(threading.get_ident())
+                processed.extend(chunk)
+
+            asyncio.run(drive_chunks(_chunks(10, []), process, queue_size=queue_size))
+            self.assertEqual(processed, list(range(10)), queue_size)
+            self.assertEqual(threading.get_ident() in threads, queue_size == 0)
+
+    def test_worker_error_stops_producer(self) -> None:
+        consumed: list = []
+
+        def process(chunk: list) -> None:
+            if chunk == [3]:
+                raise ValueError("Records limit exceeded")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(drive_chunks(_chunks(100, consumed), process, queue_size=2))
+        self.assertLess(len(consumed), 100)
+
+    def test_stop_chunks_ends_reading_without_error(self) -> None:
+        for queue_size in (0, 2):
+            consumed: list = []
+
+            def process(chunk: list) -> None:
+                if chunk == [3]:
+                    raise StopChunks()
+
+            asyncio.run(drive_chunks(_chunks(100, consumed), process, queue_size=queue_size))
+            self.assertLess(len(consumed), 100, queue_size)
+
+
+class DetailsCollectorTests(unittest.TestCase):
+    def _collect(self, total_mode: str, limit: int, offset: int = 0) -> tuple:
+        records = [{"city": "A" if idx % 4 else "B", "amount": idx} for idx in range(400)]
+        payload = {"cell": {"rowFields": ["city"], "rowValues": ["A"]}, "detailFields": ["city", "amount"]}
+        collector = DetailsCollector(SNAPSHOT, payload, limit=limit, offset=offset, total_mode=total_mode, total_cap=50)
+        read = 0
+
+        def counted(chunk: list):
+            nonlocal read
+            for record in chunk:
+                read += 1
+                yield record
+
+        try:
+            for start in range(0, len(records), 100):
+                collector.update(counted(records[start : start + 100]))
+        except StopChunks:
+            pass
+        expected, _ = build_details(records, SNAPSHOT, None, payload, limit=limit, offset=offset)
+        return collector.result(read, len(records), records_total=len(records)), expected, read
+
+    def test_exact_matches_in_memory_details(self) -> None:
+        result, expected, read = self._collect("exact", limit=20, offset=290)
+        self.assertEqual(result, expected)
+        self.assertEqual(read, 400)
+        self.assertEqual(result["total"], 300)
+
+    def test_estimate_and_capped_stop_early(self) -> None:
+        result, expected, read = self._collect("estimate", limit=10, offset=5)
+        self.assertEqual(read, 22)
+        self.assertEqual(result["entries"], expected["entries"])
+        self.assertEqual((result["totalMode"], result["hasMore"]), ("estimated", True))
+        self.assertEqual(result["total"], 291)
+
+        result, expected, read = self._collect("capped", limit=10)
+        self.assertEqual(read, 68)
+        self.assertEqual(result["entries"], expected["entries"])
+        self.assertEqual((result["total"], result["totalMode"]), (50, "capped"))
+
+    def test_estimate_without_source_size_is_lower_bound(self) -> None:
+        records = [{"city": "A" if idx % 4 else "B", "amount": idx} for idx in range(400)]
+        payload = {"cell": {"rowFields": ["city"], "rowValues": ["A"]}, "detailFields": ["city", "amount"]}
+        collector = DetailsCollector(SNAPSHOT, payload, limit=10, total_mode="estimate")
+        with self.assertRaises(StopChunks):
+            collector.update(records[:100])
+        # с постраничным upstream получена только первая страница: оценка по ней — нижняя граница
+        result = collector.result(14, 100)
+        self.assertEqual((result["totalMode"], result["total"]), ("lowerBound", 79))
+        result = collector.result(14, 100, records_total=400)
+        self.assertEqual((result["totalMode"], result["total"]), ("estimated", 314))
+
+    def test_sorted_keyset_pages_match_full_sort(self) -> None:
+        records = [
+            {"id": idx, "amount": None if idx % 7 == 0 else (idx * 37) % 50, "day": f"{idx % 28 + 1:02d}.03.2024"}
+            for idx in range(600)
+        ]
+        payload = {"detailFields": ["id", "amount"], "sort": [{"field": "amount", "direction": "desc"}, "day"]}
+        expected_ids = [
+            record["id"]
+            for record in sorted(
+                records,
+                key=lambda record: (record["amount"] is None, -(record["amount"] or 0), record["id"] % 28, record["id"]),
+            )
+        ]
+        ids, cursor = [], None
+        while True:
+            page_payload = {**payload, "cursor": cursor} if cursor else payload
+            response, _ = build_details(records, SNAPSHOT, None, page_payload, limit=90)
+            collector = DetailsCollector(SNAPSHOT, page_payload, limit=90, total_mode="estimate")
+            for start in range(0, len(records), 64):
+                collector.update(records[start : start + 64])
+            self.assertEqual(collector.result(600, 600), response)
+            ids.extend(entry["id"] for entry in response["entries"])
+            cursor = response["nextCursor"]
+            if cursor is None:
+                break
+        self.assertEqual(ids, expected_ids)
+        self.assertEqual([item["type"] for item in response["sort"]], ["number", "date"])
+
+        with self.assertRaises(ValueError):
+            build_details(records, SNAPSHOT, None, {"sort": "amount", "cursor": "broken"})
+
+    def test_desc_sort_keeps_unconvertible_values_after_numbers(self) -> None:
+        records = [{"id": idx, "amount": value} for idx, value in enumerate([5, "n/a", None, 12, "x", 7.5, ""])]
+        payload = {"detailFields": ["id", "amount"], "sort": [{"field": "amount", "direction": "desc"}]}
+        field_meta = {"amount": {"type": "number"}}
+        snapshot = {**SNAPSHOT, "fieldMeta": field_meta}
+        response, _ = build_details(records, snapshot, None, payload, limit=10)
+
+        # числа по убыванию, затем неприводимые к числу (по убыванию), пустые — в конце
+        self.assertEqual([entry["id"] for entry in response["entries"]], [3, 5, 0, 4, 1, 2, 6])
+
+        collector = DetailsCollector(snapshot, payload, limit=3, total_mode="exact")
+        collector.update(records)
+        first = collector.result(len(records), len(records))
+        self.assertEqual([entry["id"] for entry in first["entries"]], [3, 5, 0])
+        collector = DetailsCollector(snapshot, {**payload, "cursor": first["nextCursor"]}, limit=3, total_mode="exact")
+        collector.update(records)
+        self.assertEqual([entry["id"] for entry in collector.result(len(records), len(records))["entries"]], [4, 1, 2])
+
+
+class DetailsExportTests(unittest.TestCase):
+    def test_xlsx_cap_stops_reading_upstream(self) -> None:
+        pulled: list = []
+
+        async def chunks(*args, **kwargs):
+            for idx in range(10):
+                pulled.append(idx)
+                yield [{"name": "A", "qty": idx * 10 + offset} for offset in range(10)]
+
+        payload = {
+            "templateId": "test-template",
+            "remoteSource": {"url": "https://example.com/report", "method": "POST", "body": {}},
+            "snapshot": SNAPSHOT,
+            "filters": {"globalFilters": {}, "containerFilters": {}},
+            "detailFields": ["name", "qty"],
+        }
+
+        async def export() -> bytes:
+            parts = [part async for part in stream_details_export(ViewRequest(**payload), payload, "xlsx")]
+            return b"".join(parts)
+
+        with patch("app.services.report_view_builder.async_iter_records", new=chunks), patch(
+            "app.services.report_view_builder.prepare_joins_streaming", new=AsyncMock(return_value=[])
+        ), patch("app.services.export_service.XLSX_MAX_ROWS", 16):
+            data = asyncio.run(export())
+
+        # заголовок и 15 строк заполняют лист во втором чанке, третий уже не читается
+        self.assertEqual(pulled, [0, 1])
+        self.assertTrue(data.startswith(b"PK"))
+
+    def test_csv_escapes_formula_like_text(self) -> None:
+        self.assertEqual(_csv_text_value("=HYPERLINK(\"x\")"), "'=HYPERLINK(\"x\")")
+        self.assertEqual(_csv_text_value("+7 999"), "'+7 999")
+        self.assertEqual(_csv_text_value("@SUM(A1)"), "'@SUM(A1)")
+        self.assertEqual(_csv_text_value("-cmd"), "'-cmd")
+        # числа (и числа строкой) остаются как есть
+        self.assertEqual(_csv_text_value("-5"), "-5")
+        self.assertEqual(_csv_text_value(-5), "-5")
+        self.assertEqual(_csv_text_value(None), "")
+        self.assertEqual(_csv_text_value("plain"), "plain")
+
+        writer = CsvExportWriter()
+        data = writer.header(["=label"]) + writer.write_rows([["=1+1", -2, "ok"]])
+        self.assertEqual(data.decode("utf-8-sig").splitlines(), ["'=label", "'=1+1,-2,ok"])
+
+    def test_xlsx_writes_formula_like_text_as_inline_string(self) -> None:
+        self.assertEqual(
+            XlsxExportWriter._cell("=1+1"),
+            '<c t="inlineStr"><is><t xml:space="preserve">=1+1</t></is></c>',
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
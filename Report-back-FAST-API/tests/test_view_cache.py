@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+import unittest
+
+from app.services import view_cache
+
+
+def _entry(rows: int) -> dict:
+    return {
+        "view": {
+            "columns": [{"key": "value__sum"}],
+            "rows": [
+                {"key": f"r{idx}", "label": f"row {idx}", "values": [idx], "cells": [{"value": idx}]}
+                for idx in range(rows)
+            ],
+        }
+    }
+
+
+class ViewCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        keys = ("REDIS_URL", "REPORT_VIEW_CACHE_MAX_BYTES", "REPORT_VIEW_CACHE_MAX_ENTRY_BYTES")
+        self._env = {key: os.environ.get(key) for key in keys}
+        for key in keys:
+            os.environ.pop(key, None)
+        view_cache.clear_view_cache()
+
+    def tearDown(self) -> None:
+        for key, value in self._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        view_cache.clear_view_cache()
+
+    def test_estimate_tracks_json_size(self) -> None:
+        entry = _entry(1000)
+        actual = len(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        self.assertAlmostEqual(view_cache.estimate_entry_nbytes(entry), actual, delta=actual * 0.1)
+
+    def test_byte_budget_evicts_oldest_and_skips_oversized_entries(self) -> None:
+        entry = _entry(100)
+        nbytes = view_cache.estimate_entry_nbytes(entry)
+        os.environ["REPORT_VIEW_CACHE_MAX_BYTES"] = str(nbytes * 2)
+
+        first = asyncio.run(view_cache.store_view(entry))
+        second = asyncio.run(view_cache.store_view(entry))
+        third = asyncio.run(view_cache.store_view(entry))
+        self.assertEqual(view_cache.view_cache_stats(), {"entries": 2, "bytes": nbytes * 2})
+        self.assertIsNone(asyncio.run(view_cache.get_view(first)))
+        self.assertEqual(asyncio.run(view_cache.get_view(second)), entry)
+        self.assertEqual(asyncio.run(view_cache.get_view(third)), entry)
+
+        os.environ["REPORT_VIEW_CACHE_MAX_ENTRY_BYTES"] = str(nbytes // 2)
+        self.assertIsNone(asyncio.run(view_cache.store_view(entry)))
+        self.assertEqual(view_cache.view_cache_stats()["entries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
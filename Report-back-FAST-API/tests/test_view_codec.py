@@ -0,0 +1,61 @@
+import unittest
+
+from app.services.pivot_core import build_pivot_view
+from app.services.view_codec import (
+    decode_compact_view,
+    encode_compact_view,
+    msgpack_available,
+    encode_msgpack,
+    resolve_view_format,
+)
+
+
+RECORDS = [
+    {"cls": "A", "year": 2023, "value": 10},
+    {"cls": "A", "year": 2024, "value": 5},
+    {"cls": "B", "year": 2024, "value": 20},
+    {"cls": "C", "year": 2022, "value": 1},
+]
+
+SNAPSHOT = {
+    "pivot": {"rows": ["cls"], "columns": ["year"], "filters": []},
+    "metrics": [
+        {"key": "value__sum", "sourceKey": "value", "op": "sum"},
+        {"key": "value__count", "sourceKey": "value", "op": "count"},
+    ],
+}
+
+
+class ViewCodecTests(unittest.TestCase):
+    def test_dense_and_sparse_roundtrip(self) -> None:
+        view = build_pivot_view(RECORDS, SNAPSHOT)
+        for layout in ("dense", "sparse"):
+            compact = encode_compact_view(view, layout)
+            self.assertEqual(compact["cells"]["layout"], layout)
+            self.assertNotIn("cells", compact["rows"][0])
+            self.assertEqual(decode_compact_view(compact), view)
+
+    def test_auto_layout_prefers_sparse_for_mostly_empty_views(self) -> None:
+        view = build_pivot_view(RECORDS, SNAPSHOT)
+        compact = encode_compact_view(view)
+        self.assertEqual(compact["cells"]["layout"], "sparse")
+        self.assertEqual(len(compact["cells"]["values"]), 8)
+        self.assertEqual(compact["columns"][0]["baseKey"] + "::" + compact["columns"][0]["metricKey"], view["columns"][0]["key"])
+
+    def test_resolve_view_format(self) -> None:
+        self.assertEqual(resolve_view_format(None, "application/json"), "default")
+        self.assertEqual(resolve_view_format(None, "application/vnd.report.pivot+json"), "compact")
+        self.assertEqual(resolve_view_format("msgpack", "application/json"), "msgpack")
+        with self.assertRaises(ValueError):
+            resolve_view_format("xml", None)
+
+    @unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+    def test_msgpack_encoding(self) -> None:
+        import msgpack
+
+        compact = encode_compact_view(build_pivot_view(RECORDS, SNAPSHOT))
+        self.assertEqual(msgpack.unpackb(encode_msgpack(compact), raw=False), compact)
+
+
+if __name__ == "__main__":
+    unittest.main()